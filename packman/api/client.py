@@ -0,0 +1,103 @@
+from threading import Lock
+from typing import Any, Dict
+from urllib import parse as urlparse
+
+import requests
+from loguru import logger
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Responses worth retrying as they are usually transient
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPConfig(BaseModel):
+    # Maximum number of keep-alive connections to hold open to each host
+    pool_maxsize: int = 16
+    connect_timeout: float = 10
+    read_timeout: float = 30
+    # Number of times a failed connection or transient error response is retried
+    retries: int = 3
+    # Retries wait backoff_factor * 2 ^ (retry number - 1) seconds, or as long as the server asks via Retry-After
+    backoff_factor: float = 0.5
+    # Whether to persist API responses between runs, revalidating them with the server once stale
+    cache: bool = True
+
+
+_config = HTTPConfig()
+_sessions: Dict[str, requests.Session] = {}
+_lock = Lock()
+
+
+def configure(config: HTTPConfig) -> None:
+    """
+    Sets the configuration used by all HTTP requests made from now on, closing any existing connections.
+    """
+    global _config
+    with _lock:
+        _config = config
+    close()
+
+
+def _create_session() -> requests.Session:
+    retry = Retry(
+        total=_config.retries,
+        backoff_factor=_config.backoff_factor,
+        status_forcelist=_RETRY_STATUSES,
+        allowed_methods={"GET", "HEAD"},
+        # Let the caller see the final error response rather than a MaxRetryError
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=_config.pool_maxsize, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the shared session for the host of the given URL, which keeps connections to it alive between requests.
+
+    Sessions are shared by all threads.
+    """
+    parsed_url = urlparse.urlparse(url)
+    key = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            logger.debug(f"creating HTTP session for {key}")
+            session = _sessions[key] = _create_session()
+        return session
+
+
+def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    Makes a request through the shared session for the URL's host, using the configured timeouts unless a timeout is
+    given.
+    """
+    if kwargs.get("timeout") is None:
+        kwargs["timeout"] = (_config.connect_timeout, _config.read_timeout)
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def head(url: str, **kwargs: Any) -> requests.Response:
+    return request("HEAD", url, **kwargs)
+
+
+def close() -> None:
+    """
+    Closes all shared sessions and their connections.
+    """
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -1,26 +1,127 @@
+import hashlib
+import json
+import time
 from abc import ABC
+from datetime import timedelta
 from typing import Any, Dict, Optional
 from urllib import parse as urlparse
 
 import requests
+from loguru import logger
+from packman.api import client, metadata_cache
+from packman.api.metadata_cache import CacheEntry, MetadataCache
+from packman.utils.concurrency import SingleFlight
+
+_in_flight: SingleFlight[str, Any] = SingleFlight()
+
+# Statuses which mean the resource does not exist, as opposed to a failure worth retrying
+_NEGATIVE_STATUSES = {404, 410}
 
 
 class HTTPAPI(ABC):
-    def __init__(self, url: str, cache: Optional[Dict[str, Any]] = None) -> None:
+    # How long a response may be used before it is revalidated with the server
+    default_ttl = timedelta(minutes=5)
+    # How long a not found response may be used before the resource is looked up again
+    negative_ttl = timedelta(minutes=10)
+
+    def __init__(self, url: str, cache: Optional[MetadataCache] = None) -> None:
+        """
+        :param cache: Cache to store responses in; if None, the process-wide metadata cache is used.
+        """
         self.url = url
         self.headers = {}
-        self.cache = cache or {}
+        self._cache = cache
+
+    @property
+    def cache(self) -> MetadataCache:
+        return self._cache or metadata_cache.get_cache()
 
     def uri(self, endpoint: str) -> str:
         return urlparse.urljoin(self.url, endpoint)
 
-    def get(self, endpoint: str, use_cache: bool = False, **kwargs: Any) -> Any:
-        cache_key = f"get:{endpoint}?{urlparse.urlencode(kwargs)}"
-        if use_cache and cache_key in self.cache:
-            return self.cache[cache_key]
+    def _cache_key(self, url: str, params: Dict[str, Any]) -> str:
+        """
+        Returns the key responses to a request are cached and shared under, which covers this instance's headers, as
+        responses may differ with credentials or the representation accepted.
+        """
+        key = f"{url}?{urlparse.urlencode(sorted(params.items()))}"
+        if self.headers:
+            # Hashed so that credentials are not kept in the cache
+            headers = sorted(
+                (name.lower(), value) for name, value in self.headers.items()
+            )
+            key += f"#{hashlib.md5(bytes(json.dumps(headers), 'utf-8')).hexdigest()}"
+        return key
+
+    def get(self, endpoint: str, ttl: Optional[timedelta] = None, **kwargs: Any) -> Any:
+        """
+        Returns the decoded JSON response to a GET request to the given endpoint, with kwargs as query parameters.
+
+        Responses are cached. Cached responses younger than ttl are used as-is; older ones are revalidated with a
+        conditional request, and used if the server is unreachable.
+
+        :param ttl: How long a response may be used without revalidating it; defaults to default_ttl.
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        url = self.uri(endpoint)
+        params = {key: value for key, value in kwargs.items() if value is not None}
+        cache_key = self._cache_key(url, params)
+        cache = self.cache
+
+        entry = cache.get(cache_key)
+        if entry is not None and not cache.refresh:
+            if entry.status != 200 and entry.is_fresh(self.negative_ttl):
+                raise requests.HTTPError(f"{entry.status} (cached) for url: {url}")
+            if entry.status == 200 and entry.is_fresh(ttl):
+                return entry.body
+
+        # Identical requests made concurrently, such as by packages sharing a source, share a single round trip
+        return _in_flight.do(
+            cache_key, lambda: self._request(url, params, cache_key, entry)
+        )
+
+    def _request(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        cache_key: str,
+        entry: Optional[CacheEntry],
+    ) -> Any:
+        cache = self.cache
+        headers = dict(self.headers)
+        if entry is not None and entry.status == 200:
+            if entry.etag is not None:
+                headers["if-none-match"] = entry.etag
+            if entry.last_modified is not None:
+                headers["if-modified-since"] = entry.last_modified
+
+        try:
+            res = client.get(url, headers=headers, params=params)
+        except requests.RequestException as exc:
+            if entry is None or entry.status != 200:
+                raise
+            logger.warning(f"using stale response for {url}: {exc}")
+            return entry.body
+
+        if res.status_code == 304 and entry is not None:
+            logger.debug(f"cached response still valid for {url}")
+            entry.touch()
+            cache.put(cache_key, entry)
+            return entry.body
 
-        res = requests.get(url=self.uri(endpoint), headers=self.headers, params=kwargs)
+        if res.status_code in _NEGATIVE_STATUSES:
+            cache.put(cache_key, CacheEntry(status=res.status_code, stored=time.time()))
         res.raise_for_status()
         res_json = res.json()
-        self.cache[cache_key] = res_json
+        cache.put(
+            cache_key,
+            CacheEntry(
+                status=res.status_code,
+                stored=time.time(),
+                etag=res.headers.get("etag"),
+                last_modified=res.headers.get("last-modified"),
+                body=res_json,
+            ),
+        )
         return res_json
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+from threading import Lock
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from loguru import logger
+from pydantic import BaseModel
+
+# For responses which never change, such as those for an immutable tag
+FOREVER = timedelta.max
+
+
+class CacheEntry(BaseModel):
+    """
+    A cached response to a metadata request.
+
+    Responses with an error status are cached too, so that repeatedly looking up something which does not exist does
+    not repeatedly hit the server.
+    """
+
+    status: int
+    # Unix time at which the response was last known to be current
+    stored: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body: Any = None
+
+    def is_fresh(self, ttl: timedelta) -> bool:
+        if ttl == FOREVER:
+            return True
+        return time.time() - self.stored < ttl.total_seconds()
+
+    def touch(self) -> None:
+        self.stored = time.time()
+
+
+class MetadataCache:
+    """
+    A cache of metadata responses keyed by request URL and parameters, persisted under path so that it outlives the
+    process; if path is None, it is kept in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None, refresh: bool = False) -> None:
+        """
+        :param refresh: If True, cached responses are always revalidated with the server however fresh they are.
+        """
+        self.path = path
+        self.refresh = refresh
+        self._entries: Dict[str, CacheEntry] = {}
+        self._lock = Lock()
+
+    def _get_path(self, key: str) -> str:
+        assert self.path is not None, "memory-only caches have no files"
+        key_sha256 = hashlib.sha256(bytes(key, "utf-8")).hexdigest()
+        return os.path.join(self.path, f"{key_sha256}.json")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None or self.path is None:
+            return entry
+        try:
+            with open(self._get_path(key), "r") as fp:
+                raw = json.load(fp)
+            if raw.pop("key", None) != key:
+                return None
+            entry = CacheEntry(**raw)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"ignoring unreadable cache entry for {key}: {exc}")
+            return None
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+        if self.path is None:
+            return
+        path = self._get_path(key)
+        tmp_path = f"{path}.{uuid4()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp_path, "w") as fp:
+                json.dump({"key": key, **entry.dict()}, fp)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            # The cache is only an optimisation, so failing to write it should not fail the request
+            logger.warning(f"failed to write cache entry for {key}: {exc}")
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+_cache = MetadataCache()
+
+
+def configure(path: Optional[str], refresh: bool = False) -> None:
+    """
+    Sets the cache used by all metadata requests made from now on.
+
+    :param path: Directory in which to persist cached responses; if None, responses are cached in memory only.
+    :param refresh: If True, cached responses are always revalidated with the server however fresh they are.
+    """
+    global _cache
+    _cache = MetadataCache(path=path, refresh=refresh)
+
+
+def set_refresh(refresh: bool) -> None:
+    _cache.refresh = refresh
+
+
+def get_cache() -> MetadataCache:
+    return _cache
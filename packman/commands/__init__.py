@@ -3,8 +3,10 @@ from .command import Command
 from .exports import ExportCommand, ImportCommand
 from .installation import InstallCommand, RecoverCommand, UninstallCommand
 from .meta import (
+    CacheCommand,
     CleanCommand,
     InstalledPackageListCommand,
+    OutdatedCommand,
     PackageListCommand,
     UpdateCommand,
     ValidateCommand,
@@ -1,11 +1,14 @@
 import json
 import os
 from argparse import ArgumentParser
-from typing import Optional, Set
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
 from zipfile import ZipFile
 
 from loguru import logger
 from packman.models.manifest import Manifest
+from packman.models.package_source import PackageVersion
+from packman.utils.operation import StateFileExistsError
 from packman.utils.progress import StepProgress
 
 from .command import Command
@@ -90,14 +93,15 @@ class ExportCommand(Command):
                     for package in manifest.packages.values():
                         for file in package.files:
                             if file not in files_seen:
-                                relfile = os.path.relpath(file, root)
-                                zipfile.write(file, relfile)
+                                path = manifest.resolve(file)
+                                relfile = os.path.relpath(path, root)
+                                zipfile.write(path, relfile)
                                 files_seen.add(file)
                             on_step_progress.advance()
                     zip_manifest = manifest.deepcopy()
                     zip_manifest.original_files = {}
                     zip_manifest.orphaned_files = set()
-                    zip_manifest.update_path_root(".")
+                    zip_manifest.update_path_root(root)
                     zipfile.writestr("manifest.json", zip_manifest.json(indent=2))
                     on_step_progress.advance()
 
@@ -139,22 +143,62 @@ class ImportCommand(Command):
         if format == "json":
             with open(input_path, "r") as fp:
                 versions = json.load(fp)
-                for name, version in versions.items():
-                    version_name = get_version_name(version)
-                    step_name = f"+ {name}@{version_name}"
-                    try:
-                        if not self.packman.install_package(
-                            name=name, version=version, on_progress=on_progress
-                        ):
-                            # not_installed += 1
-                            self.output.write_step_error(step_name, "already installed")
-                        else:
-                            self.output.write_step_complete(step_name)
-                    except Exception as exc:
-                        logger.exception(exc)
-                        self.output.write_step_error(step_name, str(exc))
-                    except KeyboardInterrupt:
-                        self.output.write_step_error(step_name, "cancelled")
+            requested: List[Tuple[str, Optional[str]]] = list(versions.items())
+            resolutions = self.packman.resolve_versions(requested)
+
+            to_install: List[Tuple[str, PackageVersion]] = []
+            for name, version in requested:
+                resolution = resolutions[(name, version)]
+                if isinstance(resolution, Exception):
+                    logger.exception(resolution)
+                    self.output.write_step_error(
+                        f"+ {name}@{get_version_name(version)}", str(resolution)
+                    )
+                else:
+                    to_install.append((name, resolution))
+
+            step_name = (
+                f"+ {len(to_install)} package{'s' if len(to_install) != 1 else ''}"
+            )
+            progress: Dict[str, float] = {}
+            progress_lock = Lock()
+
+            def on_package_progress(name: str, p: float) -> None:
+                with progress_lock:
+                    progress[name] = p
+                    on_progress(sum(progress.values()) / len(to_install))
+
+            try:
+                results = self.packman.install_packages(
+                    to_install, on_progress=on_package_progress
+                )
+            except StateFileExistsError as exc:
+                logger.exception(exc)
+                self.output.write_step_error(step_name, str(exc))
+                self.output.write(
+                    "A previously interrupted operation was detected; use 'recover' to recover and roll it back."
+                )
+                return
+            except Exception as exc:
+                logger.exception(exc)
+                self.output.write_step_error(step_name, str(exc))
+                return
+            except KeyboardInterrupt:
+                self.output.write_step_error(step_name, "cancelled")
+                return
+            self.output.write_step_complete(step_name)
+
+            for name, version in requested:
+                if name not in results:
+                    continue
+                result = results[name]
+                step_name = f"+ {name}@{get_version_name(version)}"
+                if isinstance(result, Exception):
+                    self.output.write_step_error(step_name, str(result))
+                elif not result:
+                    self.output.write_step_error(step_name, "already installed")
+                else:
+                    self.output.write_step_complete(step_name)
 
         elif format == "zip":
             with self.packman.create_operation() as op:
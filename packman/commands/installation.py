@@ -1,8 +1,10 @@
 from argparse import ArgumentParser
-from typing import List, Optional
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
 
 from loguru import logger
 from packman.commands.util import get_version_name
+from packman.models.package_source import PackageVersion
 from packman.utils.operation import StateFileExistsError
 
 from .command import Command
@@ -46,51 +48,70 @@ class InstallCommand(Command):
                 return
             packages = list(manifest.packages.keys())
 
-        output = self.output
-        output.step_count = len(packages)
-        not_installed = 0
+        requested: List[Tuple[str, Optional[str]]] = []
         for package in packages:
             at_idx = package.find("@")
             if at_idx == -1:
-                name = package
-                version_info = self.packman.get_latest_version_info(name)
-                version = version_info.version
+                requested.append((package, None))
             else:
                 name, version = package.split("@")
+                requested.append((name, version))
 
-            version_name = get_version_name(version)
-            step_name = f"+ {name}@{version_name}"
-
-            def on_progress(p: float) -> None:
-                output.write_step_progress(step_name, p)
+        # Resolve everything up front so that sources are queried concurrently rather than one package at a time
+        resolutions = self.packman.resolve_versions(requested)
 
-            on_progress(0.0)
+        output = self.output
+        to_install: List[Tuple[str, PackageVersion]] = []
+        step_names: Dict[str, str] = {}
+        for name, version in requested:
+            resolution = resolutions[(name, version)]
+            if isinstance(resolution, Exception):
+                logger.exception(resolution)
+                output.write_step_error(f"+ {name}@{get_version_name(version)}", str(resolution))
+                continue
+            to_install.append((name, resolution))
+            step_names[name] = f"+ {name}@{get_version_name(resolution.version)}"
+
+        # Packages are installed concurrently, so progress is reported for all of them together
+        step_name = f"+ {len(to_install)} package{'s' if len(to_install) != 1 else ''}"
+        progress: Dict[str, float] = {}
+        progress_lock = Lock()
+
+        def on_progress(name: str, p: float) -> None:
+            with progress_lock:
+                progress[name] = p
+                output.write_step_progress(step_name, sum(progress.values()) / len(to_install))
 
+        not_installed = 0
+        if to_install:
             try:
-                if not self.packman.install_package(
-                    name=name,
-                    version=version,
-                    force=force,
-                    no_cache=no_cache,
-                    on_progress=on_progress,
-                ):
-                    not_installed += 1
-                    output.write_step_error(step_name, "already installed")
-                else:
-                    output.write_step_complete(step_name)
+                results = self.packman.install_packages(
+                    to_install, force=force, no_cache=no_cache, on_progress=on_progress
+                )
             except StateFileExistsError as exc:
                 logger.exception(exc)
                 output.write_step_error(step_name, str(exc))
                 output.write(
                     "A previously interrupted operation was detected; use 'recover' to recover and roll it back."
                 )
-                break
+                return
             except Exception as exc:
                 logger.exception(exc)
                 output.write_step_error(step_name, str(exc))
+                return
             except KeyboardInterrupt as exc:
-                self.output.write_step_error(step_name, "cancelled")
+                output.write_step_error(step_name, "cancelled")
                 raise exc from None
+            output.write_step_complete(step_name)
+
+            for name, result in results.items():
+                if isinstance(result, Exception):
+                    output.write_step_error(step_names[name], str(result))
+                elif not result:
+                    not_installed += 1
+                    output.write_step_error(step_names[name], "already installed")
+                else:
+                    output.write_step_complete(step_names[name])
 
         if not_installed == 1:
             output.write(
@@ -6,7 +6,7 @@ from argparse import ArgumentParser
 from typing import Iterable, List, Optional, Tuple
 
 from loguru import logger
-from packman.commands.util import get_version_name
+from packman.commands.util import get_size_name, get_version_name
 from packman.models.package_definition import PackageDefinition
 
 from .command import Command, ListCommand
@@ -59,6 +59,35 @@ class InstalledPackageListCommand(ListCommand):
         self.output.write_table(rows=iterable)
 
 
+class OutdatedCommand(ListCommand):
+    help = "Lists installed packages alongside the latest versions available for them"
+
+    def get_iterable(self) -> List[List[str]]:
+        manifest = self.packman.manifest
+        # Checked in a single concurrent sweep rather than one package at a time
+        resolutions = self.packman.resolve_versions(
+            (name, None) for name in manifest.packages
+        )
+        rows: List[List[str]] = []
+        for name, info in manifest.packages.items():
+            latest = resolutions[(name, None)]
+            if isinstance(latest, Exception):
+                logger.exception(latest)
+                rows.append([name, get_version_name(info.version), "?", str(latest)])
+            elif latest.version is None:
+                rows.append([name, get_version_name(info.version), "?", "unversioned"])
+            elif latest.version == info.version:
+                rows.append([name, info.version, latest.version, "up to date"])
+            else:
+                rows.append(
+                    [name, get_version_name(info.version), latest.version, "outdated"]
+                )
+        return rows
+
+    def write_iterable(self, iterable: List[List[str]]) -> None:
+        self.output.write_table(rows=iterable)
+
+
 class UpdateCommand(Command):
     help = "Updates the configuration from the configured remote source"
 
@@ -93,24 +122,92 @@ class ValidateCommand(Command):
             help="Names of the package or packages to validate; if none specified, all packages will be validated",
             nargs="*",
         )
+        parser.add_argument(
+            "--deep",
+            help="Re-hash every file, including those whose size and modification time are unchanged",
+            action="store_true",
+            dest="deep",
+        )
+        parser.add_argument(
+            "--fail-fast",
+            help="Stop at the first invalid file",
+            action="store_true",
+            dest="fail_fast",
+        )
 
-    def execute(self, packages: Optional[List[str]] = None) -> None:
-        if not packages:
-            manifest = self.packman.manifest
-            if not manifest.packages:
-                self.output.write("0 invalid files")
-                return
-            packages = list(manifest.packages.keys())
-        invalid_files: List[str] = []
-        for name in packages:
-            invalid_files += list(self.packman.validate(name=name))
-        invalid_count = len(invalid_files)
+    def execute(
+        self,
+        packages: Optional[List[str]] = None,
+        deep: bool = False,
+        fail_fast: bool = False,
+    ) -> None:
+        invalid_count = 0
+        # Written as they are found rather than once every file has been hashed
+        with self.packman.validate_packages(
+            packages or None, deep=deep, fail_fast=fail_fast
+        ) as invalid:
+            for _, file in invalid:
+                invalid_count += 1
+                self.output.write(file)
         if invalid_count == 1:
             self.output.write("1 invalid file")
         else:
             self.output.write(f"{invalid_count} invalid files")
-        for file in invalid_files:
-            self.output.write(file)
+
+
+class CacheCommand(Command):
+    help = "Shows statistics for, prunes or verifies the package cache"
+
+    def configure_parser(self, parser: ArgumentParser) -> None:
+        parser.add_argument(
+            "action",
+            help="stats to show the cache's size and hit rate; prune to evict the least recently used packages down to "
+            "the configured maximum size; verify to evict packages whose files are corrupt",
+            choices=["stats", "prune", "verify"],
+            nargs="?",
+            default="stats",
+        )
+        parser.add_argument(
+            "--max-size",
+            help="Size in bytes to prune the cache down to; defaults to the configured maximum size",
+            type=int,
+            dest="max_size",
+        )
+
+    def execute(self, action: str = "stats", max_size: Optional[int] = None) -> None:
+        if action == "prune":
+            count, freed = self.packman.prune_cache(max_size=max_size)
+            self.output.write(
+                f"evicted {count} package{'' if count == 1 else 's'}, freeing {get_size_name(freed)}"
+            )
+        elif action == "verify":
+            evicted = self.packman.verify_cache()
+            count = len(evicted)
+            self.output.write(
+                f"{count} corrupt package{'' if count == 1 else 's'} evicted"
+            )
+            for package in evicted:
+                self.output.write(package)
+        else:
+            stats = self.packman.cache_stats()
+            lookups = stats.hits + stats.misses
+            self.output.write_table(
+                [
+                    ["packages", str(stats.entry_count)],
+                    [
+                        "size",
+                        get_size_name(stats.size)
+                        if stats.max_size is None
+                        else f"{get_size_name(stats.size)} / {get_size_name(stats.max_size)}",
+                    ],
+                    ["hits", str(stats.hits)],
+                    ["misses", str(stats.misses)],
+                    [
+                        "hit rate",
+                        f"{stats.hits / lookups:.0%}" if lookups else "n/a",
+                    ],
+                ]
+            )
 
 
 class CleanCommand(Command):
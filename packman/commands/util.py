@@ -3,3 +3,12 @@ from typing import Union
 
 def get_version_name(version: Union[str, None]) -> str:
     return version if version is not None else "unknown"
+
+
+def get_size_name(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}" if unit != "B" else f"{size} B"
+        value /= 1024
+    return f"{value:.1f} TiB"
@@ -2,6 +2,7 @@ import os
 from glob import glob
 
 from packman.models.condition import BaseCondition, condition
+from packman.utils.archive import ArchiveIndex
 from pydantic import Field
 
 
@@ -13,5 +14,10 @@ class Exists(BaseCondition):
 
     package_glob: str = Field(..., alias="has-path")
 
+    supports_archive = True
+
     def evaluate(self, package_path: str, root_dir: str) -> bool:
         return any(glob(os.path.join(package_path, self.package_glob), recursive=True))
+
+    def evaluate_archive(self, archive: ArchiveIndex, root_dir: str) -> bool:
+        return any(archive.iglob(self.package_glob))
@@ -1,9 +1,17 @@
 import os
 from enum import Enum
 from sys import stderr
+from typing import Optional
 
 import yaml
 from loguru import logger
+from packman.api import client, metadata_cache
+from packman.api.client import HTTPConfig
+from packman.utils import hashing
+from packman.utils.cache import CacheConfig
+from packman.utils.files import http_cache_dir
+from packman.utils.hashing import ChecksumAlgorithm
+from packman.utils.journal import Durability
 from pydantic.main import BaseModel
 
 _dir = os.path.dirname(__file__)
@@ -29,18 +37,42 @@ class GitConfig(BaseModel):
 
 class Config(BaseModel):
     root_path: str = ""
+    # A .db or .sqlite path keeps the manifest in SQLite, migrating any JSON manifest of the same name
     manifest_path: str = "packman.json"
     definition_path: str = os.path.abspath(
         os.path.join(_root, _DEFAULT_DEFINITION_PATH)
     )
     git: GitConfig = GitConfig()
+    http: HTTPConfig = HTTPConfig()
+    cache: CacheConfig = CacheConfig()
     log_level: LogLevel = LogLevel(os.environ.get("PACKMAN_LOGGING", "CRITICAL"))
+    durability: Durability = Durability.BATCH
+    max_workers: Optional[int] = None
+    stream_archives: bool = True
+    download_segments: int = 1
+    prefetch_depth: int = 2
+    checksum_algorithm: ChecksumAlgorithm = ChecksumAlgorithm.SHA256
+    validation_processes: bool = False
+    # Validates the manifest on load even if it was written by this version of Packman
+    validate_manifest: bool = False
 
     def configure_logger(self) -> None:
         # Set up logger
         logger.remove()
         logger.add(stderr, level=self.log_level)
 
+    def configure_http(self, refresh: bool = False) -> None:
+        """
+        :param refresh: If True, cached API responses are revalidated with the server however fresh they are.
+        """
+        client.configure(self.http)
+        metadata_cache.configure(
+            http_cache_dir() if self.http.cache else None, refresh=refresh
+        )
+
+    def configure_checksums(self) -> None:
+        hashing.configure(self.checksum_algorithm)
+
 
 def get_config_path() -> str:
     return os.environ.get("PACKMAN_CONFIG_FILE", "packman.yml")
@@ -1,9 +1,24 @@
 import filecmp
 import os
 import shutil
-from functools import cached_property
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from enum import Enum
+from functools import cached_property, partial
 from hashlib import md5
-from typing import Iterable, List, Optional, Set, Tuple, Type, Union
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 from git.repo.base import Repo
 from loguru import logger
@@ -12,21 +27,36 @@ from packman.config import Config, read_config
 from packman.models.manifest import Manifest
 from packman.models.package_definition import PackageDefinition
 from packman.models.package_source import PackageVersion
-from packman.utils.cache import Cache
+from packman.utils.archive import ArchiveIndex, is_indexable
+from packman.utils.cache import Cache, CacheStats, get_stats, prune, verify
+from packman.utils.concurrency import (
+    default_max_workers,
+    iter_parallel,
+    run_parallel,
+)
+from packman.utils.copy_strategy import copy_file
 from packman.utils.files import (
     backup_path,
-    checksum,
     remove_path,
     resolve_case,
+    store_dir,
     temp_path,
 )
-from packman.utils.operation import Operation
+from packman.utils.hashing import (
+    ChecksumAlgorithm,
+    default_algorithm,
+    verify_checksum,
+)
+from packman.utils.journal import Durability
+from packman.utils.operation import Operation, StateFileExistsError
 from packman.utils.progress import (
     ProgressCallback,
     RestoreProgress,
     StepProgress,
     progress_noop,
 )
+from packman.utils.store import Store
+from packman.utils.uninterruptible import uninterruptible
 
 
 class VersionNotFoundError(Exception):
@@ -62,6 +92,93 @@ class NoFilesError(Exception):
     ...
 
 
+PackageProgressCallback = Callable[[str, float], None]
+
+
+def _package_progress_noop(name: str, progress: float) -> None:
+    return
+
+
+def _normalise_path(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _verify_file(
+    item: Tuple[str, str, str], algorithm: ChecksumAlgorithm
+) -> Tuple[bool, str]:
+    """
+    Verifies a (package name, file, checksum) tuple; module-level so that it can be run in a worker process.
+    """
+    _, file, chk = item
+    try:
+        return verify_checksum(file, chk, algorithm=algorithm)
+    except FileNotFoundError:
+        return False, chk
+
+
+class _Stage(str, Enum):
+    QUEUED = "queued"
+    FETCHING = "fetching"
+    FETCHED = "fetched"
+    INSTALLING = "installing"
+    # Installed or failed; either way, later packages no longer need to wait for it
+    DONE = "done"
+
+
+class _Installation:
+    """
+    The state of one package's installation within Packman.install_packages.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        package: PackageDefinition,
+        version_info: PackageVersion,
+        order: int,
+        on_progress: ProgressCallback,
+    ) -> None:
+        self.name = name
+        # Position in the order packages were given in
+        self.order = order
+        self.package = package
+        self.version_info = version_info
+        self.on_progress = on_progress
+        self.on_step_progress = StepProgress.from_step_count(
+            step_count=2 + len(package.steps), on_progress=on_progress
+        )
+        self.on_restore_progress = RestoreProgress.step_progress(
+            step_progress=self.on_step_progress, on_progress=on_progress
+        )
+        self.operation: Optional[Operation] = None
+        self.package_path: Optional[str] = None
+        # Normalised paths the package writes to, or None if unknown
+        self.paths: Optional[Set[str]] = None
+        # Earlier packages which conflict with this one, and so must be installed first
+        self.waits_for: List["_Installation"] = []
+        self.stage = _Stage.QUEUED
+        self.error: Optional[Exception] = None
+
+    def conflicts_with(self, other: "_Installation") -> bool:
+        if self.paths is None or other.paths is None:
+            return True
+        return not self.paths.isdisjoint(other.paths)
+
+    def fail(self, exc: Exception) -> None:
+        """
+        Records the given error and rolls back the package's operation.
+        """
+        logger.error(f"{self.name} - failed to install")
+        logger.exception(exc)
+        self.error = exc
+        self.abort()
+
+    def abort(self) -> None:
+        if self.operation is not None:
+            operation, self.operation = self.operation, None
+            operation.abort(on_progress=self.on_restore_progress)
+
+
 class Packman:
     def __init__(
         self,
@@ -70,12 +187,31 @@ class Packman:
         git_config_dir: str,
         git_url: str,
         root_dir: str,
+        *,
+        durability: Durability = Durability.BATCH,
+        max_workers: Optional[int] = None,
+        stream_archives: bool = True,
+        download_segments: int = 1,
+        prefetch_depth: int = 2,
+        cache_dir: Optional[str] = None,
+        cache_max_size: Optional[int] = None,
+        validation_processes: bool = False,
+        validate_manifest: bool = False,
     ) -> None:
         self.definition_dir = config_dir
         self.manifest_path = manifest_path
         self.git_definition_dir = git_config_dir
         self.git_url = git_url
         self.root_dir = root_dir
+        self.durability = durability
+        self.max_workers = max_workers
+        self.stream_archives = stream_archives
+        self.download_segments = download_segments
+        self.prefetch_depth = prefetch_depth
+        self.cache_store = Store(cache_dir or store_dir())
+        self.cache_max_size = cache_max_size
+        self.validation_processes = validation_processes
+        self.validate_manifest = validate_manifest
 
         key_bytes = bytes(os.path.realpath(self.root_dir), "utf-8")
         key_md5 = md5(key_bytes)
@@ -90,6 +226,15 @@ class Packman:
             git_config_dir=cfg.git.definition_path,
             git_url=cfg.git.url,
             root_dir=cfg.root_path,
+            durability=cfg.durability,
+            max_workers=cfg.max_workers,
+            stream_archives=cfg.stream_archives,
+            download_segments=cfg.download_segments,
+            prefetch_depth=cfg.prefetch_depth,
+            cache_dir=cfg.cache.path,
+            cache_max_size=cfg.cache.max_size,
+            validation_processes=cfg.validation_processes,
+            validate_manifest=cfg.validate_manifest,
         )
 
     @classmethod
@@ -101,9 +246,42 @@ class Packman:
         return cls.from_config(cfg)
 
     def create_operation(
-        self, on_restore_progress: ProgressCallback = progress_noop
+        self,
+        on_restore_progress: ProgressCallback = progress_noop,
+        name: Optional[str] = None,
+        max_workers: Optional[int] = None,
     ) -> Operation:
-        return Operation(key=self.key, on_restore_progress=on_restore_progress)
+        """
+        :param name: Name of the package the operation is for, if any; operations for different packages have separate
+        state and so can run at the same time.
+        :param max_workers: Maximum number of threads the operation may use, e.g. where several operations run at once;
+        if None, max_workers is used.
+        """
+        return Operation(
+            key=self._get_operation_key(name),
+            on_restore_progress=on_restore_progress,
+            durability=self.durability,
+            max_workers=max_workers or self.max_workers,
+            stream_archives=self.stream_archives,
+            download_segments=self.download_segments,
+        )
+
+    def _get_operation_key(self, name: Optional[str] = None) -> str:
+        if name is None:
+            return self.key
+        name_md5 = md5(bytes(name, "utf-8"))
+        return f"{self.key}_{name_md5.hexdigest()}"
+
+    def _check_no_pending_operations(self) -> None:
+        """
+        :raises StateFileExistsError: If any operation under this manager's root was interrupted and has not yet been
+        recovered.
+        """
+        keys = Operation.find_keys(prefix=self.key)
+        if keys:
+            raise StateFileExistsError(
+                f"unable to start operation: {len(keys)} interrupted operation(s) must be recovered first"
+            )
 
     def get_version_info(self, name: str, version: Union[str, None]) -> PackageVersion:
         """
@@ -160,12 +338,53 @@ class Packman:
             version="latest",
         )
 
+    def resolve_versions(
+        self, packages: Iterable[Tuple[str, Union[str, None]]]
+    ) -> Dict[Tuple[str, Union[str, None]], Union[PackageVersion, Exception]]:
+        """
+        Resolves version info for each of the given 2-tuples of package name and version concurrently, using up to
+        max_workers threads; a version of None resolves the latest version.
+
+        Returns a dictionary of each given 2-tuple to either its version info or the error raised resolving it.
+
+        Duplicate 2-tuples are resolved once, and identical requests made to a source at the same time by different
+        packages are only sent once.
+        """
+        resolutions: Dict[
+            Tuple[str, Union[str, None]], Union[PackageVersion, Exception]
+        ] = {}
+
+        def resolve(
+            package: Tuple[str, Union[str, None]]
+        ) -> Union[PackageVersion, Exception]:
+            name, version = package
+            try:
+                if version is None:
+                    return self.get_latest_version_info(name)
+                return self.get_version_info(name, version)
+            except Exception as exc:
+                return exc
+
+        def on_done(
+            package: Tuple[str, Union[str, None]],
+            resolution: Union[PackageVersion, Exception],
+        ) -> None:
+            resolutions[package] = resolution
+
+        run_parallel(
+            resolve,
+            list(dict.fromkeys(packages)),
+            max_workers=self.max_workers,
+            on_done=on_done,
+        )
+        return resolutions
+
     @cached_property
     def manifest(self) -> Manifest:
         """
         Returns the path to this manager's manifest file.
         """
-        return Manifest.from_json(self.manifest_path)
+        return Manifest.load(self.manifest_path, validate=self.validate_manifest)
 
     def package_path(self, name: str) -> str:
         """
@@ -173,16 +392,108 @@ class Packman:
         """
         return os.path.join(self.definition_dir, f"{name}.yml")
 
-    def validate(self, name: str) -> Iterable[str]:
+    def _cache(self, name: str) -> Cache:
+        return Cache(name=name, store=self.cache_store, max_size=self.cache_max_size)
+
+    def cache_stats(self) -> CacheStats:
         """
-        Validates the given package's files, returning an iterable of each invalid file path.
+        Returns the size of the package cache and how often it has been hit.
+        """
+        return get_stats(self.cache_store, max_size=self.cache_max_size)
+
+    def prune_cache(self, max_size: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Evicts the least recently used packages from the cache until it fits within max_size bytes.
+
+        :param max_size: Size to prune the cache down to; if None, the configured maximum size is used, or the cache is
+        emptied if unbounded.
+        :returns: A 2-tuple of the number of packages evicted and the total number of bytes freed.
+        """
+        if max_size is None:
+            max_size = self.cache_max_size or 0
+        return prune(self.cache_store, max_size=max_size)
+
+    def verify_cache(self) -> List[str]:
+        """
+        Evicts any cached packages whose contents no longer match their digests.
+
+        :returns: The name and version of each package evicted, in name@version format.
+        """
+        return verify(self.cache_store, max_workers=self.max_workers)
+
+    def validate(self, name: str, deep: bool = False) -> List[str]:
+        """
+        Validates the given package's files, returning the path of each invalid file.
+
+        :param deep: If True, every file is re-hashed; otherwise, files whose size, modification time and inode are
+        unchanged since their checksums were computed are assumed valid.
+        """
+        with self.validate_packages([name], deep=deep) as invalid:
+            return [file for _, file in invalid]
+
+    @contextmanager
+    def validate_packages(
+        self,
+        names: Optional[Iterable[str]] = None,
+        deep: bool = False,
+        fail_fast: bool = False,
+    ) -> Iterator[Iterator[Tuple[str, str]]]:
+        """
+        Validates the files of the given packages, hashing them in parallel using up to max_workers workers, providing
+        an iterator which yields a 2-tuple of package name and file path for each invalid or missing file as it is
+        found.
+
+        Files are hashed in worker processes if validation_processes is enabled, or in threads otherwise; only a couple
+        of files per worker are queued at a time.
+
+        Valid files whose checksums were computed with an algorithm other than the configured one have their checksums
+        replaced, and the manifest is written on leaving the context, however far the iterator was consumed.
+
+        :param names: Names of the packages to validate; if None, every installed package is validated.
+        :param deep: If True, every file is re-hashed; otherwise, files whose size, modification time and inode are
+        unchanged since their checksums were computed are assumed valid.
+        :param fail_fast: If True, stop at the first invalid file.
         """
         manifest = self.manifest
-        package = manifest.packages[name]
-        for file in package.checksums:
-            if checksum(file) != package.checksums[file]:
-                logger.warning(f"checksum mismatch: {file}")
-                yield file
+        if names is None:
+            names = list(manifest.packages)
+
+        def files() -> Iterator[Tuple[str, str, str]]:
+            for name in names:
+                package = manifest.packages[name]
+                for file, chk in list(package.checksums.items()):
+                    if deep or not package.is_unchanged(file):
+                        yield name, manifest.resolve(file), chk
+
+        migrated = False
+        results = iter_parallel(
+            partial(_verify_file, algorithm=default_algorithm()),
+            files(),
+            max_workers=self.max_workers,
+            processes=self.validation_processes,
+        )
+
+        def invalid_files() -> Iterator[Tuple[str, str]]:
+            nonlocal migrated
+            for (name, file, chk), (valid, curr_chk) in results:
+                if not valid:
+                    logger.warning(f"checksum mismatch: {file}")
+                    yield name, file
+                    if fail_fast:
+                        return
+                elif curr_chk != chk:
+                    package = manifest.packages[name]
+                    package.checksums[manifest.relativise(file)] = curr_chk
+                    package.mark_dirty()
+                    migrated = True
+
+        try:
+            yield invalid_files()
+        finally:
+            results.close()
+            if migrated:
+                logger.debug("migrated checksums to the configured algorithm")
+                manifest.save(self.manifest_path)
 
     def commit_backups(self, operation: Operation) -> None:
         """
@@ -192,79 +503,108 @@ class Packman:
         modified_files = manifest.modified_files
         original_files = manifest.original_files
         for original_path, temporary_path in operation.backups.items():
-            if (
-                original_path not in modified_files
-                and original_path not in original_files
-            ):
+            file = manifest.relativise(original_path)
+            if file not in modified_files and file not in original_files:
                 # commit temporary backup to permanence
                 logger.debug(f"committing backup for {original_path}")
                 permanent_path = backup_path(original_path)
                 os.makedirs(os.path.dirname(permanent_path), exist_ok=True)
-                shutil.copy2(temporary_path, permanent_path)
-                manifest.original_files[original_path] = permanent_path
+                # The temporary backup is discarded when the operation closes, so may share its inode
+                copy_file(temporary_path, permanent_path, discard_src=True)
+                manifest.original_files[file] = permanent_path
 
-    def install_package(
+    def execute_steps(
         self,
-        name: str,
-        version: Union[str, None],
-        force: bool = False,
-        no_cache: bool = False,
-        on_progress: ProgressCallback = progress_noop,
-    ) -> bool:
+        package: PackageDefinition,
+        operation: Operation,
+        package_path: str,
+        on_progress: StepProgress,
+    ) -> None:
         """
-        Idempotently installs a version of the given package.
+        Executes each of the given package's install steps, advancing on_progress after each.
 
-        :param force: If True, install even if already installed.
-        :param no_cache: If True, don't retrieve package from cache.
-
-        :returns: A boolean indicating whether or not the installation resulted in any changes.
+        If package_path is an archive, the steps are executed directly against it where they all support that;
+        otherwise it is extracted first.
         """
-        op: Optional[Operation] = None
-        package = self.package_definition(name)
-        package_path = None
-        context = name
-
-        on_step_progress = StepProgress.from_step_count(
-            step_count=2 + len(package.steps), on_progress=on_progress
-        )
-        on_progress(0.0)
-        on_restore_progress = RestoreProgress.step_progress(
-            step_progress=on_step_progress, on_progress=on_progress
-        )
-
-        # region Versioning
-
-        logger.info(f"{context} - resolving version info...")
-        version_info = self.get_version_info(name, version)
-        version = version_info.version
-        logger.success(f"{context} - resolved info for version {version}")
+        if not is_indexable(package_path):
+            for step in package.steps:
+                step.execute(
+                    operation=operation,
+                    package_path=package_path,
+                    root_dir=self.root_dir,
+                    on_progress=on_progress,
+                )
+                on_progress.advance()
+            return
+
+        if not all(step.supports_archive() for step in package.steps):
+            logger.debug("not all steps support archives; extracting package")
+            package_path = operation.extract_archive(package_path)
+            self.execute_steps(
+                package=package,
+                operation=operation,
+                package_path=package_path,
+                on_progress=on_progress,
+            )
+            return
 
-        # endregion
-        # region Early-out
+        with ArchiveIndex(package_path) as archive:
+            for step in package.steps:
+                step.execute_archive(
+                    operation=operation,
+                    archive=archive,
+                    root_dir=self.root_dir,
+                    on_progress=on_progress,
+                )
+                on_progress.advance()
 
+    def _is_installed(self, name: str, version: Union[str, None]) -> bool:
         manifest = self.manifest
-        if (
+        return (
             version is not None
             and name in manifest.packages
             and manifest.packages[name].version == version
-        ):
-            if force:
-                logger.info(f"{context} - reinstalling")
-            else:
-                logger.info(f"{context} - already installed")
-                return False
+        )
+
+    def _fetch_package(
+        self,
+        name: str,
+        package: PackageDefinition,
+        version_info: PackageVersion,
+        no_cache: bool,
+        on_step_progress: StepProgress,
+        on_restore_progress: ProgressCallback,
+        max_workers: Optional[int] = None,
+    ) -> Tuple[Operation, str, bool]:
+        """
+        Retrieves the given package version from the cache, or else from the first of the package's sources to provide
+        it.
+
+        :param max_workers: Maximum number of threads the operation retrieving it may use; if None, max_workers is used.
+
+        :returns: A 3-tuple of the operation holding the retrieved package, the path to it and whether it was missing
+        from the cache.
+        :raises NoSourcesError: If the package could not be retrieved from the cache or any of its sources.
+        """
+        op: Optional[Operation] = None
+        package_path = None
+        context = name
+        version = version_info.version
 
-        # endregion
         # region Cache
 
         source_errors: List[Exception] = []
 
         logger.info(f"{context} - checking cache")
-        cache_source = Cache(name=name)
+        cache_source = self._cache(name)
         if no_cache or version is None:
             cache_miss = True
         else:
-            op = self.create_operation(on_restore_progress=on_restore_progress)
+            op = self.create_operation(
+                on_restore_progress=on_restore_progress,
+                name=name,
+                max_workers=max_workers,
+            )
             try:
                 cache_source.fetch_version(
                     version=version,
@@ -300,7 +640,11 @@ class Packman:
         if cache_miss:
             logger.info(f"{context} - downloading...")
             for source in package.sources:
-                op = self.create_operation(on_restore_progress=on_restore_progress)
+                op = self.create_operation(
+                    on_restore_progress=on_restore_progress,
+                    name=name,
+                    max_workers=max_workers,
+                )
                 try:
                     source.fetch_version(
                         version=version,
@@ -340,63 +684,441 @@ class Packman:
                 version=version or "latest",
                 causes=source_errors,
             )
+        assert package_path, "operation did not end with a path"
+        return op, package_path, cache_miss
 
-        with op:
-            assert package_path, "operation did not end with a path"
+    def _prepare_package(
+        self,
+        name: str,
+        package: PackageDefinition,
+        version_info: PackageVersion,
+        operation: Operation,
+        package_path: str,
+        cache_miss: bool,
+    ) -> str:
+        """
+        Adds a freshly downloaded package to the cache and extracts it if its install steps cannot read it as an
+        archive, returning the path to execute the install steps against.
+        """
+        context = name
 
-            # region Cache update
+        if cache_miss and version_info.version is not None:
+            logger.info(f"{context} - updating cache...")
+            try:
+                tree = self._cache(name).add_package(
+                    version_info=version_info,
+                    package_path=package_path,
+                    operation=operation,
+                    max_workers=operation.max_workers,
+                )
+            except Exception as exc:
+                logger.error(f"{context} - failed to update cache")
+                logger.exception(exc)
+            else:
+                logger.success(f"{context} - cache updated")
+                if os.path.isdir(package_path):
+                    # Hashed as they were cached, so need not be hashed again as they are installed
+                    operation.record_digests(package_path, tree.files)
 
-            if cache_miss and version is not None:
-                logger.info(f"{context} - updating cache...")
-                try:
-                    cache_source.add_package(
-                        version_info=version_info, package_path=package_path
-                    )
-                except Exception as exc:
-                    logger.error(f"{context} - failed to update cache")
-                    logger.exception(exc)
-                else:
-                    logger.success(f"{context} - cache updated")
+        if is_indexable(package_path) and not all(
+            step.supports_archive() for step in package.steps
+        ):
+            logger.debug("not all steps support archives; extracting package")
+            package_path = operation.extract_archive(package_path)
+        return package_path
 
-            # endregion
-            # region Installation
-            # We don't need to uninstall first - files that are unreplaced (i.e. no longer included in package) are
-            # deleted/restored as part of manifest.write_json()
+    def plan_steps(
+        self, package: PackageDefinition, package_path: str
+    ) -> Optional[Set[str]]:
+        """
+        Returns the normalised absolute path of every file the given package's install steps would write to, or None if
+        that cannot be known before the steps are executed.
+        """
+        if not is_indexable(package_path):
+            plans = [
+                step.plan(package_path=package_path, root_dir=self.root_dir)
+                for step in package.steps
+            ]
+        elif all(step.supports_archive() for step in package.steps):
+            with ArchiveIndex(package_path) as archive:
+                plans = [
+                    step.plan_archive(archive=archive, root_dir=self.root_dir)
+                    for step in package.steps
+                ]
+        else:
+            return None
 
-            logger.info(f"{context} - installing...")
-            for step in package.steps:
-                step.execute(
-                    operation=op,
-                    package_path=package_path,
-                    root_dir=self.root_dir,
-                    on_progress=on_step_progress,
-                )
-                on_step_progress.advance()
+        paths: Set[str] = set()
+        for plan in plans:
+            if plan is None:
+                return None
+            paths.update(_normalise_path(path) for path in plan)
+        return paths
 
-            if not op.new_paths:
-                raise NoFilesError("mod has no files")
+    def _install_files(
+        self,
+        name: str,
+        package: PackageDefinition,
+        operation: Operation,
+        package_path: str,
+        on_step_progress: StepProgress,
+    ) -> None:
+        """
+        :raises NoFilesError: If the package's install steps did not install any files.
+        """
+        # We don't need to uninstall first - files that are unreplaced (i.e. no longer included in package) are
+        # deleted/restored as part of manifest.write_json()
+        logger.info(f"{name} - installing...")
+        self.execute_steps(
+            package=package,
+            operation=operation,
+            package_path=package_path,
+            on_progress=on_step_progress,
+        )
 
-            # endregion
-            # region Manifest
+        if not operation.new_paths:
+            raise NoFilesError("mod has no files")
 
-            self.commit_backups(op)
+    def _commit_package(
+        self,
+        name: str,
+        version_info: PackageVersion,
+        operation: Operation,
+        on_step_progress: StepProgress,
+    ) -> None:
+        """
+        Records the files installed by the given operation in the manifest and writes it; on failure, the package's
+        previous entry in the manifest is put back.
+        """
+        manifest = self.manifest
+        previous = manifest.packages.get(name)
+        try:
+            self.commit_backups(operation)
 
             manifest.add_package(
                 name,
-                version=version,
+                version=version_info.version,
                 options=[version_info.options[0]],
-                files=op.new_paths,
+                files=operation.new_paths,
+                checksums=operation.checksums,
             )
 
             manifest.update_files(self.manifest_path, on_progress=on_step_progress)
+        except Exception:
+            if previous is None:
+                manifest.remove_package(name)
+            else:
+                manifest.packages[name] = previous
+            raise
 
-            on_progress(1.0)
+    def install_package(
+        self,
+        name: str,
+        version: Union[str, None],
+        force: bool = False,
+        no_cache: bool = False,
+        on_progress: ProgressCallback = progress_noop,
+        version_info: Optional[PackageVersion] = None,
+    ) -> bool:
+        """
+        Idempotently installs a version of the given package.
 
-            # endregion
+        :param force: If True, install even if already installed.
+        :param no_cache: If True, don't retrieve package from cache.
+        :param version_info: Version info already resolved for the given version, e.g. by resolve_versions; if None,
+        it is resolved here.
+
+        :returns: A boolean indicating whether or not the installation resulted in any changes.
+        """
+        self._check_no_pending_operations()
+        package = self.package_definition(name)
+        context = name
+
+        on_step_progress = StepProgress.from_step_count(
+            step_count=2 + len(package.steps), on_progress=on_progress
+        )
+        on_progress(0.0)
+        on_restore_progress = RestoreProgress.step_progress(
+            step_progress=on_step_progress, on_progress=on_progress
+        )
+
+        # region Versioning
+
+        if version_info is None:
+            logger.info(f"{context} - resolving version info...")
+            version_info = self.get_version_info(name, version)
+            logger.success(
+                f"{context} - resolved info for version {version_info.version}"
+            )
+
+        # endregion
+        # region Early-out
+
+        if self._is_installed(name, version_info.version):
+            if force:
+                logger.info(f"{context} - reinstalling")
+            else:
+                logger.info(f"{context} - already installed")
+                return False
+
+        # endregion
+
+        op, package_path, cache_miss = self._fetch_package(
+            name=name,
+            package=package,
+            version_info=version_info,
+            no_cache=no_cache,
+            on_step_progress=on_step_progress,
+            on_restore_progress=on_restore_progress,
+        )
+
+        with op:
+            package_path = self._prepare_package(
+                name=name,
+                package=package,
+                version_info=version_info,
+                operation=op,
+                package_path=package_path,
+                cache_miss=cache_miss,
+            )
+            self._install_files(
+                name=name,
+                package=package,
+                operation=op,
+                package_path=package_path,
+                on_step_progress=on_step_progress,
+            )
+            self._commit_package(
+                name=name,
+                version_info=version_info,
+                operation=op,
+                on_step_progress=on_step_progress,
+            )
+
+            on_progress(1.0)
             logger.success(f"{context} - installed")
 
         return True
 
+    def install_packages(
+        self,
+        packages: Iterable[Tuple[str, PackageVersion]],
+        force: bool = False,
+        no_cache: bool = False,
+        on_progress: PackageProgressCallback = _package_progress_noop,
+    ) -> Dict[str, Union[bool, Exception]]:
+        """
+        Idempotently installs the given resolved versions of several packages, using up to max_workers threads.
+
+        Packages are retrieved in the given order, up to prefetch_depth packages ahead of those being installed, and
+        each is installed as soon as it has been retrieved, so that downloads and file copies overlap. Packages are
+        installed concurrently, except that packages which would write to the same files as a package given before them,
+        whether through their install steps or because of the files already installed for them, wait for it to be
+        installed first. Each package is recorded in the manifest as soon as it has been installed, before any package
+        waiting for it is installed.
+
+        A package which fails is rolled back without affecting the others.
+
+        :param packages: 2-tuples of package name and version info, e.g. as resolved by resolve_versions.
+        :param force: If True, install even if already installed.
+        :param no_cache: If True, don't retrieve packages from cache.
+        :param on_progress: Called with a package name and its progress; may be called from several threads at once.
+
+        :returns: A dictionary of each package name to whether its installation resulted in any changes, or the error
+        which prevented it.
+        """
+        self._check_no_pending_operations()
+
+        results: Dict[str, Union[bool, Exception]] = {}
+        installations: List[_Installation] = []
+        for name, version_info in packages:
+            if name in results:
+                continue
+            try:
+                package = self.package_definition(name)
+            except Exception as exc:
+                results[name] = exc
+                continue
+            if self._is_installed(name, version_info.version) and not force:
+                logger.info(f"{name} - already installed")
+                on_progress(name, 1.0)
+                results[name] = False
+                continue
+            results[name] = True
+            installations.append(
+                _Installation(
+                    name=name,
+                    package=package,
+                    version_info=version_info,
+                    order=len(installations),
+                    on_progress=partial(on_progress, name),
+                )
+            )
+
+        try:
+            self._run_installations(installations, no_cache=no_cache)
+        except BaseException:
+            with uninterruptible():
+                for installation in reversed(installations):
+                    installation.abort()
+            raise
+
+        for installation in installations:
+            if installation.error is not None:
+                results[installation.name] = installation.error
+        return results
+
+    def _run_installations(
+        self, installations: List["_Installation"], no_cache: bool
+    ) -> None:
+        max_workers = self.max_workers or default_max_workers()
+        # Each package's file work gets a share of the workers, so that packages installing at once don't each start
+        # a full pool of their own beneath the pool running them
+        package_workers = max(1, max_workers // max(1, len(installations)))
+
+        def fetch(installation: _Installation) -> None:
+            installation.on_progress(0.0)
+            try:
+                (
+                    installation.operation,
+                    package_path,
+                    cache_miss,
+                ) = self._fetch_package(
+                    name=installation.name,
+                    package=installation.package,
+                    version_info=installation.version_info,
+                    no_cache=no_cache,
+                    on_step_progress=installation.on_step_progress,
+                    on_restore_progress=installation.on_restore_progress,
+                    max_workers=package_workers,
+                )
+                installation.package_path = self._prepare_package(
+                    name=installation.name,
+                    package=installation.package,
+                    version_info=installation.version_info,
+                    operation=installation.operation,
+                    package_path=package_path,
+                    cache_miss=cache_miss,
+                )
+                installation.paths = self.plan_steps(
+                    package=installation.package,
+                    package_path=installation.package_path,
+                )
+            except Exception as exc:
+                installation.fail(exc)
+
+        def install(installation: _Installation) -> None:
+            assert installation.operation and installation.package_path
+            try:
+                self._install_files(
+                    name=installation.name,
+                    package=installation.package,
+                    operation=installation.operation,
+                    package_path=installation.package_path,
+                    on_step_progress=installation.on_step_progress,
+                )
+            except Exception as exc:
+                installation.fail(exc)
+
+        def commit(installation: _Installation) -> None:
+            assert installation.operation
+            try:
+                self._commit_package(
+                    name=installation.name,
+                    version_info=installation.version_info,
+                    operation=installation.operation,
+                    on_step_progress=installation.on_step_progress,
+                )
+            except Exception as exc:
+                installation.fail(exc)
+            else:
+                installation.operation.close()
+                installation.operation = None
+                installation.on_progress(1.0)
+                logger.success(f"{installation.name} - installed")
+
+        # region Pipeline
+        # Packages are fetched in order, at most prefetch_depth packages ahead of those being installed, so that
+        # downloads continue while files are copied without fetched packages piling up on disk. Once every package
+        # before it has been fetched, so that its conflicts are known, a package is installed as soon as every earlier
+        # package it conflicts with has finished installing and been recorded in the manifest
+
+        manifest = self.manifest
+        prefetch_depth = max(1, self.prefetch_depth)
+        unfetched = deque(installations)
+        unplanned = deque(installations)
+        planned: List[_Installation] = []
+        waiting: List[_Installation] = []
+        futures: Dict[Future, _Installation] = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            while True:
+                while unplanned and unplanned[0].stage not in (
+                    _Stage.QUEUED,
+                    _Stage.FETCHING,
+                ):
+                    installation = unplanned.popleft()
+                    if installation.error is not None:
+                        continue
+                    if (
+                        installation.paths is not None
+                        and installation.name in manifest.packages
+                    ):
+                        installation.paths.update(
+                            _normalise_path(manifest.resolve(file))
+                            for file in manifest.packages[installation.name].files
+                        )
+                    for other in planned:
+                        if installation.conflicts_with(other):
+                            installation.waits_for.append(other)
+                    planned.append(installation)
+                    waiting.append(installation)
+
+                for installation in list(waiting):
+                    if all(
+                        other.stage == _Stage.DONE for other in installation.waits_for
+                    ):
+                        waiting.remove(installation)
+                        installation.stage = _Stage.INSTALLING
+                        futures[executor.submit(install, installation)] = installation
+
+                ahead = sum(
+                    1
+                    for installation in installations
+                    if installation.stage in (_Stage.FETCHING, _Stage.FETCHED)
+                )
+                while unfetched and ahead < prefetch_depth:
+                    installation = unfetched.popleft()
+                    installation.stage = _Stage.FETCHING
+                    futures[executor.submit(fetch, installation)] = installation
+                    ahead += 1
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    installation = futures.pop(future)
+                    future.result()
+                    if (
+                        installation.stage == _Stage.FETCHING
+                        and installation.error is None
+                    ):
+                        installation.stage = _Stage.FETCHED
+                    else:
+                        if (
+                            installation.stage == _Stage.INSTALLING
+                            and installation.error is None
+                        ):
+                            # Recorded before any package waiting for it is installed, so that files it no longer
+                            # ships are cleaned up before another package can install them
+                            commit(installation)
+                        installation.stage = _Stage.DONE
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        # endregion
+
     def uninstall_package(
         self, name: str, on_progress: ProgressCallback = progress_noop
     ) -> bool:
@@ -409,9 +1131,7 @@ class Packman:
 
         on_progress(0.0)
 
-        try:
-            del manifest.packages[name]
-        except KeyError:
+        if manifest.remove_package(name) is None:
             return False
 
         manifest.update_files(self.manifest_path, on_progress=on_progress)
@@ -499,5 +1219,9 @@ class Packman:
                     logger.exception(exc)
 
     def recover(self, on_progress: ProgressCallback) -> None:
-        with Operation.recover(key=self.key) as op:
-            op.abort(on_progress=on_progress)
+        """
+        Rolls back every interrupted operation under this manager's root.
+        """
+        for key in Operation.find_keys(prefix=self.key):
+            with Operation.recover(key=key, durability=self.durability) as op:
+                op.abort(on_progress=on_progress)
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
+from typing import ClassVar
 
+from packman.utils.archive import ArchiveIndex
 from packman.utils.union import create_union
 from pydantic import BaseModel, Extra
 
@@ -9,10 +11,20 @@ class BaseCondition(BaseModel, ABC):
     Resolves a condition used to determine whether or not a particular install step should be executed.
     """
 
+    # Whether or not evaluate_archive reads the archive directly, rather than extracting it to call evaluate
+    supports_archive: ClassVar[bool] = False
+
     @abstractmethod
     def evaluate(self, package_path: str, root_dir: str) -> bool:
         ...
 
+    def evaluate_archive(self, archive: ArchiveIndex, root_dir: str) -> bool:
+        """
+        Evaluates this condition against a package which has not been extracted from its archive; unless overridden,
+        the archive is extracted in full to evaluate it.
+        """
+        return self.evaluate(package_path=archive.extract_all(), root_dir=root_dir)
+
     class Config:
         extra = Extra.forbid
 
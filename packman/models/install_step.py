@@ -1,7 +1,8 @@
 from abc import ABC
-from typing import List
+from typing import List, Optional, Set
 
 from packman.models.condition import Condition
+from packman.utils.archive import ArchiveIndex
 from packman.utils.operation import Operation
 from packman.utils.progress import ProgressCallback, progress_noop
 from packman.utils.union import create_union
@@ -51,6 +52,86 @@ class BaseInstallStep(BaseModel, ABC):
     ) -> None:
         ...
 
+    def plan(self, package_path: str, root_dir: str) -> Optional[Set[str]]:
+        """
+        Returns the paths of the files this step would write to if executed now, without changing anything; or None if
+        this cannot be known in advance.
+        """
+        if any(
+            (
+                not cond.evaluate(package_path=package_path, root_dir=root_dir)
+                for cond in self.conditions
+            )
+        ):
+            return set()
+        return self.do_plan(package_path=package_path, root_dir=root_dir)
+
+    def do_plan(self, package_path: str, root_dir: str) -> Optional[Set[str]]:
+        return None
+
+    def plan_archive(self, archive: ArchiveIndex, root_dir: str) -> Optional[Set[str]]:
+        """
+        As plan, but for executing this step directly against a package archive.
+        """
+        if any(
+            (
+                not cond.evaluate_archive(archive=archive, root_dir=root_dir)
+                for cond in self.conditions
+            )
+        ):
+            return set()
+        return self.do_plan_archive(archive=archive, root_dir=root_dir)
+
+    def do_plan_archive(
+        self, archive: ArchiveIndex, root_dir: str
+    ) -> Optional[Set[str]]:
+        return None
+
+    def supports_archive(self) -> bool:
+        """
+        Returns True if this step and all of its conditions read a package archive directly when executed against it,
+        rather than extracting the archive first.
+        """
+        return type(self).do_execute_archive is not (
+            BaseInstallStep.do_execute_archive
+        ) and all(cond.supports_archive for cond in self.conditions)
+
+    def execute_archive(
+        self,
+        operation: Operation,
+        archive: ArchiveIndex,
+        root_dir: str,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> None:
+        if any(
+            (
+                not cond.evaluate_archive(archive=archive, root_dir=root_dir)
+                for cond in self.conditions
+            )
+        ):
+            return
+        self.do_execute_archive(
+            operation=operation,
+            archive=archive,
+            root_dir=root_dir,
+            on_progress=on_progress,
+        )
+
+    def do_execute_archive(
+        self,
+        operation: Operation,
+        archive: ArchiveIndex,
+        root_dir: str,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> None:
+        # Unless overridden, the step is executed against the archive extracted in full
+        self.do_execute(
+            operation=operation,
+            package_path=archive.extract_all(),
+            root_dir=root_dir,
+            on_progress=on_progress,
+        )
+
     class Config:
         extra = Extra.forbid
 
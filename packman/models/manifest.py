@@ -1,19 +1,88 @@
 import json
 import os
-import shutil
+import sys
+import time
 from copy import deepcopy
-from typing import Any, Dict, Iterable, List, Optional, Set, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from loguru import logger
-from packman.utils.files import checksum, remove_path
+from packman.models.manifest_maps import ChecksumMap, FileMap
+from packman.utils.copy_strategy import copy_file
+from packman.utils.files import fsync_dir, remove_path
+from packman.utils.hashing import (
+    checksum,
+    file_checksums,
+    pack_checksum,
+    packed_algorithm,
+)
 from packman.utils.progress import ProgressCallback, StepProgress, progress_noop
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
+
+
+# Files modified this recently are not fingerprinted, as a further write within the file-system's timestamp
+# granularity would leave their fingerprint unchanged
+_RACY_WINDOW_NS = 2_000_000_000
+
+# Manifests of this version are trusted to have been written by Packman, so are loaded without validation; earlier
+# versions were written before the trusted writer, so are always validated
+_MANIFEST_VERSION = 2
+
+
+class FileFingerprint(BaseModel):
+    """
+    Identifies a version of a file by its metadata, so that files can be assumed unchanged without being re-hashed.
+    """
+
+    size: int
+    mtime_ns: int
+    inode: int
+    device: int
+
+    @classmethod
+    def from_stat(cls, stat: os.stat_result) -> "FileFingerprint":
+        return cls(
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            inode=stat.st_ino,
+            device=stat.st_dev,
+        )
+
+    @classmethod
+    def from_path(cls, path: str) -> Optional["FileFingerprint"]:
+        """
+        Returns the fingerprint of the given file, or None if it does not exist.
+        """
+        try:
+            return cls.from_stat(os.stat(path))
+        except FileNotFoundError:
+            return None
+
+
+def resolve_path(root_path: str, file: str) -> str:
+    """
+    Returns the file-system path of a file stored in a manifest relative to the given root.
+    """
+    if root_path == ".":
+        return file
+    return os.path.normpath(os.path.join(root_path, file))
+
+
+def relative_path(root_path: str, path: str) -> str:
+    """
+    Returns the given file-system path relative to the given root, as stored in a manifest.
+
+    The result is interned, as each file is used as a key in several of the manifest's mappings.
+    """
+    if root_path == ".":
+        return sys.intern(os.path.normpath(path))
+    return sys.intern(os.path.relpath(path, root_path))
 
 
 def replace_root_path(*, path: str, new_root_path: str, old_root_path: str) -> str:
-    unrooted = os.path.relpath(path, old_root_path)
-    result = os.path.normpath(os.path.join(new_root_path, unrooted))
-    return result
+    """
+    Returns a path stored relative to one root relative to another instead.
+    """
+    return relative_path(new_root_path, resolve_path(old_root_path, path))
 
 
 class BaseModelWithPrivateAttributes(BaseModel):
@@ -23,8 +92,7 @@ class BaseModelWithPrivateAttributes(BaseModel):
         else:
             super().__setattr__(name, value)
 
-    def dict(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
-        exclude = kwargs.pop("exclude")
+    def _exclude_private(self, exclude: Any) -> Set[str]:
         if exclude:
             exclude = set(exclude)
         else:
@@ -33,12 +101,23 @@ class BaseModelWithPrivateAttributes(BaseModel):
         for key in self.__dict__:
             if key.startswith("_"):
                 exclude.add(key)
+        return exclude
+
+    def dict(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        exclude = self._exclude_private(kwargs.pop("exclude", None))
         return super().dict(*args, **kwargs, exclude=exclude)
 
+    def json(self, *args: Any, **kwargs: Any) -> str:
+        exclude = self._exclude_private(kwargs.pop("exclude", None))
+        return super().json(*args, **kwargs, exclude=exclude)
+
 
 class ManifestPackage(BaseModelWithPrivateAttributes):
     """
     Describes an installed package's files, checksums, files displaced during installation, etc.
+
+    Files are stored relative to the root of the manifest the package belongs to, and only resolved to file-system
+    paths where they are read or written.
     """
 
     version: Union[str, None] = Field(
@@ -54,34 +133,155 @@ class ManifestPackage(BaseModelWithPrivateAttributes):
         description="List of files claimed (either partially or wholly) by this package"
         " e.g. files that were created, modified or replaced during the installation of this version.",
     )
-    checksums: Dict[str, str] = Field(
-        {},
+    checksums: ChecksumMap = Field(
+        default_factory=ChecksumMap,
         description="Dictionary mapping files to their checksums for basic conflict detection"
         " and file validation.",
     )
+    fingerprints: Dict[str, FileFingerprint] = Field(
+        {},
+        description="Dictionary mapping files to their size, modification time and inode as of when their checksums"
+        " were computed, so that unchanged files need not be re-hashed.",
+    )
 
     def __init__(self, **data: Any) -> None:
         super().__init__(**data)
+        self._init_state()
+
+    @validator("files")
+    def _intern_files(cls, files: Set[str]) -> Set[str]:
+        # Shared with the keys of the package's other mappings, which are interned when validated
+        return {sys.intern(file) for file in files}
+
+    def _init_state(self) -> None:
         self._root_path = "."
+        # Whether the package has changed since it was last loaded or saved
+        self._dirty = True
+        # Incremented on every change, so that the manifest can tell which packages to re-index
+        self._revision = 0
+        # Revision as of which every file had a checksum
+        self._checksummed_revision = -1
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        """
+        Marks the package as changed, so that it is re-indexed by the manifest and rewritten when the manifest is next
+        saved; needed only where its fields are modified in place.
+        """
+        self._dirty = True
+        self._revision += 1
 
     def deepcopy(self) -> "ManifestPackage":
         return deepcopy(self)
 
+    @classmethod
+    def from_trusted(cls, raw: Dict[str, Any]) -> "ManifestPackage":
+        """
+        Creates a package from JSON written by Packman, without validating it.
+        """
+        package = cls.construct(
+            version=raw["version"],
+            options=set(raw["options"]),
+            files={sys.intern(file) for file in raw["files"]},
+            checksums=ChecksumMap(
+                (sys.intern(file), chk)
+                for file, chk in raw.get("checksums", {}).items()
+            ),
+            fingerprints={
+                sys.intern(file): FileFingerprint.construct(**fingerprint)
+                for file, fingerprint in raw.get("fingerprints", {}).items()
+            },
+        )
+        package._init_state()
+        return package
+
+    def to_trusted(self) -> Dict[str, Any]:
+        """
+        Returns the package as JSON-serialisable data which can be loaded by from_trusted.
+        """
+        return {
+            "version": self.version,
+            "options": list(self.options),
+            "files": list(self.files),
+            "checksums": dict(self.checksums),
+            "fingerprints": {
+                file: dict(fingerprint)
+                for file, fingerprint in self.fingerprints.items()
+            },
+        }
+
     def compute_checksums(self) -> None:
         """
         Computes checksums for files that do not already have checksums; does not recompute pre-existing checksums.
         If a file for some reason gets updated, first delete it from the checksum dictionary.
+
+        Checksums and fingerprints of files no longer belonging to the package are dropped.
         """
-        self.checksums = {}
+        if self._checksummed_revision == self._revision:
+            return
+        for mapping in (self.checksums, self.fingerprints):
+            for file in [file for file in mapping if file not in self.files]:
+                del mapping[file]
+                self.mark_dirty()
+        racy_ns = time.time_ns() - _RACY_WINDOW_NS
         for file in self.files:
             if file not in self.checksums:
-                self.checksums[file] = checksum(file)
+                self.mark_dirty()
+                path = resolve_path(self._root_path, file)
+                fingerprint = FileFingerprint.from_path(path)
+                self.checksums[file] = checksum(path)
+                if (
+                    fingerprint is not None
+                    and fingerprint.mtime_ns < racy_ns
+                    and fingerprint == FileFingerprint.from_path(path)
+                ):
+                    self.fingerprints[file] = fingerprint
+                else:
+                    self.fingerprints.pop(file, None)
+        self._checksummed_revision = self._revision
+
+    def add_checksums(self, checksums: Dict[str, str]) -> None:
+        """
+        Records checksums computed as the package's files were written, e.g. by an Operation, fingerprinting each file
+        as it is now; checksums for files not belonging to the package are ignored.
+        """
+        racy_ns = time.time_ns() - _RACY_WINDOW_NS
+        self.mark_dirty()
+        for file, chk in checksums.items():
+            if file not in self.files:
+                continue
+            self.checksums[file] = chk
+            fingerprint = FileFingerprint.from_path(resolve_path(self._root_path, file))
+            if fingerprint is not None and fingerprint.mtime_ns < racy_ns:
+                self.fingerprints[file] = fingerprint
+            else:
+                self.fingerprints.pop(file, None)
+
+    def is_unchanged(self, file: str) -> bool:
+        """
+        Returns True if the given file's fingerprint matches that recorded when its checksum was computed, meaning it
+        can be assumed to still match its checksum without being re-hashed.
+        """
+        fingerprint = self.fingerprints.get(file)
+        return fingerprint is not None and fingerprint == FileFingerprint.from_path(
+            resolve_path(self._root_path, file)
+        )
 
     def update_path_root(self, root_path: str) -> None:
         """
         Updates the paths to be relative to a new root assuming the package's files remain at the same absolute path
         in the file-system.
         """
+        root_path = os.path.normpath(root_path)
+        if root_path == self._root_path:
+            return
+        # Only the paths change, so the package need not be rewritten or re-checksummed
+        dirty = self._dirty
+        checksummed = self._checksummed_revision == self._revision
 
         new_files: Set[str] = set()
         for file in self.files:
@@ -91,45 +291,63 @@ class ManifestPackage(BaseModelWithPrivateAttributes):
             new_files.add(new_file)
         self.files = new_files
 
-        new_checksums: Dict[str, str] = {}
-        for file, chk in self.checksums.items():
+        self.checksums = self.checksums.remap(
+            lambda file: replace_root_path(
+                path=file, new_root_path=root_path, old_root_path=self._root_path
+            )
+        )
+
+        new_fingerprints: Dict[str, FileFingerprint] = {}
+        for file, fingerprint in self.fingerprints.items():
             new_file = replace_root_path(
                 path=file, new_root_path=root_path, old_root_path=self._root_path
             )
-            new_checksums[new_file] = chk
-        self.checksums = new_checksums
+            new_fingerprints[new_file] = fingerprint
+        self.fingerprints = new_fingerprints
         self._root_path = root_path
+        self._dirty = dirty
+        if checksummed:
+            self._checksummed_revision = self._revision
 
     def prepend_path(self, path: str) -> None:
         """
         Changes the absolute path of this package's files. Paths will be normalised.
         """
         new_files: Set[str] = set()
-        new_checksums: Dict[str, str] = {}
+        new_checksums = ChecksumMap()
+        new_fingerprints: Dict[str, FileFingerprint] = {}
         for file in self.files:
             new_file = os.path.normpath(os.path.join(path, file))
             new_files.add(new_file)
             new_checksums[new_file] = self.checksums[file]
+            if file in self.fingerprints:
+                new_fingerprints[new_file] = self.fingerprints[file]
         self.files = new_files
         self.checksums = new_checksums
+        self.fingerprints = new_fingerprints
 
     class Config:
         title = "Manifest Package"
+        json_encoders = {ChecksumMap: dict}
 
 
 class Manifest(BaseModelWithPrivateAttributes):
     """
     Describes the packages which have been installed by Packman.
+
+    File paths are stored relative to the manifest's root, which is the directory it was loaded from, so that it can be
+    loaded and saved without rewriting them; resolve and relativise convert them to and from file-system paths.
     """
 
     version = Field(
-        1, description="Manifest version for future backwards compatibility."
+        _MANIFEST_VERSION,
+        description="Manifest version for future backwards compatibility.",
     )
     packages: Dict[str, ManifestPackage] = Field(
         {}, description="Currently installed packages."
     )
-    file_map: Dict[str, List[str]] = Field(
-        {},
+    file_map: FileMap = Field(
+        default_factory=FileMap,
         description="Files claimed by Packman packages; autogenerated from package file lists.",
     )
     original_files: Dict[str, str] = Field(
@@ -143,30 +361,159 @@ class Manifest(BaseModelWithPrivateAttributes):
     )
 
     _root_path: str
-    _file_checksums: Dict[str, Set[str]]
+    # Checksums of each file in packed form, across every package which has claimed it since the last cleanup; files
+    # with a single checksum, by far the most common case, map straight to it
+    _file_checksums: Dict[str, Union[bytes, Tuple[bytes, ...]]]
+    _file_fingerprints: Dict[str, List[FileFingerprint]]
+    # Each package as of when it was indexed, with its revision and normalised files
+    _indexed: Dict[str, Tuple[ManifestPackage, int, Tuple[str, ...]]]
+    # Files whose ownership changed since the last cleanup, mapped to whether they were claimed as of that cleanup
+    _pending: Dict[str, bool]
 
     def __init__(self, **data: Any) -> None:
         super().__init__(**data)
+        self._init_state()
+
+    def _init_state(self) -> None:
         self._root_path = "."
         self._file_checksums = {}
-        self._update_checksum_map()
+        self._file_fingerprints = {}
+        self._indexed = {}
+        self._pending = {}
+        saved_file_map = self.file_map
+        self.file_map = FileMap()
+        for name, package in self.packages.items():
+            self._index_package(name, package)
+        # Reconciles the saved file map with the packages in case they disagree, e.g. if the manifest was edited
+        self._pending = {
+            file: True for file in saved_file_map if file not in self.file_map
+        }
+        self._pending.update(
+            (file, False) for file in self.orphaned_files if file in self.file_map
+        )
 
     @property
     def modified_files(self) -> Iterable[str]:
         return self.file_map.keys()
 
-    def _update_checksum_map(self) -> None:
+    def resolve(self, file: str) -> str:
+        """
+        Returns the file-system path of a file stored in the manifest.
+        """
+        return resolve_path(self._root_path, file)
+
+    def relativise(self, path: str) -> str:
+        """
+        Returns the given file-system path as stored in the manifest, i.e. relative to its root.
+        """
+        return relative_path(self._root_path, path)
+
+    def _set_root_path(self, root_path: str) -> None:
+        # Only valid where the stored paths are already relative to the given root, e.g. when loading
+        self._root_path = root_path
         for package in self.packages.values():
-            for file, chk in package.checksums.items():
-                normpath = os.path.normpath(file)
-                if normpath in self._file_checksums:
-                    self._file_checksums[normpath].add(chk)
-                else:
-                    self._file_checksums[normpath] = set((chk,))
+            package._root_path = root_path
+
+    def _index_package(self, name: str, package: ManifestPackage) -> None:
+        # Packages from elsewhere, e.g. another manifest, are rebased onto this manifest's root
+        package.update_path_root(self._root_path)
+        files = tuple(package.files)
+        for file in files:
+            if self.file_map.add_owner(file, name):
+                self._pending.setdefault(file, False)
+        for file, packed in package.checksums.packed_items():
+            chks = self._file_checksums.get(file)
+            if chks is None:
+                self._file_checksums[file] = packed
+            elif isinstance(chks, bytes):
+                if chks != packed:
+                    self._file_checksums[file] = (chks, packed)
+            elif packed not in chks:
+                self._file_checksums[file] = chks + (packed,)
+        for file, fingerprint in package.fingerprints.items():
+            if file not in self._file_fingerprints:
+                self._file_fingerprints[file] = [fingerprint]
+            elif fingerprint not in self._file_fingerprints[file]:
+                self._file_fingerprints[file].append(fingerprint)
+        self._indexed[name] = (package, package._revision, files)
+
+    def _unindex_package(self, name: str) -> None:
+        # Checksums are kept until the next cleanup, which may need them to tell whether the files were modified
+        indexed = self._indexed.pop(name, None)
+        if indexed is None:
+            return
+        for file in indexed[2]:
+            if self.file_map.remove_owner(file, name):
+                self._pending.setdefault(file, True)
+
+    def _update_index(self) -> None:
+        """
+        Re-indexes packages which have been replaced, removed or changed since they were last indexed, e.g. by
+        modifying packages directly rather than through add_package and remove_package.
+        """
+        for name in [
+            name
+            for name, (package, _, _) in self._indexed.items()
+            if self.packages.get(name) is not package
+        ]:
+            self._unindex_package(name)
+        for name, package in self.packages.items():
+            indexed = self._indexed.get(name)
+            if indexed is not None and indexed[1] == package._revision:
+                continue
+            self._unindex_package(name)
+            self._index_package(name, package)
+
+    def _is_unmodified(self, file: str) -> bool:
+        """
+        Returns True if the given file matches any checksum recorded for it, which is only computed if it matches none
+        of the fingerprints recorded for it.
+        """
+        path = self.resolve(file)
+        fingerprints = self._file_fingerprints.get(file)
+        if fingerprints and FileFingerprint.from_path(path) in fingerprints:
+            return True
+        chks = self._file_checksums[file]
+        if isinstance(chks, bytes):
+            chks = (chks,)
+        curr_chks = file_checksums(path, (packed_algorithm(chk) for chk in chks))
+        return any(pack_checksum(chk) in chks for chk in curr_chks.values())
 
     def deepcopy(self) -> "Manifest":
         return deepcopy(self)
 
+    @classmethod
+    def from_trusted(cls, raw: Dict[str, Any]) -> "Manifest":
+        """
+        Creates a manifest from JSON written by Packman, without validating it.
+        """
+        manifest = cls.construct(
+            version=raw["version"],
+            packages={
+                name: ManifestPackage.from_trusted(package)
+                for name, package in raw.get("packages", {}).items()
+            },
+            file_map=raw.get("file_map", {}),
+            original_files=raw.get("original_files", {}),
+            orphaned_files=set(raw.get("orphaned_files", ())),
+        )
+        manifest._init_state()
+        return manifest
+
+    def to_trusted(self) -> Dict[str, Any]:
+        """
+        Returns the manifest as JSON-serialisable data which can be loaded by from_trusted.
+        """
+        return {
+            "version": _MANIFEST_VERSION,
+            "packages": {
+                name: package.to_trusted() for name, package in self.packages.items()
+            },
+            "file_map": dict(self.file_map),
+            "original_files": self.original_files,
+            "orphaned_files": list(self.orphaned_files),
+        }
+
     def add_package(
         self,
         name: str,
@@ -174,11 +521,37 @@ class Manifest(BaseModelWithPrivateAttributes):
         version: Optional[str] = None,
         options: Iterable[str],
         files: Iterable[str],
+        checksums: Optional[Dict[str, str]] = None,
     ) -> ManifestPackage:
+        """
+        Adds a package, replacing any existing package of the same name; paths given are file-system paths, which are
+        stored relative to the manifest's root.
+
+        :param checksums: Checksums already computed for some or all of the package's files, so that they need not be
+        computed again when the manifest is next updated.
+        """
         package = self.packages[name] = ManifestPackage(
-            version=version, options=options, files=files
+            version=version,
+            options=options,
+            files=[self.relativise(file) for file in files],
         )
         package._root_path = self._root_path
+        if checksums:
+            package.add_checksums(
+                {self.relativise(file): chk for file, chk in checksums.items()}
+            )
+        self._unindex_package(name)
+        self._index_package(name, package)
+        return package
+
+    def remove_package(self, name: str) -> Optional[ManifestPackage]:
+        """
+        Removes the given package from the manifest; its files are cleaned up by the next cleanup.
+
+        :returns: The removed package, or None if it was not installed.
+        """
+        package = self.packages.pop(name, None)
+        self._unindex_package(name)
         return package
 
     def cleanup_files(self, remove_orphans: bool = False) -> None:
@@ -186,38 +559,31 @@ class Manifest(BaseModelWithPrivateAttributes):
         Deletes files that have been removed from the manifest since the last cleanup, or since the Manifest was
         instantiated if no previous cleanups.
 
-        Rebuilds file_map and orphaned_files.
+        Only files whose ownership has changed since the last cleanup are considered.
         """
-
-        new_file_map: Dict[str, List[str]] = {}
-        for name, package in self.packages.items():
-            for file in package.files:
-                file = os.path.normpath(file)
-                if file in self.orphaned_files:
-                    self.orphaned_files.remove(file)
-                if file not in new_file_map:
-                    new_file_map[file] = [name]
-                else:
-                    new_file_map[file].append(name)
-
-        for file in self.file_map:
-            if file not in new_file_map:
-                curr_chk = checksum(file)
-                if remove_orphans or any(
-                    chk == curr_chk
-                    for chk in self._file_checksums[os.path.normpath(file)]
-                ):
-                    logger.debug(f"cleaning up {file}")
+        self._update_index()
+
+        for file, was_claimed in list(self._pending.items()):
+            if file in self.file_map:
+                self.orphaned_files.discard(file)
+            elif was_claimed:
+                path = self.resolve(file)
+                if remove_orphans or self._is_unmodified(file):
+                    logger.debug(f"cleaning up {path}")
                     if file in self.original_files:
-                        shutil.copy2(self.original_files[file], file)
-                        remove_path(self.original_files[file])
+                        # Moved back rather than written through, as the installed file may share its inode
+                        copy_file(self.original_files[file], path, move=True)
                         del self.original_files[file]
                     else:
-                        remove_path(file)
+                        remove_path(path)
                 else:
-                    logger.debug(f"found orphan {file}")
+                    logger.debug(f"found orphan {path}")
                     self.orphaned_files.add(file)
                 # TODO fix issue where files are not being recognised as orphan
+            if file not in self.file_map:
+                self._file_checksums.pop(file, None)
+                self._file_fingerprints.pop(file, None)
+            del self._pending[file]
 
         if remove_orphans:
             for file in self.orphaned_files:
@@ -225,67 +591,85 @@ class Manifest(BaseModelWithPrivateAttributes):
                 remove_path(self.original_files[file])
             self.orphaned_files.clear()
 
-        self.file_map = new_file_map
-
     def update_checksums(self) -> None:
         """
         Computes uncomputed package checksums; does not recompute pre-existing checksums.
         """
         for package in self.packages.values():
             package.compute_checksums()
-        self._update_checksum_map()
+        self._update_index()
 
     def write_json(self, path: str) -> None:
         """
         Writes the manifest in JSON format to the given path.
 
-        File paths stored within the manifest will reflect the relative path of the path given.
+        File paths stored within the manifest will reflect the relative path of the path given; they are only rewritten
+        if it is not in the manifest's root.
+
+        The manifest is streamed to a temporary file in compact form, which is flushed to stable storage before it
+        replaces the given path, so that a crash leaves either the old or the new manifest in place.
         """
         path_dir = os.path.normpath(os.path.dirname(path))
         if path_dir != ".":
             os.makedirs(path_dir, exist_ok=True)
-        with open(path, "w") as fp:
-            if path_dir != ".":
-                clone = self.deepcopy()
-                clone.update_path_root(".")
-                fp.write(clone.json(indent=2))
-            else:
-                fp.write(self.json(indent=2))
+        manifest = self
+        if path_dir != self._root_path:
+            manifest = self.deepcopy()
+            manifest.update_path_root(path_dir)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(manifest.to_trusted(), fp, separators=(",", ":"))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+        fsync_dir(path_dir)
 
     def update_path_root(self, root_path: str) -> None:
         """
         Updates the paths to be relative to a new root assuming the manifest's files remain at the same absolute path
         in the file-system.
         """
+        root_path = os.path.normpath(root_path)
+        if root_path == self._root_path:
+            return
 
-        for package in self.packages.values():
-            package.update_path_root(root_path)
-
-        new_file_map: Dict[str, List[str]] = {}
-        for file, packages in self.file_map.items():
-            new_file = replace_root_path(
-                path=file, new_root_path=root_path, old_root_path=self._root_path
+        def reroot(path: str) -> str:
+            return replace_root_path(
+                path=path, new_root_path=root_path, old_root_path=self._root_path
             )
-            new_file_map[new_file] = packages
-        self.file_map = new_file_map
 
-        new_orphaned_files: Set[str] = set()
-        for file in self.orphaned_files:
-            new_file = replace_root_path(
-                path=file, new_root_path=root_path, old_root_path=self._root_path
-            )
-            new_orphaned_files.add(new_file)
-        self.orphaned_files = new_orphaned_files
+        # Packages changed since they were indexed must still be re-indexed afterwards
+        stale = {
+            name
+            for name, (package, revision, _) in self._indexed.items()
+            if package._revision != revision
+        }
+        for package in self.packages.values():
+            package.update_path_root(root_path)
 
-        new_original_files: Dict[str, str] = {}
-        for file, value in self.original_files.items():
-            new_file = replace_root_path(
-                path=file, new_root_path=root_path, old_root_path=self._root_path
+        self.file_map = self.file_map.remap(reroot)
+        self.orphaned_files = {reroot(file) for file in self.orphaned_files}
+        self.original_files = {
+            reroot(file): value for file, value in self.original_files.items()
+        }
+        self._file_checksums = {
+            reroot(file): chks for file, chks in self._file_checksums.items()
+        }
+        self._file_fingerprints = {
+            reroot(file): fingerprints
+            for file, fingerprints in self._file_fingerprints.items()
+        }
+        self._pending = {
+            reroot(file): was_claimed for file, was_claimed in self._pending.items()
+        }
+        self._indexed = {
+            name: (
+                package,
+                -1 if name in stale else package._revision,
+                tuple(reroot(file) for file in files),
             )
-            new_original_files[file] = value
-        self.original_files = new_original_files
-
-        self._update_checksum_map()
+            for name, (package, _, files) in self._indexed.items()
+        }
         self._root_path = root_path
 
     def update_files(
@@ -305,25 +689,81 @@ class Manifest(BaseModelWithPrivateAttributes):
         step_progress.advance()
         self.update_checksums()
         step_progress.advance()
-        self.write_json(path=path)
+        self.save(path=path)
         step_progress.advance()
 
+    def save(self, path: str) -> None:
+        """
+        Writes the manifest to the given path, in a SQLite database if the path has a database extension such as .db,
+        or in JSON format otherwise.
+        """
+        # Imported here as the database module depends on this one
+        from packman.models.manifest_db import ManifestDatabase, is_database_path
+
+        if is_database_path(path):
+            ManifestDatabase(path).save(self)
+        else:
+            self.write_json(path=path)
+            for package in self.packages.values():
+                package._dirty = False
+
     @staticmethod
-    def from_json(path: str, update_root: bool = True) -> "Manifest":
+    def load(path: str, validate: bool = False) -> "Manifest":
+        """
+        Loads the manifest at the given path, from a SQLite database if the path has a database extension such as .db,
+        or in JSON format otherwise. If the database does not exist yet but a JSON manifest of the same name does, the
+        JSON manifest is migrated into the database.
+
+        :param validate: If True, JSON manifests are validated even if they were written by this version of Packman.
+        """
+        from packman.models.manifest_db import (
+            ManifestDatabase,
+            is_database_path,
+            json_path,
+        )
+
+        if not is_database_path(path):
+            return Manifest.from_json(path, validate=validate)
+        database = ManifestDatabase(path)
+        if not database.exists() and os.path.exists(json_path(path)):
+            return database.migrate_from_json(json_path(path), validate=validate)
+        return database.load()
+
+    @staticmethod
+    def from_json(
+        path: str, update_root: bool = True, validate: bool = False
+    ) -> "Manifest":
         """
         Creates a new instance of a Manifest, loaded from the given path. If the path does not exist, creates an empty
         Manifest.
+
+        Manifests written by this version of Packman are trusted and loaded without validation, unless validate is True
+        or they turn out to be malformed.
+
+        :param update_root: If True, the manifest's root is the directory containing the path; otherwise, it is the
+        current directory.
         """
         try:
             with open(path, "r") as fp:
                 raw = json.load(fp)
-                manifest = Manifest(**raw)
         except FileNotFoundError:
             manifest = Manifest()
+        else:
+            manifest = None
+            if not validate and raw.get("version") == _MANIFEST_VERSION:
+                try:
+                    manifest = Manifest.from_trusted(raw)
+                except (KeyError, TypeError, ValueError, AttributeError) as exc:
+                    logger.warning(f"validating malformed manifest {path}: {exc}")
+            if manifest is None:
+                manifest = Manifest(**raw)
+                # Rewritten in the current format when next saved
+                manifest.version = _MANIFEST_VERSION
 
         if update_root:
-            path_dir = os.path.dirname(path)
-            if os.path.normpath(path_dir) != ".":
-                manifest.update_path_root(path_dir)
+            manifest._set_root_path(os.path.normpath(os.path.dirname(path)))
 
         return manifest
+
+    class Config:
+        json_encoders = {ChecksumMap: dict, FileMap: dict}
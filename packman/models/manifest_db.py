@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from packman.models.manifest import (
+    _MANIFEST_VERSION,
+    Manifest,
+    ManifestPackage,
+    replace_root_path,
+)
+
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    version TEXT,
+    options TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    package TEXT NOT NULL REFERENCES packages (name) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    checksum TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    device INTEGER,
+    PRIMARY KEY (package, path)
+);
+CREATE TABLE IF NOT EXISTS original_files (
+    path TEXT PRIMARY KEY,
+    backup_path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orphaned_files (
+    path TEXT PRIMARY KEY
+);
+"""
+
+_DATABASE_EXTS = (".db", ".sqlite", ".sqlite3")
+
+_FileRow = Tuple[
+    str,
+    str,
+    Optional[str],
+    Optional[int],
+    Optional[int],
+    Optional[int],
+    Optional[int],
+]
+
+
+def is_database_path(path: str) -> bool:
+    """
+    Returns True if the manifest at the given path should be kept in a SQLite database rather than a JSON file.
+    """
+    return os.path.splitext(path)[1].lower() in _DATABASE_EXTS
+
+
+def json_path(path: str) -> str:
+    """
+    Returns the path of the JSON manifest which a SQLite manifest at the given path is migrated from.
+    """
+    return f"{os.path.splitext(path)[0]}.json"
+
+
+class ManifestDatabase:
+    """
+    Keeps a manifest in a SQLite database, so that packages can be written individually rather than rewriting the whole
+    manifest.
+
+    As with JSON manifests, file paths are stored relative to the directory containing the database, which is the root
+    of manifests loaded from it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.root_path = os.path.normpath(os.path.dirname(path))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.root_path != ".":
+            os.makedirs(self.root_path, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(_SCHEMA)
+        conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (str(_SCHEMA_VERSION),),
+        )
+        return conn
+
+    def load(self) -> Manifest:
+        """
+        Loads the manifest from the database.
+        """
+        with closing(self._connect()) as conn:
+            files: Dict[str, List[_FileRow]] = {}
+            for row in conn.execute(
+                "SELECT package, path, checksum, size, mtime_ns, inode, device FROM files"
+            ):
+                files.setdefault(row[0], []).append(row)
+
+            packages: Dict[str, Dict[str, Any]] = {}
+            for name, version, options in conn.execute(
+                "SELECT name, version, options FROM packages ORDER BY rowid"
+            ):
+                packages[name] = self._load_package(
+                    version, options, files.get(name, ())
+                )
+
+            original_files = dict(
+                conn.execute("SELECT path, backup_path FROM original_files")
+            )
+            orphaned_files = {
+                path for path, in conn.execute("SELECT path FROM orphaned_files")
+            }
+
+        # Written only by Packman, so trusted as JSON manifests of the current version are
+        manifest = Manifest.from_trusted(
+            {
+                "version": _MANIFEST_VERSION,
+                "packages": packages,
+                "original_files": original_files,
+                "orphaned_files": orphaned_files,
+            }
+        )
+        manifest._set_root_path(self.root_path)
+        for package in manifest.packages.values():
+            package._dirty = False
+        return manifest
+
+    def _load_package(
+        self, version: Optional[str], options: str, rows: Iterable[_FileRow]
+    ) -> Dict[str, Any]:
+        files: List[str] = []
+        checksums: Dict[str, str] = {}
+        fingerprints: Dict[str, Dict[str, Optional[int]]] = {}
+        for _, file, chk, size, mtime_ns, inode, device in rows:
+            files.append(file)
+            if chk is not None:
+                checksums[file] = chk
+            if size is not None:
+                fingerprints[file] = {
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "inode": inode,
+                    "device": device,
+                }
+        # In the form written by ManifestPackage.to_trusted
+        return {
+            "version": version,
+            "options": json.loads(options),
+            "files": files,
+            "checksums": checksums,
+            "fingerprints": fingerprints,
+        }
+
+    def save(self, manifest: Manifest) -> None:
+        """
+        Writes the manifest to the database in a single transaction, rewriting only the packages which have changed
+        since it was loaded or last saved and removing those which are no longer in it.
+        """
+        old_root_path = manifest._root_path
+
+        def to_key(file: str) -> str:
+            if old_root_path == self.root_path:
+                return file
+            return replace_root_path(
+                path=file, new_root_path=self.root_path, old_root_path=old_root_path
+            )
+
+        with closing(self._connect()) as conn, conn:
+            saved = {name for name, in conn.execute("SELECT name FROM packages")}
+            for name in saved - set(manifest.packages):
+                logger.debug(f"removing {name} from manifest database")
+                conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+
+            for name, package in manifest.packages.items():
+                if name in saved and not package._dirty:
+                    continue
+                logger.debug(f"writing {name} to manifest database")
+                conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+                conn.execute(
+                    "INSERT INTO packages (name, version, options) VALUES (?, ?, ?)",
+                    (name, package.version, json.dumps(sorted(package.options))),
+                )
+                conn.executemany(
+                    "INSERT INTO files (package, path, checksum, size, mtime_ns, inode, device)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._package_rows(name, package, to_key),
+                )
+
+            conn.execute("DELETE FROM original_files")
+            conn.executemany(
+                "INSERT INTO original_files (path, backup_path) VALUES (?, ?)",
+                (
+                    (to_key(file), backup_path)
+                    for file, backup_path in manifest.original_files.items()
+                ),
+            )
+            conn.execute("DELETE FROM orphaned_files")
+            conn.executemany(
+                "INSERT INTO orphaned_files (path) VALUES (?)",
+                ((to_key(file),) for file in manifest.orphaned_files),
+            )
+
+        for package in manifest.packages.values():
+            package._dirty = False
+
+    def _package_rows(
+        self, name: str, package: ManifestPackage, to_key: Callable[[str], str]
+    ) -> Iterable[_FileRow]:
+        for file in package.files:
+            fingerprint = package.fingerprints.get(file)
+            yield (
+                name,
+                to_key(file),
+                package.checksums.get(file),
+                fingerprint.size if fingerprint else None,
+                fingerprint.mtime_ns if fingerprint else None,
+                fingerprint.inode if fingerprint else None,
+                fingerprint.device if fingerprint else None,
+            )
+
+    def migrate_from_json(self, path: str, validate: bool = False) -> Manifest:
+        """
+        Imports the JSON manifest at the given path into this database, keeping the JSON manifest as a backup with a
+        .bak suffix, and returns the manifest.
+
+        :param validate: If True, the JSON manifest is validated even if it was written by this version of Packman.
+        """
+        logger.info(f"migrating manifest {path} to {self.path}")
+        manifest = Manifest.from_json(path, validate=validate)
+        for package in manifest.packages.values():
+            package._dirty = True
+        self.save(manifest)
+        os.replace(path, f"{path}.bak")
+        return manifest
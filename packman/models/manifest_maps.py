@@ -0,0 +1,202 @@
+import sys
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Tuple,
+    Union,
+)
+
+from packman.utils.hashing import pack_checksum, unpack_checksum
+
+
+class ChecksumMap(MutableMapping[str, str]):
+    """
+    Maps files to checksums in "<algorithm>:<hex digest>" form, keeping each checksum as a packed binary digest, which
+    takes around half the memory.
+    """
+
+    def __init__(
+        self, checksums: Union[Mapping[str, str], Iterable[Tuple[str, str]]] = ()
+    ) -> None:
+        self._packed: Dict[str, bytes] = {}
+        self.update(checksums)
+
+    @classmethod
+    def from_packed(cls, packed: Iterable[Tuple[str, bytes]]) -> "ChecksumMap":
+        checksums = cls()
+        checksums._packed.update(packed)
+        return checksums
+
+    def __getitem__(self, file: str) -> str:
+        return unpack_checksum(self._packed[file])
+
+    def __setitem__(self, file: str, chk: str) -> None:
+        self._packed[file] = pack_checksum(chk)
+
+    def __delitem__(self, file: str) -> None:
+        del self._packed[file]
+
+    def __contains__(self, file: object) -> bool:
+        return file in self._packed
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._packed)
+
+    def __len__(self) -> int:
+        return len(self._packed)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def packed_items(self) -> Iterable[Tuple[str, bytes]]:
+        """
+        Returns each file with its checksum in packed form, without unpacking it.
+        """
+        return self._packed.items()
+
+    def remap(self, func: Callable[[str], str]) -> "ChecksumMap":
+        """
+        Returns a copy with each file replaced by the result of the given function.
+        """
+        return ChecksumMap.from_packed(
+            (func(file), packed) for file, packed in self._packed.items()
+        )
+
+    @classmethod
+    def __get_validators__(cls) -> Iterator[Callable[[Any], "ChecksumMap"]]:
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value: Any) -> "ChecksumMap":
+        if isinstance(value, cls):
+            return value
+        if not isinstance(value, Mapping):
+            raise TypeError("checksums must be a mapping")
+        return cls((sys.intern(str(file)), str(chk)) for file, chk in value.items())
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        field_schema.update(type="object", additionalProperties={"type": "string"})
+
+
+class FileMap(MutableMapping[str, List[str]]):
+    """
+    Maps files to the names of the packages which claim them, keeping each package as an integer id rather than a list
+    of names per file.
+
+    Lists returned are copies; use add_owner and remove_owner to change a file's owners.
+    """
+
+    def __init__(
+        self,
+        owners: Union[Mapping[str, List[str]], Iterable[Tuple[str, List[str]]]] = (),
+    ) -> None:
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        # Files owned by a single package, by far the most common case, map straight to its id
+        self._owners: Dict[str, Union[int, Tuple[int, ...]]] = {}
+        self.update(owners)
+
+    def _id(self, name: str) -> int:
+        id = self._ids.get(name)
+        if id is None:
+            id = self._ids[name] = len(self._names)
+            self._names.append(name)
+        return id
+
+    def __getitem__(self, file: str) -> List[str]:
+        ids = self._owners[file]
+        if isinstance(ids, int):
+            return [self._names[ids]]
+        return [self._names[id] for id in ids]
+
+    def __setitem__(self, file: str, names: List[str]) -> None:
+        ids = tuple(self._id(name) for name in names)
+        self._owners[file] = ids[0] if len(ids) == 1 else ids
+
+    def __delitem__(self, file: str) -> None:
+        del self._owners[file]
+
+    def __contains__(self, file: object) -> bool:
+        return file in self._owners
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._owners)
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def add_owner(self, file: str, name: str) -> bool:
+        """
+        Records the given package as claiming the given file.
+
+        :returns: True if the file was not previously claimed.
+        """
+        id = self._id(name)
+        ids = self._owners.get(file)
+        if ids is None:
+            self._owners[file] = id
+            return True
+        self._owners[file] = (ids, id) if isinstance(ids, int) else ids + (id,)
+        return False
+
+    def remove_owner(self, file: str, name: str) -> bool:
+        """
+        Records the given package as no longer claiming the given file.
+
+        :returns: True if the file is no longer claimed by any package.
+        """
+        id = self._ids[name]
+        ids = self._owners[file]
+        if isinstance(ids, int):
+            ids = () if ids == id else (ids,)
+        else:
+            remaining = list(ids)
+            remaining.remove(id)
+            ids = tuple(remaining)
+        if not ids:
+            del self._owners[file]
+            return True
+        self._owners[file] = ids[0] if len(ids) == 1 else ids
+        return False
+
+    def remap(self, func: Callable[[str], str]) -> "FileMap":
+        """
+        Returns a copy with each file replaced by the result of the given function.
+        """
+        file_map = FileMap()
+        file_map._ids = dict(self._ids)
+        file_map._names = list(self._names)
+        file_map._owners = {func(file): ids for file, ids in self._owners.items()}
+        return file_map
+
+    @classmethod
+    def __get_validators__(cls) -> Iterator[Callable[[Any], "FileMap"]]:
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value: Any) -> "FileMap":
+        if isinstance(value, cls):
+            return value
+        if not isinstance(value, Mapping):
+            raise TypeError("file map must be a mapping")
+        return cls(
+            (sys.intern(str(file)), [str(name) for name in names])
+            for file, names in value.items()
+        )
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        field_schema.update(
+            type="object",
+            additionalProperties={"type": "array", "items": {"type": "string"}},
+        )
@@ -1,11 +1,13 @@
 import base64
 import json
 import os
+from functools import cached_property
 from typing import Any, Dict, Iterable, List, Optional
 from urllib import parse as urlparse
 
 from loguru import logger
 from packman.api.http import HTTPAPI
+from packman.api.metadata_cache import FOREVER
 from packman.models.package_source import BasePackageSource, PackageVersion
 from packman.utils.operation import Operation
 from packman.utils.progress import ProgressCallback, StepProgress, progress_noop
@@ -44,7 +46,8 @@ class RepositoryAPI(HTTPAPI):
         return self.get(f"releases/{release_id}/assets", per_page=per_page, page=page)
 
     def get_release_by_tag_name(self, tag: str) -> Dict[str, Any]:
-        return self.get(f"releases/tags/{tag}", use_cache=True)
+        # Tagged releases don't change, so never need revalidating
+        return self.get(f"releases/tags/{tag}", ttl=FOREVER)
 
     def get_latest_release(self) -> Dict[str, Any]:
         return self.get("releases/latest")
@@ -107,9 +110,13 @@ class GitHubPackageSource(BasePackageSource):
         extra={"examples": ["octocat/Hello-World"]},
     )
 
-    def get_api(self) -> RepositoryAPI:
+    @cached_property
+    def _api(self) -> RepositoryAPI:
         return RepositoryAPI(self.repository)
 
+    def get_api(self) -> RepositoryAPI:
+        return self._api
+
     def get_version(self, version: str) -> PackageVersion:
         api = self.get_api()
         release = api.get_release_by_tag_name(tag=version)
@@ -123,7 +130,7 @@ class GitHubPackageSource(BasePackageSource):
         on_progress: ProgressCallback = progress_noop,
     ) -> None:
         on_step_progress = StepProgress.from_step_count(
-            step_count=1, on_progress=on_progress
+            step_count=2, on_progress=on_progress
         )
 
         api = self.get_api()
@@ -143,8 +150,9 @@ class GitHubPackageSource(BasePackageSource):
         url = asset["browser_download_url"]
 
         zip_path = operation.download_file(url, on_progress=on_step_progress)
-        operation.extract_archive(zip_path)
-        operation.remove_file(zip_path)
+        on_step_progress.advance()
+        operation.unpack_archive(zip_path, on_progress=on_step_progress)
+        on_step_progress.advance()
 
     def get_latest_version(self) -> PackageVersion:
         api = self.get_api()
@@ -1,6 +1,6 @@
 from packman.models.package_source import BaseUnversionedPackageSource, PackageVersion
 from packman.utils.operation import Operation
-from packman.utils.progress import ProgressCallback, progress_noop
+from packman.utils.progress import ProgressCallback, StepProgress, progress_noop
 from pydantic import AnyHttpUrl, Field
 
 
@@ -27,9 +27,13 @@ class LinkPackageSource(BaseUnversionedPackageSource):
         operation: Operation,
         on_progress: ProgressCallback = progress_noop,
     ) -> None:
-        zip_path = operation.download_file(self.url, on_progress=on_progress)
-        operation.extract_archive(zip_path)
-        operation.remove_file(zip_path)
+        on_step_progress = StepProgress.from_step_count(
+            step_count=2, on_progress=on_progress
+        )
+        zip_path = operation.download_file(self.url, on_progress=on_step_progress)
+        on_step_progress.advance()
+        operation.unpack_archive(zip_path, on_progress=on_step_progress)
+        on_step_progress.advance()
 
     class Config:
         schema_extra = {
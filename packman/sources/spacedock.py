@@ -111,7 +111,7 @@ class SpaceDockPackageSource(BasePackageSource):
         on_progress: ProgressCallback = progress_noop,
     ) -> None:
         on_step_progress = StepProgress.from_step_count(
-            step_count=3, on_progress=on_progress
+            step_count=2, on_progress=on_progress
         )
 
         mod_version = self._api.mod.get_version(friendly_version=version)
@@ -123,10 +123,7 @@ class SpaceDockPackageSource(BasePackageSource):
         )
         on_step_progress.advance()
 
-        operation.extract_archive(path)
-        on_step_progress.advance()
-
-        operation.remove_file(path)
+        operation.unpack_archive(path, on_progress=on_step_progress)
         on_step_progress.advance()
 
     def get_latest_version(self) -> PackageVersion:
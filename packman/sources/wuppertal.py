@@ -6,7 +6,8 @@ from packman.api.http import HTTPAPI
 from packman.models.package_source import (BaseUnversionedPackageSource,
                                            PackageVersion)
 from packman.utils.operation import Operation
-from packman.utils.progress import ProgressCallback, progress_noop
+from packman.utils.progress import (ProgressCallback, StepProgress,
+                                    progress_noop)
 from pydantic import BaseModel, Field
 
 _API_URL = "https://launcher.emergency-wuppertal.de/api/public/v1/"
@@ -77,9 +78,13 @@ class WuppertalPackageSource(BaseUnversionedPackageSource):
     ) -> None:
         latest_ver = api.get_latest_version()
         download_url = api.get_download_url(latest_ver.id)
-        zip_path = operation.download_file(download_url, on_progress=on_progress)
-        operation.extract_archive(zip_path)
-        operation.remove_file(zip_path)
+        on_step_progress = StepProgress.from_step_count(
+            step_count=2, on_progress=on_progress
+        )
+        zip_path = operation.download_file(download_url, on_progress=on_step_progress)
+        on_step_progress.advance()
+        operation.unpack_archive(zip_path, on_progress=on_step_progress)
+        on_step_progress.advance()
 
 
 if __name__ == "__main__":
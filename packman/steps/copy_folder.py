@@ -1,12 +1,13 @@
 import os
 from glob import iglob
 from pathlib import Path, PurePath
-from typing import Dict, Iterable, List, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from loguru import logger
 from packman.models.install_step import BaseInstallStep
+from packman.utils.archive import ArchiveIndex
 from packman.utils.operation import Operation
-from packman.utils.progress import ProgressCallback, StepProgress, progress_noop
+from packman.utils.progress import ProgressCallback, progress_noop
 from pydantic import Field
 
 
@@ -62,16 +63,16 @@ class CopyFolderInstallStep(BaseInstallStep):
             found_paths.add(normpath)
             yield normpath
 
-    def do_execute(
-        self,
-        operation: Operation,
-        package_path: str,
-        root_dir: str,
-        on_progress: ProgressCallback = progress_noop,
-    ) -> None:
+    def get_files(
+        self, package_path: str, root_dir: str
+    ) -> Tuple[Set[str], Dict[str, str]]:
+        """
+        Returns the destination directories to create and a dictionary of each file to copy to its destination.
+        """
         src = self.iter_src(package_path=package_path)
         dest = os.path.join(root_dir, self.dest)
 
+        dirs: Set[str] = set()
         files_to_copy: Dict[str, str] = {}
         for folder in src:
             if files_to_copy:
@@ -81,7 +82,7 @@ class CopyFolderInstallStep(BaseInstallStep):
             for root, _, files in os.walk(folder):
                 root_relpath = os.path.relpath(root, folder)
                 dest_root = os.path.join(dest, root_relpath)
-                Path(dest_root).mkdir(parents=True, exist_ok=True)
+                dirs.add(dest_root)
                 for file in files:
                     file_src = os.path.join(root, file)
                     if self.exclude:
@@ -91,18 +92,104 @@ class CopyFolderInstallStep(BaseInstallStep):
                             continue
                     file_dest = os.path.join(dest_root, file)
                     files_to_copy[file_src] = file_dest
+        return dirs, files_to_copy
+
+    def do_plan(self, package_path: str, root_dir: str) -> Optional[Set[str]]:
+        _, files_to_copy = self.get_files(
+            package_path=package_path, root_dir=root_dir
+        )
+        return set(files_to_copy.values())
+
+    def do_execute(
+        self,
+        operation: Operation,
+        package_path: str,
+        root_dir: str,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> None:
+        dirs, files_to_copy = self.get_files(
+            package_path=package_path, root_dir=root_dir
+        )
+        for dir in dirs:
+            Path(dir).mkdir(parents=True, exist_ok=True)
 
         if not files_to_copy:
             logger.warning(f"no files to copy: {self.glob}")
             return
 
-        on_step_progress = StepProgress.from_step_count(
-            step_count=len(files_to_copy), on_progress=on_progress
+        operation.copy_files(files_to_copy, on_progress=on_progress)
+
+    def iter_archive_src(self, archive: ArchiveIndex) -> Iterable[str]:
+        found_paths: Set[str] = set()
+        for path in archive.iglob(self.glob):
+            if not archive.is_dir(path):
+                continue
+
+            # Ignore children of previously matched paths
+            if any(
+                (
+                    path.startswith(f"{other_path}/") or not other_path
+                    for other_path in found_paths
+                )
+            ):
+                continue
+
+            found_paths.add(path)
+            yield path
+
+    def get_archive_files(
+        self, archive: ArchiveIndex, root_dir: str
+    ) -> Tuple[Set[str], Dict[str, str]]:
+        """
+        As get_files, but returns a dictionary of each archive member to extract to its destination.
+        """
+        src = self.iter_archive_src(archive=archive)
+        dest = os.path.join(root_dir, self.dest)
+
+        dirs: Set[str] = set()
+        files_to_extract: Dict[str, str] = {}
+        for folder in src:
+            if files_to_extract:
+                raise FileExistsError(
+                    f"multiple folders found matching glob: {self.glob}"
+                )
+            for dir_relpath in archive.walk_dirs(folder):
+                dirs.add(os.path.join(dest, *dir_relpath.split("/")))
+            for file_relpath, name in archive.walk_files(folder):
+                if self.exclude:
+                    pure_path = PurePath(file_relpath)
+                    if any(pure_path.match(pattern) for pattern in self.exclude):
+                        continue
+                file_dest = os.path.join(dest, *file_relpath.split("/"))
+                files_to_extract[name] = file_dest
+        return dirs, files_to_extract
+
+    def do_plan_archive(
+        self, archive: ArchiveIndex, root_dir: str
+    ) -> Optional[Set[str]]:
+        _, files_to_extract = self.get_archive_files(
+            archive=archive, root_dir=root_dir
+        )
+        return set(files_to_extract.values())
+
+    def do_execute_archive(
+        self,
+        operation: Operation,
+        archive: ArchiveIndex,
+        root_dir: str,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> None:
+        dirs, files_to_extract = self.get_archive_files(
+            archive=archive, root_dir=root_dir
         )
+        for dir in dirs:
+            Path(dir).mkdir(parents=True, exist_ok=True)
+
+        if not files_to_extract:
+            logger.warning(f"no files to copy: {self.glob}")
+            return
 
-        for file_src, file_dest in files_to_copy.items():
-            operation.copy_file(file_src, file_dest)
-            on_step_progress.advance()
+        operation.extract_files(archive, files_to_extract, on_progress=on_progress)
 
     class Config:
         schema_extra = {
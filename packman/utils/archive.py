@@ -0,0 +1,398 @@
+import hashlib
+import os
+import posixpath
+import stat
+import tarfile
+import zipfile
+from datetime import datetime
+from fnmatch import fnmatch
+from glob import has_magic
+from threading import Lock, local
+from types import TracebackType
+from typing import IO, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+import patoolib
+from loguru import logger
+from packman.utils.concurrency import run_parallel
+from packman.utils.files import remove_path, temp_path
+from packman.utils.progress import ByteProgress, ProgressCallback, progress_noop
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Whether file names on this platform are matched case-insensitively, as on Windows
+_CASE_INSENSITIVE = os.path.normcase("A") == "a"
+
+# ZipInfo.create_system value for archives created on Unix-like systems
+_ZIP_SYSTEM_UNIX = 3
+
+
+def _safe_join(root: str, name: str) -> str:
+    """
+    Joins an archive member name onto root, refusing names which would escape root.
+    """
+    path = os.path.normpath(os.path.join(root, name))
+    abs_root = os.path.abspath(root)
+    if os.path.commonpath((abs_root, os.path.abspath(path))) != abs_root:
+        raise ValueError(f"archive member outside of destination: {name}")
+    return path
+
+
+class HashingWriter:
+    """
+    Wraps a binary file, hashing everything written to it.
+    """
+
+    def __init__(self, fp: IO[bytes]) -> None:
+        self.fp = fp
+        self.hash = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.hash.update(data)
+        return self.fp.write(data)
+
+
+def copy_stream(
+    src: IO[bytes], dest: IO[bytes], on_chunk: Optional[ProgressCallback] = None
+) -> None:
+    """
+    Copies the remaining contents of one binary stream to another, calling on_chunk with the size of each chunk.
+    """
+    buffer = bytearray(_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        size = src.readinto(view)  # type: ignore
+        if not size:
+            break
+        dest.write(view[:size])
+        if on_chunk is not None:
+            on_chunk(size)
+
+
+class _ZipHandles:
+    """
+    Lazily opens one handle to a zip file per thread, as a ZipFile cannot be safely read from several threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = local()
+        self._handles: List[zipfile.ZipFile] = []
+        self._lock = Lock()
+
+    def get(self) -> zipfile.ZipFile:
+        handle = getattr(self._local, "handle", None)
+        if handle is None:
+            handle = self._local.handle = zipfile.ZipFile(self.path)
+            with self._lock:
+                self._handles.append(handle)
+        return handle
+
+    def close(self) -> None:
+        with self._lock:
+            for handle in self._handles:
+                handle.close()
+            self._handles.clear()
+
+
+def extract_zip_member(
+    archive: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    dest: str,
+    on_chunk: Optional[ProgressCallback] = None,
+) -> str:
+    """
+    Extracts a single zip member to the given file path, preserving its modification time and executable bits.
+
+    :returns: The hex SHA-256 digest of the member's contents, hashed as it is extracted.
+    """
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    with archive.open(info) as src, open(dest, "wb") as dest_fp:
+        writer = HashingWriter(dest_fp)
+        copy_stream(src, writer, on_chunk=on_chunk)  # type: ignore
+    try:
+        mtime = datetime(*info.date_time).timestamp()
+    except (ValueError, OverflowError):
+        # e.g. a zero DOS date, which unzip also leaves alone
+        logger.debug(f"ignoring invalid modification time of {info.filename}")
+    else:
+        os.utime(dest, (mtime, mtime))
+    if info.create_system == _ZIP_SYSTEM_UNIX:
+        mode = (info.external_attr >> 16) & 0o777
+        if mode & stat.S_IXUSR:
+            os.chmod(dest, mode)
+    return writer.hash.hexdigest()
+
+
+def _extract_zip(
+    path: str, outdir: str, on_progress: ProgressCallback, max_workers: Optional[int]
+) -> Dict[str, str]:
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+
+    # Keyed by destination so that of duplicate members, the last wins as when extracting sequentially
+    members: Dict[str, zipfile.ZipInfo] = {}
+    for info in infos:
+        dest = _safe_join(outdir, info.filename)
+        if info.is_dir():
+            os.makedirs(dest, exist_ok=True)
+        else:
+            members[dest] = info
+    files = list(members.values())
+
+    progress = ByteProgress(
+        total=sum(info.file_size for info in files), on_progress=on_progress
+    )
+    handles = _ZipHandles(path)
+    digests: Dict[str, str] = {}
+
+    def extract(info: zipfile.ZipInfo) -> None:
+        dest = _safe_join(outdir, info.filename)
+        digests[dest] = extract_zip_member(
+            handles.get(), info, dest, on_chunk=progress.advance
+        )
+
+    try:
+        # Largest members first so that one huge file doesn't start last and hold up the rest
+        run_parallel(
+            extract,
+            sorted(files, key=lambda info: info.file_size, reverse=True),
+            max_workers=max_workers,
+        )
+    finally:
+        handles.close()
+    return digests
+
+
+def _extract_tar(path: str, outdir: str, on_progress: ProgressCallback) -> None:
+    # Compressed tar streams can only be read sequentially, so are not extracted concurrently
+    with tarfile.open(path) as archive:
+        members = archive.getmembers()
+        progress = ByteProgress(
+            total=sum(member.size for member in members if member.isfile()),
+            on_progress=on_progress,
+        )
+        for member in members:
+            _safe_join(outdir, member.name)
+            if hasattr(tarfile, "data_filter"):
+                archive.extract(member, path=outdir, filter="data")
+            else:
+                archive.extract(member, path=outdir)
+            if member.isfile():
+                progress.advance(member.size)
+
+
+def extract_archive(
+    path: str,
+    outdir: str,
+    on_progress: ProgressCallback = progress_noop,
+    max_workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    Extracts the archive at the given path into outdir.
+
+    Zip archives are extracted in-process with members extracted concurrently using up to max_workers threads; tar
+    archives are extracted in-process sequentially; anything else is handed off to patool.
+
+    :returns: The hex SHA-256 digest of each file extracted, by its path, where hashed as it was extracted; only zip
+    members are hashed.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    on_progress(0.0)
+    digests: Dict[str, str] = {}
+    if zipfile.is_zipfile(path):
+        digests = _extract_zip(
+            path, outdir, on_progress=on_progress, max_workers=max_workers
+        )
+    elif tarfile.is_tarfile(path):
+        _extract_tar(path, outdir, on_progress=on_progress)
+    else:
+        logger.debug(f"falling back to patool to extract {path}")
+        patoolib.extract_archive(path, outdir=outdir, verbosity=-1)
+    on_progress(1.0)
+    return digests
+
+
+def is_indexable(path: str) -> bool:
+    """
+    Returns True if the file at the given path is an archive which can be read through an ArchiveIndex.
+    """
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+class ArchiveIndex:
+    """
+    An index of a zip archive's members, built from its central directory, which allows members to be matched and
+    extracted individually without extracting the whole archive.
+
+    Member paths are relative and always use forward slashes, regardless of platform.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._files: Dict[str, zipfile.ZipInfo] = {}
+        self._children: Dict[str, Set[str]] = {"": set()}
+        self._handles = _ZipHandles(path)
+        # Temporary directory the whole archive has been extracted to, if it has been
+        self._extracted: Optional[str] = None
+        self._extract_lock = Lock()
+
+        with zipfile.ZipFile(path) as archive:
+            infos = archive.infolist()
+        for info in infos:
+            name = posixpath.normpath(info.filename.replace("\\", "/")).strip("/")
+            if name in ("", "."):
+                continue
+            if name == ".." or name.startswith("../") or posixpath.isabs(name):
+                raise ValueError(f"archive member outside of archive root: {name}")
+            self._add_dir(posixpath.dirname(name))
+            if info.is_dir():
+                self._add_dir(name)
+            else:
+                self._files[name] = info
+                self._children[posixpath.dirname(name)].add(posixpath.basename(name))
+
+    def _add_dir(self, name: str) -> None:
+        if name in self._children:
+            return
+        parent = posixpath.dirname(name)
+        self._add_dir(parent)
+        self._children[name] = set()
+        self._children[parent].add(posixpath.basename(name))
+
+    def is_dir(self, name: str) -> bool:
+        return name in self._children
+
+    def is_file(self, name: str) -> bool:
+        return name in self._files
+
+    def file_size(self, name: str) -> int:
+        return self._files[name].file_size
+
+    def _descendants(self, name: str) -> Iterable[str]:
+        """
+        Yields the given directory and every non-hidden path beneath it, as glob's ** would.
+        """
+        yield name
+        for child in sorted(self._children.get(name, ())):
+            if child.startswith("."):
+                continue
+            path = posixpath.join(name, child)
+            if path in self._children:
+                yield from self._descendants(path)
+            else:
+                yield path
+
+    def _glob(self, current: str, parts: List[str]) -> Iterable[str]:
+        if not parts:
+            yield current
+            return
+        part, rest = parts[0], parts[1:]
+        if part in ("", "."):
+            yield from self._glob(current, rest)
+        elif part == "..":
+            # Allowed after a file too, so that e.g. **/project.json/.. matches the folder containing project.json
+            if current:
+                yield from self._glob(posixpath.dirname(current), rest)
+        elif part == "**":
+            for path in self._descendants(current):
+                if not rest or path in self._children or rest[0] == "..":
+                    yield from self._glob(path, rest)
+        elif has_magic(part):
+            for child in sorted(self._children.get(current, ())):
+                if child.startswith(".") and not part.startswith("."):
+                    continue
+                # Matched as glob would match files on disk, i.e. case-insensitively on Windows
+                if fnmatch(child, part):
+                    yield from self._glob(posixpath.join(current, child), rest)
+        elif part in self._children.get(current, ()):
+            yield from self._glob(posixpath.join(current, part), rest)
+        elif _CASE_INSENSITIVE:
+            part = os.path.normcase(part)
+            for child in sorted(self._children.get(current, ())):
+                if os.path.normcase(child) == part:
+                    yield from self._glob(posixpath.join(current, child), rest)
+
+    def iglob(self, pattern: str) -> Iterable[str]:
+        """
+        Yields member paths matching the given glob pattern, which supports the same syntax as glob.iglob with
+        recursive=True.
+        """
+        parts = pattern.replace(os.sep, "/").split("/")
+        seen: Set[str] = set()
+        for path in self._glob("", parts):
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+    def walk_files(self, dir: str) -> Iterable[Tuple[str, str]]:
+        """
+        Yields a 2-tuple of the path relative to the given directory and the member path of every file beneath it.
+        """
+        prefix = f"{dir}/" if dir else ""
+        for name in sorted(self._files):
+            if name.startswith(prefix):
+                yield name.removeprefix(prefix), name
+
+    def walk_dirs(self, dir: str) -> Iterable[str]:
+        """
+        Yields the path relative to the given directory of every directory beneath it, including itself as ".".
+        """
+        prefix = f"{dir}/" if dir else ""
+        for name in sorted(self._children):
+            if name == dir:
+                yield "."
+            elif name.startswith(prefix):
+                yield name.removeprefix(prefix)
+
+    def open(self, name: str) -> IO[bytes]:
+        """
+        Opens the given member for reading; may be called from several threads at once.
+        """
+        return self._handles.get().open(self._files[name])
+
+    def extract(
+        self, name: str, dest: str, on_chunk: Optional[ProgressCallback] = None
+    ) -> str:
+        """
+        Extracts the given member to the given file path; may be called from several threads at once.
+
+        :returns: The hex SHA-256 digest of the member's contents.
+        """
+        return extract_zip_member(
+            self._handles.get(), self._files[name], dest, on_chunk
+        )
+
+    def extract_all(self) -> str:
+        """
+        Extracts the whole archive to a temporary directory the first time it is called, for anything which can only
+        read an extracted package, returning the path to it; the directory is removed when the index is closed.
+        """
+        with self._extract_lock:
+            if self._extracted is None:
+                logger.debug(f"extracting {self.path} in full")
+                path = temp_path()
+                try:
+                    extract_archive(self.path, outdir=path)
+                except BaseException:
+                    remove_path(path)
+                    raise
+                self._extracted = path
+            return self._extracted
+
+    def close(self) -> None:
+        self._handles.close()
+        with self._extract_lock:
+            if self._extracted is not None:
+                remove_path(self._extracted)
+                self._extracted = None
+
+    def __enter__(self) -> "ArchiveIndex":
+        return self
+
+    def __exit__(
+        self,
+        exception_type: Type,
+        exception_value: BaseException,
+        traceback: TracebackType,
+    ) -> None:
+        self.close()
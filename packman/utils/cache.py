@@ -1,17 +1,290 @@
-import hashlib
+import json
 import os
-import shutil
-from typing import Iterable
+import time
+from typing import Collection, Dict, Iterable, List, Optional, Set, Tuple
 
+from loguru import logger
 from packman.models.package_source import PackageVersion
-from packman.utils.files import temp_dir
+from packman.utils.archive import ArchiveIndex, is_indexable
+from packman.utils.concurrency import run_parallel
+from packman.utils.download import prune_downloads
+from packman.utils.files import store_dir
 from packman.utils.operation import Operation
 from packman.utils.progress import ProgressCallback, progress_noop
+from packman.utils.store import Store, StoreTree
+from pydantic import BaseModel
+
+# Trees used by open operations in this process, with the number of uses of each, which are never evicted as they may
+# still be being read from
+_in_use: Dict[str, int] = {}
+
+
+def _release(key: str) -> None:
+    with Store._lock:
+        count = _in_use.pop(key, 0) - 1
+        if count > 0:
+            _in_use[key] = count
+
+
+def _use(key: str, operation: Operation) -> None:
+    """
+    Marks the given tree as in use until the given operation is closed.
+    """
+    with Store._lock:
+        _in_use[key] = _in_use.get(key, 0) + 1
+    operation.call_on_close(lambda: _release(key))
+
+
+class CacheConfig(BaseModel):
+    # Directory to keep cached packages in; if None, a directory in the user's state directory is used
+    path: Optional[str] = None
+    # Size in bytes beyond which the least recently used packages are evicted; if None, the cache is unbounded
+    max_size: Optional[int] = 10 * 1024 * 1024 * 1024
+
+
+class CacheIndexEntry(BaseModel):
+    """
+    Bookkeeping for a single cached package version.
+    """
+
+    name: str
+    version: str
+    option: str
+    # Total size of the files the entry references, some of which may be shared with other entries
+    size: int
+    created: float
+    last_access: float
+    hits: int = 0
+
+
+class CacheIndex(BaseModel):
+    """
+    Bookkeeping for every cached package version, kept alongside the store.
+    """
+
+    entries: Dict[str, CacheIndexEntry] = {}
+    hits: int = 0
+    misses: int = 0
+
+
+class CacheStats(BaseModel):
+    entry_count: int
+    size: int
+    max_size: Optional[int]
+    hits: int
+    misses: int
+
+
+def _index_path(store: Store) -> str:
+    return os.path.join(store.path, "index.json")
+
+
+def load_index(store: Store) -> CacheIndex:
+    try:
+        return CacheIndex.parse_file(_index_path(store))
+    except FileNotFoundError:
+        return CacheIndex()
+    except Exception as exc:
+        logger.warning(f"rebuilding unreadable cache index: {exc}")
+        return CacheIndex()
+
+
+class _Accesses:
+    """
+    Hits and misses recorded by this process which have not yet been written to a store's index.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        # Hits on each entry, along with when it was last accessed
+        self.entry_hits: Dict[str, Tuple[int, float]] = {}
+        # Entries whose packages were missing or corrupt, so must be dropped
+        self.missed: Set[str] = set()
+
+    def record(self, key: str, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+            hits, _ = self.entry_hits.get(key, (0, 0.0))
+            self.entry_hits[key] = (hits + 1, time.time())
+            self.missed.discard(key)
+        else:
+            self.misses += 1
+            self.entry_hits.pop(key, None)
+            self.missed.add(key)
+
+    def apply(self, index: CacheIndex) -> None:
+        index.hits += self.hits
+        index.misses += self.misses
+        for key in self.missed:
+            index.entries.pop(key, None)
+        for key, (hits, last_access) in self.entry_hits.items():
+            entry = index.entries.get(key)
+            if entry is not None:
+                entry.hits += hits
+                entry.last_access = max(entry.last_access, last_access)
+
+
+# Accesses not yet written to the index of each store, by store path, so that the index is written once per operation
+# rather than on every access
+_accesses: Dict[str, _Accesses] = {}
+
+
+def _load_index(store: Store) -> CacheIndex:
+    """
+    Loads the given store's index with the accesses this process has recorded applied, which are then forgotten, so the
+    index must be saved before the store lock is released.
+    """
+    index = load_index(store)
+    accesses = _accesses.pop(store.path, None)
+    if accesses is not None:
+        accesses.apply(index)
+    return index
+
+
+def _flush_accesses(store: Store) -> None:
+    """
+    Writes the accesses this process has recorded to the given store's index.
+    """
+    with Store._lock:
+        if store.path in _accesses:
+            _save_index(store, _load_index(store))
+
+
+def _save_index(store: Store, index: CacheIndex) -> None:
+    path = _index_path(store)
+    os.makedirs(store.path, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fp:
+        json.dump(json.loads(index.json()), fp)
+    os.replace(tmp_path, path)
+
+
+def get_stats(store: Store, max_size: Optional[int] = None) -> CacheStats:
+    with Store._lock:
+        index = load_index(store)
+        accesses = _accesses.get(store.path)
+        if accesses is not None:
+            accesses.apply(index)
+        return CacheStats(
+            entry_count=len(store.keys()),
+            size=store.size(),
+            max_size=max_size,
+            hits=index.hits,
+            misses=index.misses,
+        )
+
+
+def prune(
+    store: Store, max_size: int = 0, keep: Collection[str] = ()
+) -> Tuple[int, int]:
+    """
+    Evicts the least recently used cached packages until the store is no larger than max_size bytes, except for those
+    in use by this process.
+
+    :param keep: Keys of further trees not to evict.
+    :returns: A 2-tuple of the number of packages evicted and the total number of bytes freed.
+    """
+    # Partial downloads are not kept in the store, but are abandoned in the same way as cached packages
+    prune_downloads()
+
+    count = 0
+    freed = 0
+    with Store._lock:
+        size = store.size()
+        if size <= max_size:
+            return count, freed
+        index = _load_index(store)
+        # Trees missing from the index, e.g. those cached before it existed, are evicted first
+        keys = sorted(
+            (key for key in store.keys() if key not in _in_use and key not in keep),
+            key=lambda key: index.entries[key].last_access
+            if key in index.entries
+            else 0,
+        )
+        for key in keys:
+            if size <= max_size:
+                break
+            # Measured before removal, as the blobs are only removed once every eviction is done
+            size -= store.unshared_size(key)
+            store.remove_tree(key)
+            entry = index.entries.pop(key, None)
+            count += 1
+            logger.debug(
+                f"evicted {f'{entry.name}@{entry.version}' if entry else key} from cache"
+            )
+        _, freed = store.collect_garbage()
+        _save_index(store, index)
+    return count, freed
+
+
+def verify(store: Store, max_workers: Optional[int] = None) -> List[str]:
+    """
+    Checks the contents of every cached package against their digests using up to max_workers threads, evicting any
+    which do not match.
+
+    :returns: The name and version of each package evicted, in name@version format.
+    """
+    with Store._lock:
+        keys = store.keys()
+
+    corrupt: List[str] = []
+
+    def verify_tree(key: str) -> bool:
+        tree = store.get_tree(key)
+        return tree is not None and all(
+            store.verify_blob(digest) for digest in tree.digests()
+        )
+
+    def on_done(key: str, valid: bool) -> None:
+        if not valid:
+            corrupt.append(key)
+
+    run_parallel(verify_tree, keys, max_workers=max_workers, on_done=on_done)
+
+    evicted: List[str] = []
+    with Store._lock:
+        index = _load_index(store)
+        for key in corrupt:
+            store.remove_tree(key)
+            entry = index.entries.pop(key, None)
+            evicted.append(f"{entry.name}@{entry.version}" if entry else key)
+        store.collect_garbage()
+        _save_index(store, index)
+    return sorted(evicted)
 
 
 class Cache:
-    def __init__(self, name: str) -> None:
+    """
+    Caches versions of a package in a content-addressed store.
+
+    Packages downloaded as an archive are cached as that archive, kept whole; anything else is cached file by file, so
+    that files shared between versions or packages are only stored once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        store: Optional[Store] = None,
+        max_size: Optional[int] = None,
+    ) -> None:
+        """
+        :param store: Store to cache packages in; if None, the default store is used.
+        :param max_size: Size in bytes beyond which the least recently used packages are evicted when a package is
+        added; if None, the cache is unbounded.
+        """
         self.name = name
+        self.store = store or Store(store_dir())
+        self.max_size = max_size
+
+    def _record_access(self, key: str, hit: bool, operation: Operation) -> None:
+        """
+        Records a hit or miss in memory, to be written to the index once the given operation is closed.
+        """
+        with Store._lock:
+            _accesses.setdefault(self.store.path, _Accesses()).record(key, hit)
+        store = self.store
+        operation.call_on_close(lambda: _flush_accesses(store))
 
     def fetch_version(
         self,
@@ -20,26 +293,85 @@ class Cache:
         operation: Operation,
         on_progress: ProgressCallback = progress_noop,
     ) -> None:
-        cache_path = self.get_path(version, ".zip")
-        if not os.path.exists(cache_path):
+        key = Store.tree_key(self.name, version, option)
+        _use(key, operation)
+        tree = self.store.get_tree(key)
+        if tree is None:
+            self._record_access(key, hit=False, operation=operation)
             raise Exception("not found")
-        operation.extract_archive(cache_path)
+
+        if tree.archive is None:
+            operation.materialise(self.store, tree, on_progress=on_progress)
+        elif not self.store.verify_blob(tree.archive):
+            logger.warning(
+                f"discarding corrupt cached archive for {self.name}@{version}"
+            )
+            self.store.remove_tree(key)
+            self._record_access(key, hit=False, operation=operation)
+            raise Exception("cached archive is corrupt")
+        else:
+            # Kept, as the archive belongs to the store
+            operation.unpack_archive(
+                self.store.blob_path(tree.archive), on_progress=on_progress, keep=True
+            )
+        self._record_access(key, hit=True, operation=operation)
 
     def get_versions(self) -> Iterable[str]:
         raise NotImplementedError("Not supported for cache")
 
-    def add_package(self, version_info: PackageVersion, package_path: str) -> None:
+    def add_package(
+        self,
+        version_info: PackageVersion,
+        package_path: str,
+        operation: Optional[Operation] = None,
+        max_workers: Optional[int] = None,
+    ) -> StoreTree:
+        """
+        :param operation: Operation which retrieved the package; if it downloaded the package as an archive, the archive
+        is cached as-is rather than the files unpacked from it.
+        :returns: The tree stored for the package.
+        """
         version = version_info.version
-        cache_path = self.get_path(version)
-        try:
-            os.remove(cache_path)
-        except FileNotFoundError:
-            ...
-        shutil.make_archive(cache_path, "zip", package_path)
-
-    def get_path(self, version: str, ext: str = "") -> str:
-        key_bytes = bytes(f"{self.name}{version}", "utf-8")
-        key_md5 = hashlib.md5(key_bytes)
-        key_md5_str = key_md5.hexdigest()
-        file = f"cache_{key_md5_str}{ext}"
-        return os.path.join(temp_dir(), file)
+        assert version is not None, "unversioned packages cannot be cached"
+        option = version_info.options[0]
+        key = Store.tree_key(self.name, version, option)
+        if operation is not None:
+            _use(key, operation)
+        archive_path = operation.archives.get(package_path) if operation else None
+
+        if operation is not None and archive_path in operation.downloaded:
+            assert archive_path is not None
+            source = operation.downloaded[archive_path]
+            # A streamed archive is still needed by the install steps, but is never modified, so may be linked
+            digest = self.store.add_blob_file(
+                archive_path,
+                digest=source.digest,
+                discard_src=True,
+                move=archive_path != package_path,
+            )
+            tree = StoreTree(archive=digest, source=source)
+        elif is_indexable(package_path):
+            # Package was streamed from its archive, so its files are added straight from the archive
+            with ArchiveIndex(package_path) as archive:
+                tree = self.store.add_archive(archive, max_workers=max_workers)
+        else:
+            tree = self.store.add_dir(package_path, max_workers=max_workers)
+
+        now = time.time()
+        with Store._lock:
+            self.store.put_tree(key, tree)
+            index = _load_index(self.store)
+            index.entries[key] = CacheIndexEntry(
+                name=self.name,
+                version=version,
+                option=option,
+                size=self.store.tree_size(tree),
+                created=now,
+                last_access=now,
+            )
+            _save_index(self.store, index)
+        logger.debug(f"cached {self.name}@{version}")
+
+        if self.max_size is not None:
+            prune(self.store, self.max_size, keep={key})
+        return tree
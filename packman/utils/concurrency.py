@@ -0,0 +1,147 @@
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import closing
+from threading import Lock
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+K = TypeVar("K", bound=Hashable)
+
+
+def default_max_workers() -> int:
+    """
+    Returns a default worker count for I/O-bound work, which benefits from more threads than there are CPUs.
+    """
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _done_noop(item: T, result: R) -> None:
+    return
+
+
+def run_parallel(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: Optional[int] = None,
+    on_done: Callable[[T, R], None] = _done_noop,
+) -> None:
+    """
+    Calls func on each item using a bounded pool of worker threads.
+
+    on_done is called from the calling thread as each item completes, so it does not need to be thread-safe.
+
+    On the first error, or on KeyboardInterrupt, no further items are started, items already running are waited for
+    and the error is re-raised; no work is left running in the background when this function returns.
+    """
+    with closing(iter_parallel(func, items, max_workers=max_workers)) as results:
+        for item, result in results:
+            on_done(item, result)
+
+
+def iter_parallel(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: Optional[int] = None,
+    processes: bool = False,
+) -> Iterator[Tuple[T, R]]:
+    """
+    Calls func on each item using a bounded pool of workers, yielding each item and its result as it completes.
+
+    Only a couple of items are queued per worker, so items are consumed lazily and a caller which stops iterating early
+    stops further items from being started; items already running are waited for when the iterator is closed.
+
+    :param processes: If True, items are processed in a pool of worker processes rather than threads, for CPU-bound
+    work; func, items and results must then be picklable, and func must not rely on state configured at runtime.
+    """
+    executor: Executor
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+        max_pending = (max_workers or os.cpu_count() or 1) * 2
+    else:
+        if max_workers is None:
+            max_workers = default_max_workers()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        max_pending = max_workers * 2
+
+    iterator = iter(items)
+    pending: Set[Future] = set()
+    future_items: Dict[Future, T] = {}
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(func, item)
+                future_items[future] = item
+                pending.add(future)
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future_items.pop(future), future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class SingleFlight(Generic[K, R]):
+    """
+    Deduplicates concurrent calls for the same key, so that callers arriving while a call is in flight wait for and
+    share its result instead of repeating it.
+
+    Results are not kept once a call completes; later calls for the same key start afresh.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._calls: Dict[K, Future] = {}
+
+    def do(self, key: K, func: Callable[[], R]) -> R:
+        """
+        Returns the result of func, or of the call already in flight for key; errors are shared in the same way.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                owner = False
+            else:
+                owner = True
+                future = self._calls[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
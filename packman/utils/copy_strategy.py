@@ -0,0 +1,239 @@
+import errno
+import os
+import shutil
+from enum import Enum
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore
+
+_CHUNK_SIZE = 1024 * 1024
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+
+# Errors which indicate that a strategy is not supported between two file-systems, as opposed to an actual failure
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+    errno.EMLINK,
+    errno.EOPNOTSUPP,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+}
+
+# Links are also refused with EPERM by file-systems which don't support them; anything else refused falls back to a
+# plain copy, which fails in its own right if the destination really cannot be written
+_LINK_UNSUPPORTED_ERRNOS = _UNSUPPORTED_ERRNOS | {errno.EPERM}
+
+
+class CopyStrategy(str, Enum):
+    """
+    A means of making the contents of one file available at another path.
+    """
+
+    # Copy-on-write clone; shares extents with the source until either is modified (btrfs, XFS, etc.)
+    REFLINK = "reflink"
+    # Shares the source's inode; only safe where the source is about to be discarded
+    HARDLINK = "hardlink"
+    # Moves the source; only possible where the source is no longer needed
+    RENAME = "rename"
+    # In-kernel copy, avoiding round trips through user space
+    COPY_FILE_RANGE = "copy_file_range"
+    # Plain byte copy
+    COPY = "copy"
+
+
+def _reflink(src: str, dest: str) -> None:
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks not supported on this platform")
+    with open(src, "rb") as src_fp, open(dest, "wb") as dest_fp:
+        try:
+            fcntl.ioctl(dest_fp.fileno(), _FICLONE, src_fp.fileno())
+        except OSError:
+            dest_fp.close()
+            os.remove(dest)
+            raise
+    shutil.copystat(src, dest)
+
+
+def _hardlink(src: str, dest: str) -> None:
+    os.link(src, dest)
+
+
+def _rename(src: str, dest: str) -> None:
+    os.replace(src, dest)
+
+
+def _copy_file_range(src: str, dest: str) -> None:
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range not supported on this platform")
+    with open(src, "rb") as src_fp, open(dest, "wb") as dest_fp:
+        try:
+            size = os.fstat(src_fp.fileno()).st_size
+            while size > 0:
+                copied = os.copy_file_range(src_fp.fileno(), dest_fp.fileno(), size)
+                if copied == 0:
+                    # Some file-systems copy nothing rather than failing, so the rest is copied through user space
+                    shutil.copyfileobj(src_fp, dest_fp, _CHUNK_SIZE)
+                    break
+                size -= copied
+        except OSError:
+            dest_fp.close()
+            os.remove(dest)
+            raise
+    shutil.copystat(src, dest)
+
+
+def _copy(src: str, dest: str) -> None:
+    shutil.copy2(src, dest)
+
+
+def _copy_through(src: str, dest: str, on_chunk: Callable[[bytes], None]) -> None:
+    """
+    Copies src to dest through user space, calling on_chunk with each chunk of bytes copied.
+    """
+    buffer = bytearray(_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(src, "rb") as src_fp, open(dest, "wb") as dest_fp:
+        while True:
+            size = src_fp.readinto(view)  # type: ignore
+            if not size:
+                break
+            chunk = view[:size]
+            on_chunk(chunk)  # type: ignore
+            dest_fp.write(chunk)
+    shutil.copystat(src, dest)
+
+
+_LINK_STRATEGIES = {CopyStrategy.REFLINK, CopyStrategy.HARDLINK}
+
+_STRATEGY_FUNCS: Dict[CopyStrategy, Callable[[str, str], None]] = {
+    CopyStrategy.REFLINK: _reflink,
+    CopyStrategy.HARDLINK: _hardlink,
+    CopyStrategy.RENAME: _rename,
+    CopyStrategy.COPY_FILE_RANGE: _copy_file_range,
+    CopyStrategy.COPY: _copy,
+}
+
+# Strategies found not to work between a given pair of devices
+_unsupported: Dict[Tuple[int, int], Set[CopyStrategy]] = {}
+_unsupported_lock = Lock()
+
+
+def _device_pair(src: str, dest: str) -> Tuple[int, int]:
+    dest_dir = os.path.dirname(os.path.abspath(dest))
+    return os.stat(src).st_dev, os.stat(dest_dir).st_dev
+
+
+def _mark_unsupported(
+    strategy: CopyStrategy, pair: Tuple[int, int], exc: OSError
+) -> None:
+    logger.debug(f"{strategy.value} unsupported for devices {pair}: {exc}")
+    with _unsupported_lock:
+        _unsupported.setdefault(pair, set()).add(strategy)
+
+
+def is_supported(strategy: CopyStrategy, src: str, dest: str) -> bool:
+    """
+    Returns False if the given strategy is already known not to work between the file-systems of src and dest.
+    """
+    pair = _device_pair(src, dest)
+    with _unsupported_lock:
+        return strategy not in _unsupported.get(pair, ())
+
+
+def try_rename(src: str, dest: str) -> bool:
+    """
+    Atomically moves src to dest if their file-systems allow it; otherwise returns False, leaving src in place.
+    """
+    pair = _device_pair(src, dest)
+    try:
+        _rename(src, dest)
+    except OSError as exc:
+        if exc.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        _mark_unsupported(CopyStrategy.RENAME, pair, exc)
+        return False
+    return True
+
+
+def get_strategies(
+    *, discard_src: bool = False, move: bool = False
+) -> List[CopyStrategy]:
+    """
+    Returns the strategies which may be used to copy a file, in order of preference.
+
+    :param discard_src: If True, the source will be discarded shortly, so it may share an inode with the destination.
+    :param move: If True, the source is not needed after the copy, so it may simply be moved.
+    """
+    strategies: List[CopyStrategy] = []
+    if move:
+        strategies.append(CopyStrategy.RENAME)
+    strategies.append(CopyStrategy.REFLINK)
+    if discard_src or move:
+        strategies.append(CopyStrategy.HARDLINK)
+    strategies += [CopyStrategy.COPY_FILE_RANGE, CopyStrategy.COPY]
+    return strategies
+
+
+def copy_file(
+    src: str,
+    dest: str,
+    *,
+    discard_src: bool = False,
+    move: bool = False,
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+) -> CopyStrategy:
+    """
+    Copies src to dest using the cheapest strategy supported between their file-systems, returning the strategy used.
+
+    Any existing file at dest is unlinked rather than written through, so files sharing its inode are unaffected.
+
+    :param discard_src: If True, the source will be discarded shortly, so it may share an inode with the destination.
+    :param move: If True, the source is not needed after the copy, so it may simply be moved; if a strategy other than
+    RENAME is used, the source is removed afterwards.
+    :param on_chunk: If given, called with each chunk of bytes copied where the COPY strategy is used, e.g. to hash the
+    file as it is copied; other strategies copy without passing its contents through user space.
+    """
+    try:
+        os.remove(dest)
+    except FileNotFoundError:
+        pass
+
+    pair = _device_pair(src, dest)
+    with _unsupported_lock:
+        unsupported = set(_unsupported.get(pair, ()))
+
+    for strategy in get_strategies(discard_src=discard_src, move=move):
+        if strategy in unsupported:
+            continue
+        if strategy == CopyStrategy.COPY:
+            if on_chunk is None:
+                _copy(src, dest)
+            else:
+                _copy_through(src, dest, on_chunk)
+        else:
+            try:
+                _STRATEGY_FUNCS[strategy](src, dest)
+            except OSError as exc:
+                unsupported_errnos = (
+                    _LINK_UNSUPPORTED_ERRNOS
+                    if strategy in _LINK_STRATEGIES
+                    else _UNSUPPORTED_ERRNOS
+                )
+                if exc.errno not in unsupported_errnos:
+                    raise
+                _mark_unsupported(strategy, pair, exc)
+                continue
+        if move and strategy != CopyStrategy.RENAME:
+            os.remove(src)
+        return strategy
+
+    raise AssertionError("plain copy should always be attempted")
@@ -0,0 +1,290 @@
+import errno
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import timedelta
+from typing import Dict, List, Mapping, Optional
+
+from loguru import logger
+from packman.utils.files import download_dir, remove_file
+from pydantic import BaseModel
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore
+    import msvcrt
+
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+# Partial downloads not written to for this long are assumed to have been abandoned
+_PARTIAL_DOWNLOAD_MAX_AGE = timedelta(days=7)
+
+# Length of the hex MD5 digest of the URL which starts the name of every file kept for a partial download
+_KEY_LENGTH = 32
+
+
+class DownloadChangedError(Exception):
+    """
+    Raised when the remote file changes part-way through a download, so that it must be restarted.
+    """
+
+
+def download_path(url: str, ext: str = "") -> str:
+    """
+    Returns the stable path at which a partial download of the given URL is kept, so it can be found again later.
+    """
+    key_md5 = hashlib.md5(bytes(url, "utf-8")).hexdigest()
+    return os.path.join(download_dir(), f"{key_md5}{ext}")
+
+
+class DownloadLock:
+    """
+    An exclusive lock on the partial download at a given path, so that only one operation writes to it at a time.
+
+    Held through the file-system, so it is released if the process holding it dies.
+    """
+
+    def __init__(self, fd: int) -> None:
+        self._fd: Optional[int] = fd
+
+    @staticmethod
+    def _get_lock_path(path: str) -> str:
+        return f"{path}.lock"
+
+    @staticmethod
+    def acquire(path: str) -> Optional["DownloadLock"]:
+        """
+        Locks the partial download at the given path, returning None without waiting if it is already locked.
+        """
+        lock_path = DownloadLock._get_lock_path(path)
+        os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return None
+        return DownloadLock(fd)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is None:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+def prune_downloads(max_age: timedelta = _PARTIAL_DOWNLOAD_MAX_AGE) -> int:
+    """
+    Removes partial downloads which have not been written to within max_age and are not in use, e.g. those abandoned
+    once their retries ran out and never resumed.
+
+    :returns: The number of partial downloads removed.
+    """
+    dir = download_dir()
+    try:
+        names = os.listdir(dir)
+    except FileNotFoundError:
+        return 0
+    downloads: Dict[str, List[str]] = {}
+    for name in names:
+        downloads.setdefault(name[:_KEY_LENGTH], []).append(os.path.join(dir, name))
+
+    cutoff = time.time() - max_age.total_seconds()
+    count = 0
+    for paths in downloads.values():
+        locks: List[DownloadLock] = []
+        try:
+            for path in paths:
+                if path.endswith(".lock"):
+                    lock = DownloadLock.acquire(path.removesuffix(".lock"))
+                    if lock is None:
+                        break
+                    locks.append(lock)
+            else:
+                if all(os.path.getmtime(path) < cutoff for path in paths):
+                    logger.debug(f"removing abandoned partial download {paths[0]}")
+                    for path in paths:
+                        remove_file(path)
+                    count += 1
+        except FileNotFoundError:
+            continue
+        finally:
+            for lock in locks:
+                lock.release()
+    return count
+
+
+def parse_content_range(value: str) -> Optional[int]:
+    """
+    Returns the first byte offset of a Content-Range header value, or None if it cannot be parsed.
+    """
+    match = _CONTENT_RANGE_RE.match(value.strip())
+    if match is None:
+        return None
+    return int(match.group(1))
+
+
+def preallocate(path: str, size: int) -> None:
+    """
+    Creates the file at the given path with space reserved for size bytes, so that segments can be written into it at
+    any offset without fragmenting it.
+    """
+    with open(path, "wb") as fp:
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fp.fileno(), 0, size)
+                return
+            except OSError as exc:
+                if exc.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                    raise
+        fp.truncate(size)
+
+
+class DownloadSegment(BaseModel):
+    """
+    A byte range of a segmented download, fetched independently of the others.
+    """
+
+    start: int
+    # Inclusive, as in a Range header
+    end: int
+    written: int = 0
+
+    @property
+    def offset(self) -> int:
+        return self.start + self.written
+
+    @property
+    def done(self) -> bool:
+        return self.offset > self.end
+
+
+def split_segments(total: int, count: int) -> List[DownloadSegment]:
+    """
+    Splits total bytes into the given number of contiguous, roughly equal segments.
+    """
+    size = -(-total // count)
+    return [
+        DownloadSegment(start=start, end=min(start + size, total) - 1)
+        for start in range(0, total, size)
+    ]
+
+
+class DownloadedFile(BaseModel):
+    """
+    Where a completed download came from and what it contains.
+    """
+
+    url: str
+    size: int
+    # Hex SHA-256 digest of the contents, where it could be computed as the download was written
+    digest: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class PartialDownload(BaseModel):
+    """
+    A download which has been started but not yet completed, along with what is needed to safely resume it.
+    """
+
+    url: str
+    path: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    total: Optional[int] = None
+    # Bytes written from the start of the file; unused by segmented downloads, which track each segment instead
+    written: int = 0
+    segments: List[DownloadSegment] = []
+
+    def get_written(self) -> int:
+        if self.segments:
+            return sum(segment.written for segment in self.segments)
+        return self.written
+
+    def reset(self) -> None:
+        """
+        Forgets all progress, so the download starts over.
+        """
+        self.written = 0
+        self.segments = []
+        self.total = None
+
+    @staticmethod
+    def _get_sidecar_path(path: str) -> str:
+        return f"{path}.json"
+
+    def get_validator(self) -> Optional[str]:
+        """
+        Returns a validator for use in an If-Range header, so that a resumed download is only continued if the remote
+        file has not changed since it was started.
+        """
+        # If-Range requires a strong validator
+        if self.etag is not None and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def update_validators(self, headers: Mapping[str, str]) -> None:
+        """
+        Takes the validators of the remote file from the given response headers, which should be case-insensitive.
+        """
+        self.etag = headers.get("etag")
+        self.last_modified = headers.get("last-modified")
+
+    def save(self) -> None:
+        """
+        Persists this download alongside its data so that a later operation can resume it.
+        """
+        sidecar_path = PartialDownload._get_sidecar_path(self.path)
+        tmp_path = f"{sidecar_path}.tmp"
+        with open(tmp_path, "w") as fp:
+            fp.write(self.json())
+        os.replace(tmp_path, sidecar_path)
+
+    def discard(self) -> None:
+        for path in (self.path, PartialDownload._get_sidecar_path(self.path)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+
+    def finish(self, dest: str) -> None:
+        """
+        Moves the completed download to dest and discards its resume state.
+        """
+        os.replace(self.path, dest)
+        self.discard()
+
+    @staticmethod
+    def load(url: str, ext: str = "") -> Optional["PartialDownload"]:
+        """
+        Returns the persisted partial download of the given URL, if there is one which can be resumed.
+        """
+        path = download_path(url, ext=ext)
+        sidecar_path = PartialDownload._get_sidecar_path(path)
+        try:
+            with open(sidecar_path, "r") as fp:
+                download = PartialDownload(**json.load(fp))
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"discarding unreadable partial download of {url}: {exc}")
+            PartialDownload(url=url, path=path).discard()
+            return None
+        if download.url != url:
+            return None
+        # Only bytes which were both recorded and actually made it to disk can be trusted
+        download.written = min(download.written, size)
+        return download
@@ -32,6 +32,14 @@ def temp_dir() -> str:
     return os.path.join(tempfile.gettempdir(), "packman")
 
 
+def download_dir() -> str:
+    return os.path.join(temp_dir(), "downloads")
+
+
+def store_dir() -> str:
+    return os.path.join(appdirs.user_state_dir(appname="packman"), "store")
+
+
 def temp_path(ext: str = "", sub_path: str = "") -> str:
     return os.path.join(temp_dir(), sub_path, f"{uuid4()}{ext}")
 
@@ -40,6 +48,10 @@ def backup_dir() -> str:
     return os.path.join(appdirs.user_state_dir(appname="packman"), "backups")
 
 
+def http_cache_dir() -> str:
+    return os.path.join(appdirs.user_state_dir(appname="packman"), "http")
+
+
 def backup_path(src: str) -> str:
     key_bytes = bytes(src, "utf-8")
     key_md5 = hashlib.md5(key_bytes)
@@ -47,14 +59,6 @@ def backup_path(src: str) -> str:
     return os.path.join(backup_dir(), key_md5_str)
 
 
-def checksum(path: str) -> str:
-    hash = hashlib.sha256()
-    with open(path, "rb") as fp:
-        for b in fp:
-            hash.update(b)
-    return f"{hash.name}:{hash.hexdigest()}"
-
-
 def is_hidden(path: str) -> bool:
     if os.name == "nt":
         attribute = win32api.GetFileAttributes(path)
@@ -129,6 +133,23 @@ def resolve_case(pathlike: str) -> str:
     return result
 
 
+def fsync_dir(path: str) -> None:
+    """
+    Flushes the entries of the given directory to stable storage, so that a file just renamed into it survives a crash;
+    does nothing where directories cannot be opened, e.g. on Windows.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 def remove_file(path: str) -> None:
     logger.debug(f"removing file {path}")
     try:
@@ -0,0 +1,190 @@
+import hashlib
+import mmap
+import os
+from enum import Enum
+from threading import local
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover - optional dependency
+    xxhash = None  # type: ignore
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Files at least this large are memory-mapped rather than read through a buffer
+_MMAP_THRESHOLD = 64 * 1024 * 1024
+
+# One read buffer per thread, reused for every file hashed on that thread
+_buffers = local()
+
+
+class ChecksumAlgorithm(str, Enum):
+    """
+    An algorithm used to compute file checksums, stored as "<algorithm>:<hex digest>".
+    """
+
+    SHA256 = "sha256"
+    # Faster than SHA-256 on CPUs without SHA extensions
+    BLAKE2B = "blake2b"
+    # Non-cryptographic and much faster again; requires the xxhash package
+    XXH3_128 = "xxh3_128"
+
+
+class Hash(Protocol):
+    def update(self, data: bytes) -> None:
+        ...
+
+    def hexdigest(self) -> str:
+        ...
+
+
+_default_algorithm = ChecksumAlgorithm.SHA256
+
+
+def configure(algorithm: ChecksumAlgorithm) -> None:
+    """
+    Sets the algorithm used for new checksums; checksums computed with other algorithms can still be verified.
+    """
+    global _default_algorithm
+    # Fail early if the algorithm is unavailable
+    new_hash(algorithm)
+    _default_algorithm = algorithm
+
+
+def default_algorithm() -> ChecksumAlgorithm:
+    return _default_algorithm
+
+
+def new_hash(algorithm: ChecksumAlgorithm) -> Hash:
+    if algorithm == ChecksumAlgorithm.XXH3_128:
+        if xxhash is None:
+            raise ValueError(f"the xxhash package is required for {algorithm.value}")
+        return xxhash.xxh3_128()
+    return hashlib.new(algorithm.value)
+
+
+def format_checksum(algorithm: ChecksumAlgorithm, hexdigest: str) -> str:
+    return f"{algorithm.value}:{hexdigest}"
+
+
+def parse_checksum(chk: str) -> Tuple[ChecksumAlgorithm, str]:
+    """
+    Splits a checksum into its algorithm and hex digest.
+    """
+    algorithm, _, hexdigest = chk.partition(":")
+    return ChecksumAlgorithm(algorithm), hexdigest
+
+
+# Identifies each algorithm in packed checksums; only ever appended to
+_ALGORITHM_IDS: Tuple[ChecksumAlgorithm, ...] = (
+    ChecksumAlgorithm.SHA256,
+    ChecksumAlgorithm.BLAKE2B,
+    ChecksumAlgorithm.XXH3_128,
+)
+
+
+def pack_checksum(chk: str) -> bytes:
+    """
+    Converts a checksum to a compact binary form: a byte identifying its algorithm followed by its raw digest.
+    """
+    algorithm, hexdigest = parse_checksum(chk)
+    return bytes((_ALGORITHM_IDS.index(algorithm),)) + bytes.fromhex(hexdigest)
+
+
+def packed_algorithm(packed: bytes) -> ChecksumAlgorithm:
+    return _ALGORITHM_IDS[packed[0]]
+
+
+def unpack_checksum(packed: bytes) -> str:
+    """
+    Converts a checksum packed by pack_checksum back to its "<algorithm>:<hex digest>" form.
+    """
+    return format_checksum(packed_algorithm(packed), packed[1:].hex())
+
+
+def _get_buffer() -> memoryview:
+    view = getattr(_buffers, "view", None)
+    if view is None:
+        view = _buffers.view = memoryview(bytearray(_CHUNK_SIZE))
+    return view
+
+
+def hash_file(path: str, hashes: Iterable[Hash]) -> None:
+    """
+    Feeds the contents of the given file to each of the given hashes, reading it only once.
+
+    Large files are memory-mapped; anything else is read into a reusable buffer.
+    """
+    hashes = list(hashes)
+    with open(path, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size >= _MMAP_THRESHOLD:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for offset in range(0, size, _CHUNK_SIZE):
+                        end = offset + _CHUNK_SIZE
+                        chunk = view[offset:end]
+                        for hash in hashes:
+                            hash.update(chunk)  # type: ignore
+                        chunk.release()
+            return
+
+        buffer = _get_buffer()
+        while True:
+            read = fp.readinto(buffer)  # type: ignore
+            if not read:
+                break
+            for hash in hashes:
+                hash.update(buffer[:read])  # type: ignore
+
+
+def file_digest(
+    path: str, algorithm: ChecksumAlgorithm = ChecksumAlgorithm.SHA256
+) -> str:
+    """
+    Returns the hex digest of the given file's contents.
+    """
+    hash = new_hash(algorithm)
+    hash_file(path, (hash,))
+    return hash.hexdigest()
+
+
+def file_checksums(
+    path: str, algorithms: Iterable[ChecksumAlgorithm]
+) -> Dict[ChecksumAlgorithm, str]:
+    """
+    Returns checksums of the given file for each of the given algorithms, reading it only once.
+    """
+    hashes: List[Tuple[ChecksumAlgorithm, Hash]] = [
+        (algorithm, new_hash(algorithm)) for algorithm in set(algorithms)
+    ]
+    hash_file(path, (hash for _, hash in hashes))
+    return {
+        algorithm: format_checksum(algorithm, hash.hexdigest())
+        for algorithm, hash in hashes
+    }
+
+
+def checksum(path: str) -> str:
+    """
+    Returns a checksum of the given file using the default algorithm.
+    """
+    return format_checksum(_default_algorithm, file_digest(path, _default_algorithm))
+
+
+def verify_checksum(
+    path: str, expected: str, algorithm: Optional[ChecksumAlgorithm] = None
+) -> Tuple[bool, str]:
+    """
+    Checks the given file against a checksum computed with any supported algorithm, reading it only once.
+
+    :param algorithm: Algorithm to migrate the checksum to; if None, the default algorithm is used.
+    :returns: A 2-tuple of whether the file matches and its checksum using the given algorithm, which may be stored in
+    place of the expected checksum to migrate it.
+    """
+    if algorithm is None:
+        algorithm = _default_algorithm
+    expected_algorithm, _ = parse_checksum(expected)
+    checksums = file_checksums(path, (expected_algorithm, algorithm))
+    return checksums[expected_algorithm] == expected, checksums[algorithm]
@@ -0,0 +1,143 @@
+import json
+import os
+from enum import Enum
+from typing import IO, Any, Dict, Iterable, Optional
+
+from loguru import logger
+from packman.utils.files import remove_path
+
+Record = Dict[str, Any]
+
+
+class Durability(str, Enum):
+    """
+    Controls how often journal records are flushed to stable storage.
+    """
+
+    # Records are handed to the OS as they are written but never fsynced; survives the process being killed but not
+    # a power cut or OS crash.
+    NONE = "none"
+    # Records are fsynced once every batch of records and whenever the journal is explicitly synced.
+    BATCH = "batch"
+    # Every record is fsynced before the call that wrote it returns.
+    FULL = "full"
+
+
+class Journal:
+    """
+    An append-only log of JSON records, one record per line.
+
+    Records passed to a single append() call are committed as a group, using one write and at most one fsync.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        durability: Durability = Durability.BATCH,
+        batch_size: int = 64,
+    ) -> None:
+        self.path = path
+        self.durability = durability
+        self.batch_size = batch_size
+        self.record_count = 0
+        self._fp: Optional[IO[bytes]] = None
+        self._unsynced = 0
+
+    @staticmethod
+    def _get_tmp_path(path: str) -> str:
+        return f"{path}.tmp"
+
+    @staticmethod
+    def _encode(records: Iterable[Record]) -> bytes:
+        return b"".join(
+            json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+            for record in records
+        )
+
+    def _open(self) -> IO[bytes]:
+        if self._fp is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fp = open(self.path, "ab")
+        return self._fp
+
+    def append(self, *records: Record) -> None:
+        """
+        Appends the given records to the journal as a single group commit.
+        """
+        if not records:
+            return
+        fp = self._open()
+        fp.write(Journal._encode(records))
+        fp.flush()
+        self.record_count += len(records)
+        self._unsynced += len(records)
+        if self.durability == Durability.FULL or (
+            self.durability == Durability.BATCH and self._unsynced >= self.batch_size
+        ):
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        Flushes all records written so far to stable storage, unless durability is NONE.
+        """
+        if self._fp is None or not self._unsynced:
+            return
+        if self.durability != Durability.NONE:
+            os.fsync(self._fp.fileno())
+        self._unsynced = 0
+
+    def compact(self, *records: Record) -> None:
+        """
+        Atomically replaces the entire journal with the given records.
+        """
+        self.close()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = Journal._get_tmp_path(self.path)
+        with open(tmp_path, "wb") as fp:
+            fp.write(Journal._encode(records))
+            fp.flush()
+            if self.durability != Durability.NONE:
+                os.fsync(fp.fileno())
+        os.replace(tmp_path, self.path)
+        self.record_count = len(records)
+
+    def close(self) -> None:
+        if self._fp is None:
+            return
+        try:
+            self.sync()
+        finally:
+            self._fp.close()
+            self._fp = None
+
+    @staticmethod
+    def read(path: str) -> Iterable[Record]:
+        """
+        Yields each record in the journal at the given path.
+
+        A truncated final record, such as one left behind by a crash mid-write, is ignored.
+        """
+        with open(path, "rb") as fp:
+            lines = fp.read().splitlines()
+        for idx, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if idx == len(lines) - 1:
+                    logger.warning(f"ignoring truncated journal record in {path}")
+                    return
+                raise
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(path) or os.path.exists(Journal._get_tmp_path(path))
+
+    @staticmethod
+    def remove(path: str) -> None:
+        for file in (path, Journal._get_tmp_path(path)):
+            try:
+                remove_path(file)
+            except FileNotFoundError:
+                continue
@@ -1,16 +1,46 @@
+import hashlib
 import json
 import os
-import shutil
 from datetime import datetime, timedelta
+from threading import RLock
 from types import TracebackType
-from typing import Dict, Optional, Set, Type, Union
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type, Union
 from urllib import parse as urlparse
 
-import patoolib
 import requests
 from loguru import logger
+from packman.api import client
+from packman.utils import archive, copy_strategy
+from packman.utils.archive import ArchiveIndex
+from packman.utils.concurrency import run_parallel
+from packman.utils.copy_strategy import CopyStrategy
+from packman.utils.download import (
+    DownloadChangedError,
+    DownloadedFile,
+    DownloadLock,
+    DownloadSegment,
+    PartialDownload,
+    download_path,
+    parse_content_range,
+    preallocate,
+    split_segments,
+)
 from packman.utils.files import remove_file, remove_path, temp_dir, temp_path
-from packman.utils.progress import ProgressCallback, StepProgress, progress_noop
+from packman.utils.hashing import (
+    ChecksumAlgorithm,
+    checksum,
+    default_algorithm,
+    format_checksum,
+    new_hash,
+)
+from packman.utils.journal import Durability, Journal, Record
+from packman.utils.progress import (
+    ByteProgress,
+    ProgressCallback,
+    StepProgress,
+    progress_noop,
+)
+from packman.utils.store import Store, StoreTree
 from packman.utils.uninterruptible import uninterruptible
 from pydantic import BaseModel
 
@@ -25,13 +55,18 @@ def _ensure_dir_exists_for_file(path: str) -> None:
     _ensure_dir_exists(os.path.dirname(path))
 
 
-def _copy(src: str, dest: str) -> None:
+def _copy(
+    src: str,
+    dest: str,
+    *,
+    discard_src: bool = False,
+    move: bool = False,
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+) -> CopyStrategy:
     _ensure_dir_exists_for_file(dest)
-    try:
-        shutil.copy2(src, dest)
-    except Exception:
-        # TODO clean up
-        ...
+    return copy_strategy.copy_file(
+        src, dest, discard_src=discard_src, move=move, on_chunk=on_chunk
+    )
 
 
 class OperationState(BaseModel):
@@ -39,55 +74,60 @@ class OperationState(BaseModel):
     temp_paths: Set[str] = set()
     last_path: Union[str, None] = None
     backups: Dict[str, str] = {}
+    downloads: Dict[str, PartialDownload] = {}
 
-    @staticmethod
-    def _get_tmp_path(path: str) -> str:
-        return f"{path}.tmp"
+    def apply(self, record: Record) -> None:
+        """
+        Applies a single journal record to this state.
+
+        Records without an "op" field are full snapshots of the state, as written by compaction or by older versions
+        which saved the whole state on every change.
+        """
+        op = record.get("op")
+        if op is None:
+            snapshot = OperationState(**record)
+            self.new_paths = snapshot.new_paths
+            self.temp_paths = snapshot.temp_paths
+            self.last_path = snapshot.last_path
+            self.backups = snapshot.backups
+            self.downloads = snapshot.downloads
+        elif op == "temp":
+            self.temp_paths.add(record["path"])
+            self.last_path = record["path"]
+        elif op == "untemp":
+            self.temp_paths.discard(record["path"])
+        elif op == "new":
+            self.new_paths.add(record["path"])
+        elif op == "backup":
+            self.backups[record["path"]] = record["backup"]
+        elif op == "download":
+            download = PartialDownload(**record["download"])
+            self.downloads[download.url] = download
+        elif op == "downloaded":
+            self.downloads.pop(record["url"], None)
+        else:
+            raise ValueError(f"unknown journal record: {op}")
 
     @staticmethod
     def load(path: str) -> "OperationState":
-
-        try:
-            with open(path, "r") as fp:
-                state = json.load(fp)
-                return OperationState(**state)
-        except Exception as exc:
-            logger.exception(exc)
-            tmp_path = OperationState._get_tmp_path(path)
-            with open(tmp_path, "r") as fp:
-                state = json.load(fp)
-                return OperationState(**state)
-
-    def save(self, path: str) -> None:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        try:
-            tmp_path = OperationState._get_tmp_path(path)
-            shutil.copyfile(path, tmp_path)
-        except FileNotFoundError:
-            tmp_path = None
-            pass
-        with open(path, "w") as fp:
-            text = self.json()
-            fp.write(text)
-        if tmp_path is not None:
-            remove_path(tmp_path)
+        """
+        Rebuilds the state by replaying the journal at the given path.
+        """
+        if not os.path.exists(path):
+            # Crashed mid-compaction before the replacement journal was moved into place
+            path = Journal._get_tmp_path(path)
+        state = OperationState()
+        for record in Journal.read(path):
+            state.apply(record)
+        return state
 
     @staticmethod
     def exists(path: str) -> bool:
-        return os.path.exists(path) or os.path.exists(
-            OperationState._get_tmp_path(path)
-        )
+        return Journal.exists(path)
 
     @staticmethod
     def remove(path: str) -> None:
-        try:
-            remove_path(path)
-        except FileNotFoundError:
-            return
-        try:
-            remove_path(OperationState._get_tmp_path(path))
-        except FileNotFoundError:
-            return
+        Journal.remove(path)
 
 
 class StateFileExistsError(FileExistsError):
@@ -103,37 +143,103 @@ class Operation:
         on_restore_progress: ProgressCallback = progress_noop,
         state: Optional[OperationState] = None,
         *,
-        request_timeout: float = 30,
+        request_timeout: Optional[float] = None,
         request_chunk_size: int = 500 * 1000,
+        request_retries: int = 3,
+        download_segments: int = 1,
+        min_segment_size: int = 8 * 1024 * 1024,
+        durability: Durability = Durability.BATCH,
+        compact_threshold: int = 1024,
+        max_workers: Optional[int] = None,
+        stream_archives: bool = False,
     ):
+        """
+        :param request_timeout: Timeout for download requests; if None, the HTTP client's configured timeouts are used.
+        :param request_retries: Number of times an interrupted download is resumed before giving up.
+        :param download_segments: Maximum number of byte ranges to download concurrently over separate connections,
+        where the server supports range requests.
+        :param min_segment_size: Minimum size of each of those byte ranges; smaller files use fewer connections.
+        :param durability: How eagerly state journal records are flushed to stable storage.
+        :param compact_threshold: Minimum number of journal records before the journal may be compacted.
+        :param max_workers: Maximum number of threads to use for file operations which can run concurrently; if None,
+        a default based on the CPU count is used.
+        :param stream_archives: If True, unpack_archive leaves zip archives unextracted so that install steps can read
+        their members straight from the archive.
+        """
         self.request_timeout = request_timeout
         self.request_chunk_size = request_chunk_size
+        self.request_retries = request_retries
+        self.download_segments = download_segments
+        self.min_segment_size = min_segment_size
+        self.compact_threshold = compact_threshold
+        self.max_workers = max_workers
+        self.stream_archives = stream_archives
+        # Guards bookkeeping and the state journal; file-system work happens outside it
+        self._lock = RLock()
 
         if state is None:
             self.new_paths: Set[str] = set()
             self.temp_paths: Set[str] = set()
             self.last_path: Optional[str] = None
             self.backups: Dict[str, str] = {}
+            self.downloads: Dict[str, PartialDownload] = {}
         else:
             self.new_paths = state.new_paths
             self.temp_paths = state.temp_paths
             self.last_path = state.last_path
             self.backups = state.backups
+            self.downloads = state.downloads
+        # Files downloaded by this operation, by their temporary path
+        self.downloaded: Dict[str, DownloadedFile] = {}
+        # Archives unpacked by this operation, by the path they were unpacked to
+        self.archives: Dict[str, str] = {}
+        # Checksums of files written by this operation, by their path, computed as they were written
+        self.checksums: Dict[str, str] = {}
+        self._abs_temp_paths = {os.path.abspath(path) for path in self.temp_paths}
+        self._linked_srcs: Set[str] = set()
+        # Hex SHA-256 digests of staged files, by their absolute path, so they need not be hashed when copied; these
+        # are recorded as SHA-256 checksums whatever the configured algorithm, as they are computed anyway
+        self._digests: Dict[str, str] = {}
+        # Called once when the operation is closed, whether or not it succeeded
+        self._close_callbacks: List[Callable[[], None]] = []
+        # Locks held on partial downloads this operation is writing to, by their path
+        self._download_locks: Dict[str, DownloadLock] = {}
 
         self.on_restore_progress = on_restore_progress
 
         os.makedirs(temp_dir(), exist_ok=True)
 
         self.state_path = None
+        self.journal: Optional[Journal] = None
         state_path = Operation._get_state_path(key=key)
         if state is None and OperationState.exists(state_path):
             raise StateFileExistsError(f"unable to create '{state_path}': file exists")
         self.state_path = state_path
+        self.journal = Journal(state_path, durability=durability)
+        if state is not None:
+            # Rewrite the recovered state as a fresh snapshot to continue appending to
+            self._compact()
 
     @staticmethod
     def _get_state_path(key: str) -> str:
         return os.path.join(temp_dir(), f"state_{key}.json")
 
+    @staticmethod
+    def find_keys(prefix: str = "") -> List[str]:
+        """
+        Returns the keys of all operations with recoverable state whose keys start with the given prefix.
+        """
+        keys: Set[str] = set()
+        try:
+            files = os.listdir(temp_dir())
+        except FileNotFoundError:
+            return []
+        for file in files:
+            for ext in (".json", Journal._get_tmp_path(".json")):
+                if file.startswith(f"state_{prefix}") and file.endswith(ext):
+                    keys.add(file.removeprefix("state_").removesuffix(ext))
+        return sorted(keys)
+
     def _capture_state(self) -> OperationState:
         return OperationState(
             new_paths={os.path.abspath(path) for path in self.new_paths},
@@ -145,32 +251,87 @@ class Operation:
                 os.path.abspath(key): os.path.abspath(value)
                 for key, value in self.backups.items()
             },
+            downloads=self.downloads,
         )
 
-    def _update_state(self) -> None:
+    def _compact(self) -> None:
+        assert self.journal is not None, "journal must exist by now"
         state = self._capture_state()
-        assert self.state_path is not None, "state_path must exist by now"
-        state.save(self.state_path)
+        self.journal.compact(json.loads(state.json()))
+
+    def _record(self, *records: Record) -> None:
+        """
+        Appends records describing a change to the state journal, compacting it if it has grown much larger than the
+        state it describes.
+        """
+        assert self.journal is not None, "journal must exist by now"
+        with self._lock:
+            self.journal.append(*records)
+            live_count = (
+                len(self.new_paths)
+                + len(self.temp_paths)
+                + len(self.backups)
+                + len(self.downloads)
+            )
+            if self.journal.record_count > max(self.compact_threshold, 2 * live_count):
+                self._compact()
 
     @staticmethod
     def recover(
-        key: str = _DEFAULT_KEY, on_restore_progress: ProgressCallback = progress_noop
+        key: str = _DEFAULT_KEY,
+        on_restore_progress: ProgressCallback = progress_noop,
+        durability: Durability = Durability.BATCH,
     ) -> "Operation":
         path = Operation._get_state_path(key=key)
         state = OperationState.load(path)
-        return Operation(key=key, on_restore_progress=on_restore_progress, state=state)
+        return Operation(
+            key=key,
+            on_restore_progress=on_restore_progress,
+            state=state,
+            durability=durability,
+        )
 
     def close(self) -> None:
         """
         Removes temporary files and cleans up any other temporary state.
+
+        Unfinished downloads are kept so that they can be resumed by a later operation.
         """
 
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:
+                logger.warning(f"failed to run close callback: {exc}")
+        for download in self.downloads.values():
+            # Downloads made to a temporary path, as another operation held the stable one, are not kept
+            if not os.path.exists(download.path) or download.path in self.temp_paths:
+                continue
+            try:
+                download.save()
+            except Exception as exc:
+                logger.warning(
+                    f"failed to keep partial download of {download.url}: {exc}"
+                )
+                continue
+        with self._lock:
+            locks, self._download_locks = self._download_locks, {}
+        for lock in locks.values():
+            lock.release()
         for path in self.temp_paths:
             try:
                 remove_path(path)
             except Exception as exc:
                 logger.warning(f"failed to discard temporary path {path}: {exc}")
                 continue
+        if self.journal is not None:
+            try:
+                self.journal.close()
+            except Exception as exc:
+                logger.warning(
+                    f"failed to close state journal {self.state_path}: {exc}"
+                )
         if self.state_path is not None:
             try:
                 OperationState.remove(self.state_path)
@@ -179,6 +340,13 @@ class Operation:
                     f"failed to discard state recovery file {self.state_path}: {exc}"
                 )
 
+    def call_on_close(self, callback: Callable[[], None]) -> None:
+        """
+        Registers a function to be called when the operation is closed, e.g. to release resources it was using.
+        """
+        with self._lock:
+            self._close_callbacks.append(callback)
+
     def __del__(self) -> None:
         self.close()
 
@@ -200,61 +368,456 @@ class Operation:
 
     def get_temp_path(self, ext: str = "") -> str:
         path = temp_path(ext=ext)
-        self.temp_paths.add(path)
-        self.last_path = path
-        self._update_state()
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            self.temp_paths.add(path)
+            self._abs_temp_paths.add(abs_path)
+            self.last_path = path
+            self._record({"op": "temp", "path": abs_path})
         return path
 
-    def backup_file(self, path: str) -> str:
+    def _is_staged(self, path: str) -> bool:
+        """
+        Returns True if the given path is or is within one of this operation's temporary paths.
+        """
+        path = os.path.abspath(path)
+        while True:
+            if path in self._abs_temp_paths:
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def _record_backup(self, path: str, backup_path: str) -> None:
+        with self._lock:
+            self.backups[path] = backup_path
+            self._record(
+                {
+                    "op": "backup",
+                    "path": os.path.abspath(path),
+                    "backup": os.path.abspath(backup_path),
+                }
+            )
+
+    def backup_file(self, path: str, move: bool = False) -> str:
+        """
+        Backs up the given file to a temporary path so it can be restored if this operation is rolled back.
+
+        :param move: If True, the file is about to be replaced or removed, so it may be moved out of the way instead of
+        being copied.
+        """
         backup_path = self.get_temp_path()
         logger.debug(f"backing up {path} to {backup_path}")
+        if move and copy_strategy.is_supported(CopyStrategy.RENAME, path, backup_path):
+            # Recorded ahead of the move; restore skips backups which never made it into place
+            self._record_backup(path, backup_path)
+            if copy_strategy.try_rename(path, backup_path):
+                return backup_path
+            backup_path = self.get_temp_path()
+        # Recorded only once complete so that a partial backup is never restored
         _copy(path, backup_path)
-        self.backups[path] = backup_path
-        self._update_state()
+        self._record_backup(path, backup_path)
         return backup_path
 
+    def _record_new_path(self, path: str) -> None:
+        # Recorded before the file is written so that a crash part-way through writing it still rolls it back
+        with self._lock:
+            if path not in self.new_paths:
+                self.new_paths.add(path)
+                self._record({"op": "new", "path": os.path.abspath(path)})
+
     def should_backup_file(self, path: str) -> bool:
-        return (
-            # Don't back up our own files
-            path not in self.temp_paths
-            and path not in self.new_paths
-            # Don't back up files already backed up
-            and path not in self.backups
-            and os.path.exists(path)
-        )
+        with self._lock:
+            owned = (
+                # Don't back up our own files
+                path in self.temp_paths
+                or path in self.new_paths
+                # Don't back up files already backed up
+                or path in self.backups
+            )
+        return not owned and os.path.exists(path)
 
     def write_file(self, path: str, content: Union[bytes, str]) -> None:
         if self.should_backup_file(path):
-            self.backup_file(path)
+            self.backup_file(path, move=True)
 
         logger.debug(f"writing to {path}")
+        self._record_new_path(path)
         _ensure_dir_exists_for_file(path)
+        # Replace rather than write through any file left in place, in case it shares its inode
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
         if isinstance(content, str):
             with open(path, "w") as fp:
                 fp.write(content)
+            # Hashed as written, as newlines may have been translated
+            self._record_checksum(path, checksum(path))
         else:
             with open(path, "wb") as fp:
                 fp.write(content)
-        self.new_paths.add(path)
-        self._update_state()
+            algorithm = default_algorithm()
+            hash = new_hash(algorithm)
+            hash.update(content)
+            self._record_checksum(path, format_checksum(algorithm, hash.hexdigest()))
 
-    def copy_file(self, src: str, dest: str) -> None:
+    def _record_checksum(self, path: str, chk: str) -> None:
+        with self._lock:
+            self.checksums[path] = chk
+
+    def record_digests(self, dir: str, files: Dict[str, str]) -> None:
+        """
+        Records the known hex SHA-256 digests of files staged beneath the given directory, by their POSIX-style path
+        relative to it, so that they need not be hashed when copied into place.
+        """
+        digests = {
+            os.path.abspath(os.path.join(dir, *name.split("/"))): digest
+            for name, digest in files.items()
+        }
+        with self._lock:
+            self._digests.update(digests)
+
+    def copy_file(self, src: str, dest: str) -> CopyStrategy:
+        """
+        Copies src to dest, returning the strategy used to do so, and records its checksum.
+
+        Files staged within this operation's temporary paths may be hard-linked into place, as the staged copy will
+        be discarded when the operation closes.
+
+        Files are hashed as they are copied unless their digest is already known; where a strategy copies without
+        passing the file's contents through this process, the copy is hashed afterwards instead.
+        """
         if self.should_backup_file(dest):
-            self.backup_file(dest)
+            self.backup_file(dest, move=True)
 
         logger.debug(f"copying {src} to {dest}")
-        _copy(src, dest)
-        self.new_paths.add(dest)
-        self._update_state()
+        self._record_new_path(dest)
+        abs_src = os.path.abspath(src)
+        with self._lock:
+            # A staged file is only linked once so that two destinations never share an inode
+            discard_src = abs_src not in self._linked_srcs and self._is_staged(abs_src)
+            if discard_src:
+                self._linked_srcs.add(abs_src)
+            digest = self._digests.get(abs_src)
+        algorithm = default_algorithm()
+        hash = new_hash(algorithm) if digest is None else None
+        strategy = _copy(
+            src,
+            dest,
+            discard_src=discard_src,
+            on_chunk=hash.update if hash is not None else None,
+        )
+        if digest is not None:
+            chk = format_checksum(ChecksumAlgorithm.SHA256, digest)
+        elif strategy == CopyStrategy.COPY:
+            assert hash is not None
+            chk = format_checksum(algorithm, hash.hexdigest())
+        else:
+            chk = checksum(dest)
+        self._record_checksum(dest, chk)
+        return strategy
+
+    def copy_files(
+        self,
+        files: Dict[str, str],
+        on_progress: ProgressCallback = progress_noop,
+    ) -> None:
+        """
+        Copies each source path in the given dictionary to its destination path, using up to max_workers threads.
+
+        If any copy fails, copies already in progress are allowed to finish before the error is raised, so that
+        rolling back the operation afterwards cannot race with them.
+        """
+        step_progress = StepProgress.from_step_count(
+            step_count=len(files), on_progress=on_progress
+        )
+        run_parallel(
+            lambda item: self.copy_file(*item),
+            files.items(),
+            max_workers=self.max_workers,
+            on_done=lambda item, result: step_progress.advance(),
+        )
+
+    def extract_file(self, index: ArchiveIndex, name: str, dest: str) -> None:
+        """
+        Extracts a single member of an indexed archive straight to dest.
+        """
+        if self.should_backup_file(dest):
+            self.backup_file(dest, move=True)
+
+        logger.debug(f"extracting {name} from {index.path} to {dest}")
+        self._record_new_path(dest)
+        try:
+            os.remove(dest)
+        except FileNotFoundError:
+            pass
+        digest = index.extract(name, dest)
+        self._record_checksum(dest, format_checksum(ChecksumAlgorithm.SHA256, digest))
+
+    def extract_files(
+        self,
+        index: ArchiveIndex,
+        files: Dict[str, str],
+        on_progress: ProgressCallback = progress_noop,
+    ) -> None:
+        """
+        Extracts each member of an indexed archive in the given dictionary straight to its destination path, using up
+        to max_workers threads.
+
+        If any extraction fails, extractions already in progress are allowed to finish before the error is raised, as
+        with copy_files.
+        """
+        progress = ByteProgress(
+            total=sum(index.file_size(name) for name in files), on_progress=on_progress
+        )
+        run_parallel(
+            lambda item: self.extract_file(index, *item),
+            files.items(),
+            max_workers=self.max_workers,
+            on_done=lambda item, result: progress.advance(index.file_size(item[0])),
+        )
 
     def remove_file(self, path: str) -> None:
         if self.should_backup_file(path):
-            self.backup_file(path)
+            self.backup_file(path, move=True)
         logger.debug(f"deleting {path}")
         remove_file(path)
-        if path in self.temp_paths:
-            self.temp_paths.remove(path)
-            self._update_state()
+        with self._lock:
+            if path in self.temp_paths:
+                self.temp_paths.remove(path)
+                self._abs_temp_paths.discard(os.path.abspath(path))
+                self._record({"op": "untemp", "path": os.path.abspath(path)})
+
+    def _record_download(self, download: PartialDownload) -> None:
+        with self._lock:
+            self.downloads[download.url] = download
+            self._record({"op": "download", "download": json.loads(download.json())})
+
+    def _record_downloaded(self, url: str) -> None:
+        with self._lock:
+            self.downloads.pop(url, None)
+            self._record({"op": "downloaded", "url": url})
+
+    def _get_download(self, url: str, ext: str) -> PartialDownload:
+        """
+        Returns the partial download of the given URL to resume, whether from this operation or one before it.
+        """
+        with self._lock:
+            download = self.downloads.get(url)
+        if download is None or not os.path.exists(download.path):
+            download = None
+            path = download_path(url, ext=ext)
+        else:
+            path = download.path
+
+        with self._lock:
+            locked = path in self._download_locks
+        if not locked:
+            lock = DownloadLock.acquire(path)
+            if lock is None:
+                logger.debug(
+                    f"partial download of {url} is in use by another operation; downloading separately"
+                )
+                return PartialDownload(url=url, path=self.get_temp_path(ext=ext))
+            with self._lock:
+                self._download_locks[path] = lock
+
+        if download is not None:
+            download.written = min(download.written, os.path.getsize(download.path))
+            return download
+        download = PartialDownload.load(url, ext=ext)
+        if download is not None:
+            return download
+        return PartialDownload(url=url, path=path)
+
+    def _fetch(
+        self, download: PartialDownload, on_progress: ProgressCallback
+    ) -> Optional[str]:
+        """
+        Fetches the rest of the given download, resuming from where it left off where the server allows.
+
+        :returns: The hex SHA-256 digest of the file, if it was downloaded from the start and so could be hashed as it
+        was written; otherwise None.
+        """
+        update_interval = timedelta(milliseconds=400)
+
+        headers: Dict[str, str] = {}
+        validator = download.get_validator()
+        if download.written and validator is not None:
+            headers["Range"] = f"bytes={download.written}-"
+            headers["If-Range"] = validator
+            logger.debug(f"resuming {download.url} from byte {download.written}")
+
+        res = client.get(
+            download.url, headers=headers, stream=True, timeout=self.request_timeout
+        )
+        if res.status_code == 416 and download.written:
+            # Partial file is no longer valid for the remote file; start over
+            logger.debug(f"range not satisfiable for {download.url}; restarting")
+            download.written = 0
+            res.close()
+            res = client.get(download.url, stream=True, timeout=self.request_timeout)
+        res.raise_for_status()
+
+        content_length = res.headers.get("content-length")
+        if (
+            res.status_code == 206
+            and parse_content_range(res.headers.get("content-range", ""))
+            == download.written
+        ):
+            if content_length is not None:
+                download.total = download.written + int(content_length)
+        else:
+            if download.written:
+                logger.debug(f"server did not resume {download.url}; restarting")
+            download.written = 0
+            download.update_validators(res.headers)
+            download.total = int(content_length) if content_length is not None else None
+        self._record_download(download)
+
+        _ensure_dir_exists_for_file(download.path)
+        mode = "r+b" if download.written and os.path.exists(download.path) else "wb"
+        # Resumed downloads are not hashed, as that would mean re-reading what was already written
+        hash = hashlib.sha256() if not download.written else None
+        with open(download.path, mode) as file:
+            file.seek(download.written)
+            file.truncate()
+            time = datetime.now()
+
+            try:
+                for chunk in res.iter_content(self.request_chunk_size):
+                    file.write(chunk)
+                    if hash is not None:
+                        hash.update(chunk)
+                    download.written += len(chunk)
+
+                    now = datetime.now()
+                    if now - time >= update_interval:
+                        # Only bytes which have been handed to the OS are recorded as written
+                        file.flush()
+                        self._record_download(download)
+                        if download.total:
+                            on_progress(download.written / download.total)
+                        time = now
+            finally:
+                file.flush()
+                self._record_download(download)
+
+        if download.total is not None and download.written < download.total:
+            raise requests.ConnectionError(
+                f"connection closed after {download.written} of {download.total} bytes"
+            )
+        return hash.hexdigest() if hash is not None else None
+
+    def _plan_segments(self, download: PartialDownload) -> bool:
+        """
+        Splits a fresh download into segments if the server supports range requests and the file is large enough to be
+        worth it, returning False if it should be downloaded in a single stream instead.
+        """
+        if self.download_segments < 2 or download.get_written():
+            return False
+        try:
+            res = client.head(
+                download.url, allow_redirects=True, timeout=self.request_timeout
+            )
+            res.raise_for_status()
+        except requests.RequestException as exc:
+            logger.debug(f"unable to probe {download.url}; not segmenting: {exc}")
+            return False
+
+        content_length = res.headers.get("content-length")
+        if (
+            res.headers.get("accept-ranges", "").lower() != "bytes"
+            or not content_length
+        ):
+            return False
+        download.update_validators(res.headers)
+        if download.get_validator() is None:
+            # Segments could otherwise be stitched together from different versions of the file
+            return False
+        total = int(content_length)
+        count = min(self.download_segments, total // self.min_segment_size)
+        if count < 2:
+            return False
+
+        logger.debug(f"downloading {download.url} in {count} segments")
+        download.total = total
+        download.segments = split_segments(total, count)
+        _ensure_dir_exists_for_file(download.path)
+        preallocate(download.path, total)
+        self._record_download(download)
+        return True
+
+    def _fetch_segment(
+        self,
+        download: PartialDownload,
+        segment: DownloadSegment,
+        progress: ByteProgress,
+    ) -> None:
+        update_interval = timedelta(milliseconds=400)
+        validator = download.get_validator()
+        assert validator is not None, "segmented downloads must have a validator"
+
+        res = client.get(
+            download.url,
+            headers={
+                "Range": f"bytes={segment.offset}-{segment.end}",
+                "If-Range": validator,
+            },
+            stream=True,
+            timeout=self.request_timeout,
+        )
+        res.raise_for_status()
+        if (
+            res.status_code != 206
+            or parse_content_range(res.headers.get("content-range", ""))
+            != segment.offset
+        ):
+            raise DownloadChangedError(f"{download.url} changed during download")
+
+        with open(download.path, "r+b") as file:
+            file.seek(segment.offset)
+            time = datetime.now()
+            try:
+                for chunk in res.iter_content(self.request_chunk_size):
+                    # Servers may send more than was asked for
+                    chunk = chunk[: segment.end + 1 - segment.offset]
+                    file.write(chunk)
+                    segment.written += len(chunk)
+                    progress.advance(len(chunk))
+                    if segment.done:
+                        break
+
+                    now = datetime.now()
+                    if now - time >= update_interval:
+                        file.flush()
+                        self._record_download(download)
+                        time = now
+            finally:
+                file.flush()
+                self._record_download(download)
+
+        if not segment.done:
+            raise requests.ConnectionError(
+                f"connection closed at byte {segment.offset} of segment ending {segment.end}"
+            )
+
+    def _fetch_segments(
+        self, download: PartialDownload, on_progress: ProgressCallback
+    ) -> None:
+        """
+        Fetches the remaining segments of the given download concurrently, each over its own connection.
+        """
+        assert download.total is not None, "segmented downloads must have a size"
+        progress = ByteProgress(total=download.total, on_progress=on_progress)
+        progress.advance(download.get_written())
+        run_parallel(
+            lambda segment: self._fetch_segment(download, segment, progress),
+            [segment for segment in download.segments if not segment.done],
+            max_workers=len(download.segments),
+        )
 
     def download_file(
         self,
@@ -262,8 +825,15 @@ class Operation:
         ext: Optional[str] = "",
         on_progress: ProgressCallback = progress_noop,
     ) -> str:
-        update_interval = timedelta(milliseconds=400)
+        """
+        Downloads the given URL to a temporary path, returning it.
+
+        Progress is recorded in the state journal as the download goes, so a download interrupted by a dropped
+        connection is resumed with a range request, both here and by later operations.
 
+        Large files are split into up to download_segments byte ranges which are fetched concurrently, where the server
+        supports range requests; otherwise they are downloaded in a single stream.
+        """
         if ext is None:
             parsed_url = urlparse.urlparse(url)
             url_path = parsed_url.path
@@ -272,34 +842,151 @@ class Operation:
                 ext = url_path[extsep_idx:]
             else:
                 ext = ""
-        res = requests.get(url, stream=True, timeout=self.request_timeout)
-        res.raise_for_status()
-        path = self.get_temp_path(ext=ext)
-        logger.debug(f"downloading {url} to {path}")
-        with open(path, "bw") as file:
-            pending_size = int(res.headers["content-length"])
-            downloaded_size = 0
-            time = datetime.now()
+        download = self._get_download(url, ext=ext)
+        logger.debug(f"downloading {url} to {download.path}")
 
-            for chunk in res.iter_content(self.request_chunk_size):
-                file.write(chunk)
-                downloaded_size += len(chunk)
+        digest: Optional[str] = None
+        attempt = 0
+        while True:
+            try:
+                if download.segments or self._plan_segments(download):
+                    self._fetch_segments(download, on_progress=on_progress)
+                else:
+                    digest = self._fetch(download, on_progress=on_progress)
+                break
+            except DownloadChangedError as exc:
+                attempt += 1
+                if attempt > self.request_retries:
+                    raise
+                logger.warning(f"restarting download of {url}: {exc}")
+                download.reset()
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as exc:
+                attempt += 1
+                if attempt > self.request_retries:
+                    raise
+                logger.warning(f"download of {url} interrupted, retrying: {exc}")
 
-                now = datetime.now()
-                if now - time >= update_interval:
-                    on_progress(downloaded_size / pending_size)
-                    time = now
+        path = self.get_temp_path(ext=ext)
+        download.finish(path)
+        self._record_downloaded(url)
+        with self._lock:
+            lock = self._download_locks.pop(download.path, None)
+        if lock is not None:
+            lock.release()
+        with self._lock:
+            self.downloaded[path] = DownloadedFile(
+                url=url,
+                size=os.path.getsize(path),
+                digest=digest,
+                etag=download.etag,
+                last_modified=download.last_modified,
+            )
+        on_progress(1.0)
         return path
 
-    def extract_archive(self, path: str) -> str:
+    def extract_archive(
+        self, path: str, on_progress: ProgressCallback = progress_noop
+    ) -> str:
         dir = self.get_temp_path()
         logger.debug(f"extracting {path} to {dir}")
-        patoolib.extract_archive(path, outdir=dir, verbosity=-1)
+        digests = archive.extract_archive(
+            path, outdir=dir, on_progress=on_progress, max_workers=self.max_workers
+        )
+        with self._lock:
+            self._digests.update(
+                (os.path.abspath(file), digest) for file, digest in digests.items()
+            )
+        return dir
+
+    def unpack_archive(
+        self,
+        path: str,
+        on_progress: ProgressCallback = progress_noop,
+        keep: bool = False,
+    ) -> str:
+        """
+        Makes the contents of the archive at the given path available as this operation's last path, returning it.
+
+        If stream_archives is enabled and the archive can be indexed, the archive itself becomes the last path so that
+        install steps can read its members directly; otherwise it is extracted to a temporary directory and, unless
+        keep is True or it was downloaded by this operation, removed.
+
+        The archive unpacked to each path is recorded in archives.
+        """
+        if self.stream_archives and archive.is_indexable(path):
+            logger.debug(f"streaming from {path} without extracting")
+            with self._lock:
+                self.last_path = path
+                self.archives[path] = path
+            on_progress(1.0)
+            return path
+
+        dir = self.extract_archive(path, on_progress=on_progress)
+        with self._lock:
+            self.archives[dir] = path
+            # Downloaded archives are left for the cache to keep; they are removed with the other temporary paths
+            downloaded = path in self.downloaded
+        if not keep and not downloaded:
+            self.remove_file(path)
+        return dir
+
+    def materialise(
+        self,
+        store: Store,
+        tree: StoreTree,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> str:
+        """
+        Recreates a stored tree in a temporary directory, linking its files from the store where possible, and makes it
+        this operation's last path, returning it.
+
+        As linked files share their storage with the store, copy_file never links them onwards.
+        """
+        dir = self.get_temp_path()
+        logger.debug(f"materialising stored tree in {dir}")
+        paths = store.materialise(
+            tree, dir, max_workers=self.max_workers, on_progress=on_progress
+        )
+        self.record_digests(dir, tree.files)
+        with self._lock:
+            self._linked_srcs.update(os.path.abspath(path) for path in paths)
+            self.last_path = dir
         return dir
 
+    def _restore_remove(self, path: str) -> bool:
+        logger.debug(f"cleaning up {path}")
+        try:
+            remove_path(path)
+        except Exception as exc:
+            logger.error(f"failed to clean up file: {path}")
+            logger.exception(exc)
+            return False
+        return True
+
+    def _restore_backup(self, backup: Tuple[str, str]) -> bool:
+        dest, src = backup
+        logger.debug(f"restoring {src} to {dest}")
+        try:
+            if not os.path.exists(src):
+                # Backup was recorded ahead of a move which never happened
+                logger.warning(f"no backup to restore for {dest}")
+            else:
+                # Backups are discarded on close anyway, so may be moved back into place
+                _copy(src, dest, move=True)
+        except Exception as exc:
+            logger.error(f"failed to restore file: {dest}")
+            logger.exception(exc)
+            return False
+        return True
+
     def restore(self, on_progress: Optional[ProgressCallback] = None) -> bool:
         """
-        Deletes all new files and restores all backups made since instantiation or the last restore.
+        Deletes all new files and restores all backups made since instantiation or the last restore, using up to
+        max_workers threads.
 
         Returns True if errors were encountered during restore.
         """
@@ -313,26 +1000,26 @@ class Operation:
         )
         on_progress(0.0)
 
-        for path in self.new_paths:
-            logger.debug(f"cleaning up {path}")
-            try:
-                remove_path(path)
-                progress.advance()
-            except Exception as exc:
-                logger.error(f"failed to clean up file: {path}")
-                logger.exception(exc)
+        def on_done(path: str, success: bool) -> None:
+            nonlocal errors
+            if not success:
                 errors = True
+            progress.advance()
 
-        for dest, src in self.backups.items():
-            logger.debug(f"restoring {src} to {dest}")
-            try:
-                _copy(src, dest)
-                progress.advance()
-            except Exception as exc:
-                logger.error(f"failed to restore file: {dest}")
-                logger.exception(exc)
-                errors = True
-                continue
+        # All deletions finish before any backup is restored, so a backup is never restored to a path which is still
+        # being deleted, nor into a directory which is being cleaned up for being empty
+        run_parallel(
+            self._restore_remove,
+            list(self.new_paths),
+            max_workers=self.max_workers,
+            on_done=on_done,
+        )
+        run_parallel(
+            self._restore_backup,
+            list(self.backups.items()),
+            max_workers=self.max_workers,
+            on_done=on_done,
+        )
 
         on_progress(1.0)
 
@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+from threading import Lock
 from typing import Callable, Optional
 
 from loguru import logger
@@ -74,3 +76,42 @@ class RestoreProgress:
             restore_progress(p)
 
         return on_restore_progress
+
+
+class ByteProgress:
+    """
+    Reports progress as a proportion of a total number of bytes, which may be advanced from several threads at once.
+
+    Updates are throttled to at most one per update_interval and are never reported concurrently.
+    """
+
+    def __init__(
+        self,
+        total: int,
+        on_progress: ProgressCallback,
+        update_interval: timedelta = timedelta(milliseconds=400),
+    ) -> None:
+        self.total = total
+        self.done = 0
+        self.on_progress = on_progress
+        self.update_interval = update_interval
+        self._time = datetime.now()
+        self._lock = Lock()
+        self._cb_error: bool = False
+
+    def advance(self, size: int) -> None:
+        """ Adds the given number of bytes to the amount done so far. """
+        with self._lock:
+            self.done += size
+            now = datetime.now()
+            if now - self._time < self.update_interval:
+                return
+            self._time = now
+            try:
+                self.on_progress(self.done / self.total if self.total else 1.0)
+            except Exception as exc:
+                if self._cb_error:
+                    return
+                else:
+                    logger.warning(f"on_progress callback threw error: {exc}")
+                    self._cb_error = True
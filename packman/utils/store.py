@@ -0,0 +1,489 @@
+import hashlib
+import json
+import os
+import posixpath
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from loguru import logger
+from packman.utils import copy_strategy
+from packman.utils.archive import ArchiveIndex, HashingWriter, copy_stream
+from packman.utils.concurrency import run_parallel
+from packman.utils.download import DownloadedFile
+from packman.utils.files import remove_file
+from packman.utils.hashing import ChecksumAlgorithm, file_digest
+from packman.utils.progress import ProgressCallback, StepProgress, progress_noop
+from pydantic import BaseModel
+
+
+class StoreTree(BaseModel):
+    """
+    The contents of one package version, as stored in a Store.
+    """
+
+    # Path of each file relative to the package root, using forward slashes, mapped to the digest of its contents
+    files: Dict[str, str] = {}
+    # Path of each directory relative to the package root, so that empty directories are kept too
+    dirs: Set[str] = set()
+    # Digest of the archive the package was downloaded as, if it is kept whole instead of as individual files
+    archive: Optional[str] = None
+    # Where the archive was downloaded from
+    source: Optional[DownloadedFile] = None
+
+    def digests(self) -> Set[str]:
+        """
+        Returns the digest of every blob this tree references.
+        """
+        digests = set(self.files.values())
+        if self.archive is not None:
+            digests.add(self.archive)
+        return digests
+
+
+def hash_file(path: str) -> str:
+    """
+    Returns the hex SHA-256 digest of the given file's contents, as used to address it within a Store.
+    """
+    return file_digest(path, ChecksumAlgorithm.SHA256)
+
+
+def _unref(refs: Dict[str, int], tree: StoreTree) -> Set[str]:
+    """
+    Drops a reference to each blob of the given tree, returning the digests of those no longer referenced.
+    """
+    unreferenced: Set[str] = set()
+    for digest in tree.digests():
+        ref_count = refs.get(digest, 0)
+        refs[digest] = max(0, ref_count - 1)
+        if ref_count == 1:
+            unreferenced.add(digest)
+    return unreferenced
+
+
+class Store:
+    """
+    A content-addressed store of package files.
+
+    Each distinct file is kept once as a blob named by the digest of its contents, however many package versions
+    contain it; each package version is kept as a tree mapping its file paths to blobs, or referencing the blob of the
+    archive it was downloaded as. Blobs are reference counted by the trees which contain them so that unreferenced
+    blobs can be garbage collected.
+
+    Blobs must never be modified, so they are only ever linked to paths which will not be written to.
+    """
+
+    # Guards tree and reference count changes across all stores in this process
+    _lock = RLock()
+    # Blobs added by this process which are not yet referenced by a tree, and so must not be garbage collected
+    _pending: Set[str] = set()
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @staticmethod
+    def tree_key(name: str, version: str, option: str) -> str:
+        key_bytes = bytes(f"{name}\0{version}\0{option}", "utf-8")
+        return hashlib.md5(key_bytes).hexdigest()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, "objects", digest[:2], digest)
+
+    def _tree_path(self, key: str) -> str:
+        return os.path.join(self.path, "trees", f"{key}.json")
+
+    def _refs_path(self) -> str:
+        return os.path.join(self.path, "refs.json")
+
+    def _size_path(self) -> str:
+        return os.path.join(self.path, "size.json")
+
+    def _write_json(self, path: str, content: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid4()}.tmp"
+        with open(tmp_path, "w") as fp:
+            fp.write(content)
+        os.replace(tmp_path, path)
+
+    def _load_refs(self) -> Dict[str, int]:
+        try:
+            with open(self._refs_path(), "r") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return {}
+
+    def _load_size(self) -> int:
+        try:
+            with open(self._size_path(), "r") as fp:
+                return int(json.load(fp))
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            logger.warning(f"remeasuring store with unreadable size: {exc}")
+        # Stores from before the size was kept are measured once
+        return sum(
+            self._blob_size(digest)
+            for digest, ref_count in self._load_refs().items()
+            if ref_count > 0
+        )
+
+    def _save_refs(self, refs: Dict[str, int], size: int) -> None:
+        """
+        Saves the reference count of each blob along with the total size of the referenced blobs, which is kept
+        alongside them so that the store need not be walked to measure it.
+        """
+        self._write_json(self._refs_path(), json.dumps(refs))
+        self._write_json(self._size_path(), json.dumps(size))
+
+    def _blob_size(self, digest: str) -> int:
+        try:
+            return os.path.getsize(self.blob_path(digest))
+        except FileNotFoundError:
+            return 0
+
+    def has_blob(self, digest: str) -> bool:
+        return os.path.exists(self.blob_path(digest))
+
+    def _mark_pending(self, digest: str) -> None:
+        with Store._lock:
+            Store._pending.add(digest)
+
+    def _add_blob(self, tmp_path: str, digest: str) -> None:
+        """
+        Moves a fully written temporary file into place as the blob with the given digest, unless that blob exists.
+        """
+        blob_path = self.blob_path(digest)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+
+    def _get_tmp_path(self) -> str:
+        dir = os.path.join(self.path, "tmp")
+        os.makedirs(dir, exist_ok=True)
+        return os.path.join(dir, str(uuid4()))
+
+    def add_file(self, path: str) -> str:
+        """
+        Adds the contents of the given file as a blob, returning its digest.
+        """
+        # Never linked, as the source may be modified after this returns
+        return self.add_blob_file(path)
+
+    def add_blob_file(
+        self,
+        path: str,
+        digest: Optional[str] = None,
+        *,
+        discard_src: bool = False,
+        move: bool = False,
+    ) -> str:
+        """
+        Adds the given file as a single blob, returning its digest.
+
+        :param digest: The file's digest if already known, e.g. from hashing it as it was downloaded.
+        :param discard_src: If True, the file will not be modified before it is discarded, so it may share its inode
+        with the blob.
+        :param move: If True, the file is not needed afterwards, so it may simply be moved into the store.
+        """
+        if digest is None:
+            digest = hash_file(path)
+        self._mark_pending(digest)
+        if self.has_blob(digest):
+            return digest
+        tmp_path = self._get_tmp_path()
+        try:
+            copy_strategy.copy_file(path, tmp_path, discard_src=discard_src, move=move)
+            self._add_blob(tmp_path, digest)
+        except BaseException:
+            remove_file(tmp_path)
+            raise
+        return digest
+
+    def verify_blob(self, digest: str) -> bool:
+        """
+        Returns True if the blob with the given digest exists and its contents still match its digest.
+        """
+        try:
+            return hash_file(self.blob_path(digest)) == digest
+        except FileNotFoundError:
+            return False
+
+    def add_archive_member(self, archive: ArchiveIndex, name: str) -> str:
+        """
+        Adds the contents of the given archive member as a blob, hashing it as it is extracted, returning its digest.
+        """
+        tmp_path = self._get_tmp_path()
+        try:
+            with archive.open(name) as src, open(tmp_path, "wb") as dest:
+                writer = HashingWriter(dest)
+                copy_stream(src, writer)  # type: ignore
+            digest = writer.hash.hexdigest()
+            self._mark_pending(digest)
+            self._add_blob(tmp_path, digest)
+        except BaseException:
+            remove_file(tmp_path)
+            raise
+        return digest
+
+    def add_dir(
+        self,
+        path: str,
+        max_workers: Optional[int] = None,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> StoreTree:
+        """
+        Adds every file beneath the given directory as a blob, using up to max_workers threads, returning the tree
+        describing the directory.
+        """
+        tree = StoreTree()
+        files: List[Tuple[str, str]] = []
+        for root, dirs, filenames in os.walk(path):
+            relroot = os.path.relpath(root, path).replace(os.sep, "/")
+            tree.dirs.add(relroot)
+            for filename in filenames:
+                files.append(
+                    (
+                        posixpath.normpath(posixpath.join(relroot, filename)),
+                        os.path.join(root, filename),
+                    )
+                )
+
+        step_progress = StepProgress.from_step_count(
+            step_count=len(files), on_progress=on_progress
+        )
+
+        def on_done(file: Tuple[str, str], digest: str) -> None:
+            tree.files[file[0]] = digest
+            step_progress.advance()
+
+        run_parallel(
+            lambda file: self.add_file(file[1]),
+            files,
+            max_workers=max_workers,
+            on_done=on_done,
+        )
+        return tree
+
+    def add_archive(
+        self,
+        archive: ArchiveIndex,
+        max_workers: Optional[int] = None,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> StoreTree:
+        """
+        Adds every file within the given archive as a blob, using up to max_workers threads, returning the tree
+        describing the archive.
+        """
+        tree = StoreTree(dirs=set(archive.walk_dirs("")))
+        files = [name for _, name in archive.walk_files("")]
+
+        step_progress = StepProgress.from_step_count(
+            step_count=len(files), on_progress=on_progress
+        )
+
+        def on_done(name: str, digest: str) -> None:
+            tree.files[name] = digest
+            step_progress.advance()
+
+        run_parallel(
+            lambda name: self.add_archive_member(archive, name),
+            files,
+            max_workers=max_workers,
+            on_done=on_done,
+        )
+        return tree
+
+    def get_tree(self, key: str) -> Optional[StoreTree]:
+        """
+        Returns the tree stored under the given key, or None if there is none or any of its blobs are missing.
+        """
+        try:
+            tree = StoreTree.parse_file(self._tree_path(key))
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"ignoring unreadable store tree {key}: {exc}")
+            return None
+        for digest in tree.digests():
+            if not self.has_blob(digest):
+                logger.warning(f"ignoring store tree {key} with missing blob {digest}")
+                return None
+        return tree
+
+    def _read_tree(self, key: str) -> Optional[StoreTree]:
+        try:
+            return StoreTree.parse_file(self._tree_path(key))
+        except FileNotFoundError:
+            return None
+
+    def put_tree(self, key: str, tree: StoreTree) -> None:
+        """
+        Stores the given tree, whose blobs must already have been added, under the given key, replacing any tree
+        already stored under it.
+        """
+        with Store._lock:
+            size = self._load_size()
+            refs = self._load_refs()
+            previous = self._read_tree(key)
+            if previous is not None:
+                for digest in _unref(refs, previous):
+                    size -= self._blob_size(digest)
+            for digest in tree.digests():
+                if refs.get(digest, 0) == 0:
+                    size += self._blob_size(digest)
+                refs[digest] = refs.get(digest, 0) + 1
+            # Written before the references are, so that a crash in between leaves blobs over-referenced rather than
+            # collectable while still in use
+            self._write_json(self._tree_path(key), tree.json())
+            self._save_refs(refs, size)
+            Store._pending.difference_update(tree.digests())
+
+    def remove_tree(self, key: str) -> bool:
+        """
+        Removes the tree stored under the given key, leaving its blobs to be garbage collected if nothing else
+        references them; returns False if there is no such tree.
+        """
+        with Store._lock:
+            tree = self._read_tree(key)
+            if tree is None:
+                return False
+            size = self._load_size()
+            refs = self._load_refs()
+            for digest in _unref(refs, tree):
+                size -= self._blob_size(digest)
+            self._save_refs(refs, max(0, size))
+            remove_file(self._tree_path(key))
+        return True
+
+    def keys(self) -> List[str]:
+        """
+        Returns the key of every stored tree.
+        """
+        try:
+            files = os.listdir(os.path.join(self.path, "trees"))
+        except FileNotFoundError:
+            return []
+        return sorted(file[: -len(".json")] for file in files if file.endswith(".json"))
+
+    def _iter_blobs(self) -> Iterable[Tuple[str, str]]:
+        for root, _, files in os.walk(os.path.join(self.path, "objects")):
+            for file in files:
+                yield file, os.path.join(root, file)
+
+    def size(self) -> int:
+        """
+        Returns the total size in bytes of every blob referenced by a tree, which is all of the store once garbage has
+        been collected.
+        """
+        with Store._lock:
+            return self._load_size()
+
+    def tree_size(self, tree: StoreTree) -> int:
+        """
+        Returns the total size in bytes of the blobs referenced by the given tree, which may be shared with others.
+        """
+        size = 0
+        for digest in tree.digests():
+            try:
+                size += os.path.getsize(self.blob_path(digest))
+            except FileNotFoundError:
+                continue
+        return size
+
+    def unshared_size(self, key: str) -> int:
+        """
+        Returns the total size in bytes of the blobs referenced only by the tree stored under the given key, i.e. those
+        which would be garbage collected were it removed.
+        """
+        with Store._lock:
+            tree = self._read_tree(key)
+            if tree is None:
+                return 0
+            refs = self._load_refs()
+            size = 0
+            for digest in tree.digests():
+                if refs.get(digest, 0) > 1 or digest in Store._pending:
+                    continue
+                try:
+                    size += os.path.getsize(self.blob_path(digest))
+                except FileNotFoundError:
+                    continue
+            return size
+
+    def collect_garbage(self, clean_tmp: bool = False) -> Tuple[int, int]:
+        """
+        Removes every blob not referenced by any tree, except those this process is adding.
+
+        :param clean_tmp: If True, anything left in the temporary directory by an interrupted write is removed too; must
+        not be used while files are being added.
+        :returns: A 2-tuple of the number of blobs removed and the total number of bytes freed.
+        """
+        count = 0
+        size = 0
+        # Remeasured while walking the blobs anyway, correcting any drift from an interrupted change
+        referenced_size = 0
+        with Store._lock:
+            refs = {
+                digest: ref_count
+                for digest, ref_count in self._load_refs().items()
+                if ref_count > 0
+            }
+            for digest, path in list(self._iter_blobs()):
+                if digest in refs:
+                    referenced_size += os.path.getsize(path)
+                    continue
+                if digest in Store._pending:
+                    continue
+                size += os.path.getsize(path)
+                remove_file(path)
+                count += 1
+            self._save_refs(refs, referenced_size)
+
+            tmp_dir = os.path.join(self.path, "tmp")
+            if clean_tmp and os.path.isdir(tmp_dir):
+                for file in os.listdir(tmp_dir):
+                    remove_file(os.path.join(tmp_dir, file))
+        logger.debug(f"collected {count} unreferenced blobs ({size} bytes)")
+        return count, size
+
+    def materialise(
+        self,
+        tree: StoreTree,
+        dest: str,
+        max_workers: Optional[int] = None,
+        on_progress: ProgressCallback = progress_noop,
+    ) -> List[str]:
+        """
+        Recreates the given tree beneath dest, hard-linking or reflinking its files from the store where possible, using
+        up to max_workers threads.
+
+        As hard-linked files share their storage with the store, they must not be modified or linked onwards.
+
+        :returns: The path of each file created.
+        """
+        for dir in sorted(tree.dirs):
+            os.makedirs(os.path.join(dest, *dir.split("/")), exist_ok=True)
+
+        files = {
+            os.path.join(dest, *name.split("/")): self.blob_path(digest)
+            for name, digest in tree.files.items()
+        }
+        step_progress = StepProgress.from_step_count(
+            step_count=len(files), on_progress=on_progress
+        )
+
+        def link(item: Tuple[str, str]) -> None:
+            path, blob_path = item
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # The blob outlives this link rather than being discarded, but sharing its inode is no less safe here
+            copy_strategy.copy_file(blob_path, path, discard_src=True)
+
+        run_parallel(
+            link,
+            files.items(),
+            max_workers=max_workers,
+            on_done=lambda item, result: step_progress.advance(),
+        )
+        return list(files)
@@ -4,22 +4,27 @@ from argparse import ArgumentError, ArgumentParser
 from typing import Dict, List, Optional
 
 from packman import InstallStep, PackageSource, Packman, sources, steps
-from packman.commands import (CleanCommand, Command, ExportCommand,
+from packman.api import metadata_cache
+from packman.commands import (CacheCommand, CleanCommand, Command, ExportCommand,
                               ImportCommand, InstallCommand,
-                              InstalledPackageListCommand, PackageListCommand,
-                              RecoverCommand, UninstallCommand, UpdateCommand,
-                              ValidateCommand, VersionListCommand)
+                              InstalledPackageListCommand, OutdatedCommand,
+                              PackageListCommand, RecoverCommand,
+                              UninstallCommand, UpdateCommand, ValidateCommand,
+                              VersionListCommand)
 from packman.config import read_config
 from packman.utils.output import SupportsWrite
 
 cfg = read_config()
 cfg.configure_logger()
+cfg.configure_http()
+cfg.configure_checksums()
 packman = Packman.from_config(cfg)
 DEFAULT_COMMANDS = {
     "install": InstallCommand(packman),
     "uninstall": UninstallCommand(packman),
     "recover": RecoverCommand(packman),
     "list": InstalledPackageListCommand(packman),
+    "outdated": OutdatedCommand(packman),
     "update": UpdateCommand(packman),
     "packages": PackageListCommand(packman),
     "versions": VersionListCommand(packman),
@@ -27,6 +32,7 @@ DEFAULT_COMMANDS = {
     "export": ExportCommand(packman),
     "import": ImportCommand(packman),
     "clean": CleanCommand(packman),
+    "cache": CacheCommand(packman),
 }
 
 
@@ -39,6 +45,12 @@ class PackmanCLI:
     ) -> None:
         desc = "Rudimentary file package management intended for modifications for games such as KSP and RimWorld"
         parser = ArgumentParser(description=desc)
+        parser.add_argument(
+            "--refresh",
+            action="store_true",
+            dest="refresh",
+            help="Revalidate cached package information with its sources",
+        )
         command_parsers = parser.add_subparsers(
             metavar="<command>", help="Valid commands:", dest="command", required=False
         )
@@ -129,6 +141,7 @@ class PackmanCLI:
         parser = self.parser
         args = parser.parse_args(argv)
         args_dict = vars(args)
+        metadata_cache.set_refresh(args_dict.pop("refresh"))
         command_name: Optional[str] = args_dict.pop("command")
         if command_name is None:
             if self.interactive_mode_enabled:
@@ -7,6 +7,7 @@ from typing import Iterable, List, Optional, Tuple, Union
 from packman import InstallStep, PackageSource, Packman, sources, steps
 from packman.config import read_config
 from packman.models.package_definition import PackageDefinition
+from packman.models.package_source import PackageVersion
 
 
 class SortKey(Enum):
@@ -99,6 +100,8 @@ class Application(tk.Frame):
         self.package_sort = SortKey.DEFAULT
         cfg = read_config()
         cfg.configure_logger()
+        cfg.configure_http()
+        cfg.configure_checksums()
         self.packman = Packman.from_config(cfg)
         self.refresh_packages()
 
@@ -225,9 +228,19 @@ class Application(tk.Frame):
     def install_selected(self) -> None:
         succeeded: List[str] = []
         failed: List[str] = []
-        for name, _ in self.curselection():
-            success = self.packman.install_package(name=name)
-            if success:
+        requested = [(name, None) for name, _ in self.curselection()]
+        resolutions = self.packman.resolve_versions(requested)
+        to_install: List[Tuple[str, PackageVersion]] = []
+        for name, version in requested:
+            resolution = resolutions[(name, version)]
+            if isinstance(resolution, Exception):
+                failed.append(name)
+                self.show_error(f"did not install {name}")
+            else:
+                to_install.append((name, resolution))
+        results = self.packman.install_packages(to_install)
+        for name, _ in to_install:
+            if results[name] is True:
                 succeeded.append(name)
                 self.show_success(f"installed {name}")
             else:
@@ -250,8 +263,9 @@ class Application(tk.Frame):
 
     def validate_selected(self) -> None:
         invalid_files: List[str] = []
-        for name, _ in self.curselection():
-            for file in self.packman.validate(name=name):
+        names = [name for name, _ in self.curselection()]
+        with self.packman.validate_packages(names) as invalid:
+            for _, file in invalid:
                 invalid_files.append(file)
                 self.show_error(f"invalid file (checksum mismatch): {file}")
         if not invalid_files:
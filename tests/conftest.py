@@ -78,6 +78,9 @@ def packman(mock_path: str) -> Generator[Packman, None, None]:
         root_dir=os.path.join(mock_path, "mockgame"),
         config_dir=os.path.join(mock_path, "mockconfigs"),
         manifest_path=os.path.join(mock_path, "mockgame", "manifest.json"),
+        git_config_dir="configs",
+        git_url="https://example.com/packman-configs.git",
+        cache_dir=os.path.join(mock_path, "cache"),
     )
 
 
@@ -0,0 +1,135 @@
+import os
+import shutil
+from typing import Any, Iterator
+
+import pytest
+from packman.models.install_step import BaseInstallStep
+from packman.steps import CopyFolderInstallStep
+from packman.utils import copy_strategy
+from packman.utils.archive import ArchiveIndex
+from packman.utils.copy_strategy import CopyStrategy
+from packman.utils.operation import Operation
+
+
+def _create_package(package_path: str, file_count: int) -> None:
+    for idx in range(file_count):
+        path = os.path.join(package_path, "GameData", f"dir{idx % 3}", f"file{idx}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fp:
+            fp.write(f"file {idx}")
+
+
+@pytest.mark.parametrize("file_count", [50])
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_copy_folder_should_copy_all_files(
+    file_paths: Iterator[str], file_count: int, max_workers: int
+) -> None:
+    package_path = next(file_paths)
+    root_dir = next(file_paths)
+    _create_package(package_path, file_count)
+    step = CopyFolderInstallStep(**{"copy-folder": "GameData", "to": "GameData"})
+
+    with Operation(max_workers=max_workers) as op:
+        step.execute(operation=op, package_path=package_path, root_dir=root_dir)
+        assert len(op.new_paths) == file_count
+
+    for idx in range(file_count):
+        path = os.path.join(root_dir, "GameData", f"dir{idx % 3}", f"file{idx}")
+        with open(path, "r") as fp:
+            assert fp.read() == f"file {idx}", "dest file should have src contents"
+
+
+@pytest.mark.parametrize("file_count", [50])
+def test_copy_folder_should_roll_back_all_files_on_error(
+    file_paths: Iterator[str], file_count: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    package_path = next(file_paths)
+    root_dir = next(file_paths)
+    _create_package(package_path, file_count)
+    step = CopyFolderInstallStep(**{"copy-folder": "GameData", "to": "GameData"})
+
+    copy_file = copy_strategy.copy_file
+
+    def failing_copy_file(src: str, dest: str, **kwargs: Any) -> CopyStrategy:
+        if os.path.basename(src) == "file25":
+            raise OSError("disk full")
+        return copy_file(src, dest, **kwargs)
+
+    monkeypatch.setattr(copy_strategy, "copy_file", failing_copy_file)
+
+    with pytest.raises(OSError):
+        with Operation(max_workers=4) as op:
+            step.execute(operation=op, package_path=package_path, root_dir=root_dir)
+
+    for idx in range(file_count):
+        path = os.path.join(root_dir, "GameData", f"dir{idx % 3}", f"file{idx}")
+        assert not os.path.exists(path), "copied files should be rolled back"
+
+
+@pytest.mark.parametrize("file_count", [50])
+def test_copy_folder_should_extract_from_archive(
+    file_paths: Iterator[str], file_count: int
+) -> None:
+    package_path = next(file_paths)
+    root_dir = next(file_paths)
+    _create_package(package_path, file_count)
+    archive_path = shutil.make_archive(next(file_paths), "zip", package_path)
+    step = CopyFolderInstallStep(
+        **{"copy-folder": "**/GameData", "to": "GameData", "without": ["dir0/*"]}
+    )
+    assert step.supports_archive()
+
+    with ArchiveIndex(archive_path) as archive, Operation(max_workers=4) as op:
+        step.execute_archive(operation=op, archive=archive, root_dir=root_dir)
+
+    for idx in range(file_count):
+        path = os.path.join(root_dir, "GameData", f"dir{idx % 3}", f"file{idx}")
+        if idx % 3 == 0:
+            assert not os.path.exists(path), "excluded files should not be extracted"
+            continue
+        with open(path, "r") as fp:
+            assert fp.read() == f"file {idx}", "dest file should have src contents"
+
+
+@pytest.mark.parametrize("file_count", [50])
+def test_copy_folder_should_roll_back_archive_extraction_on_error(
+    file_paths: Iterator[str], file_count: int
+) -> None:
+    package_path = next(file_paths)
+    root_dir = next(file_paths)
+    _create_package(package_path, file_count)
+    archive_path = shutil.make_archive(next(file_paths), "zip", package_path)
+    step = CopyFolderInstallStep(**{"copy-folder": "GameData", "to": "GameData"})
+
+    with pytest.raises(RuntimeError):
+        with ArchiveIndex(archive_path) as archive, Operation(max_workers=4) as op:
+            step.execute_archive(operation=op, archive=archive, root_dir=root_dir)
+            raise RuntimeError("install failed")
+
+    for idx in range(file_count):
+        path = os.path.join(root_dir, "GameData", f"dir{idx % 3}", f"file{idx}")
+        assert not os.path.exists(path), "extracted files should be rolled back"
+
+
+def test_steps_should_extract_archive_if_not_read_directly(
+    file_paths: Iterator[str],
+) -> None:
+    package_path = next(file_paths)
+    root_dir = next(file_paths)
+    _create_package(package_path, 5)
+    archive_path = shutil.make_archive(next(file_paths), "zip", package_path)
+    step = CopyFolderInstallStep(**{"copy-folder": "GameData", "to": "GameData"})
+
+    with ArchiveIndex(archive_path) as archive, Operation() as op:
+        # As for a step which doesn't override do_execute_archive
+        BaseInstallStep.do_execute_archive(
+            step, operation=op, archive=archive, root_dir=root_dir
+        )
+        extracted = archive.extract_all()
+        assert len(op.new_paths) == 5
+    assert not os.path.exists(extracted), "extracted archive should be removed"
+
+    for idx in range(5):
+        path = os.path.join(root_dir, "GameData", f"dir{idx % 3}", f"file{idx}")
+        with open(path, "r") as fp:
+            assert fp.read() == f"file {idx}"
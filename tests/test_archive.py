@@ -0,0 +1,108 @@
+import os
+import tarfile
+import zipfile
+from typing import Dict, Iterator, List
+
+import pytest
+from packman.utils import archive as archive_module
+from packman.utils.archive import ArchiveIndex, extract_archive
+from packman.utils.operation import Operation
+
+_FILES = {
+    "GameData/Mod/a.cfg": b"a" * 10,
+    "GameData/Mod/Plugins/b.dll": b"b" * 100000,
+    "README.md": b"readme",
+}
+
+
+def _create_zip(path: str, files: Dict[str, bytes]) -> None:
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+
+
+def _create_tar(path: str, files: Dict[str, bytes], src_dir: str) -> None:
+    with tarfile.open(path, "w:gz") as archive:
+        for name, data in files.items():
+            file = os.path.join(src_dir, name)
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            with open(file, "wb") as fp:
+                fp.write(data)
+            archive.add(file, arcname=name)
+
+
+def _assert_extracted(outdir: str, files: Dict[str, bytes]) -> None:
+    for name, data in files.items():
+        with open(os.path.join(outdir, name), "rb") as fp:
+            assert fp.read() == data, f"{name} should be extracted"
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_extract_zip(file_paths: Iterator[str], max_workers: int) -> None:
+    zip_path = next(file_paths)
+    _create_zip(zip_path, _FILES)
+
+    progress: List[float] = []
+    with Operation(max_workers=max_workers) as op:
+        outdir = op.extract_archive(zip_path, on_progress=progress.append)
+        _assert_extracted(outdir, _FILES)
+
+    assert progress[0] == 0.0 and progress[-1] == 1.0
+
+
+def test_extract_tar(file_paths: Iterator[str]) -> None:
+    tar_path = next(file_paths)
+    _create_tar(tar_path, _FILES, src_dir=next(file_paths))
+
+    with Operation() as op:
+        outdir = op.extract_archive(tar_path)
+        _assert_extracted(outdir, _FILES)
+
+
+def test_extract_zip_should_refuse_members_outside_destination(
+    file_paths: Iterator[str],
+) -> None:
+    zip_path = next(file_paths)
+    outdir = next(file_paths)
+    _create_zip(zip_path, {"../escaped": b"data"})
+
+    with pytest.raises(ValueError):
+        extract_archive(zip_path, outdir=outdir)
+    assert not os.path.exists(os.path.join(os.path.dirname(outdir), "escaped"))
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_extract_zip_should_handle_zero_dates_and_duplicate_members(
+    file_paths: Iterator[str], max_workers: int
+) -> None:
+    zip_path = next(file_paths)
+    outdir = next(file_paths)
+    with pytest.warns(UserWarning), zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("a.cfg", (1980, 0, 0, 0, 0, 0)), b"zero")
+        for idx in range(8):
+            archive.writestr("dup.cfg", f"{idx}" * 100000)
+
+    digests = extract_archive(zip_path, outdir=outdir, max_workers=max_workers)
+
+    _assert_extracted(outdir, {"a.cfg": b"zero", "dup.cfg": b"7" * 100000})
+    assert len(digests) == 2
+
+
+def test_archive_index_should_glob_like_the_platform(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    zip_path = next(file_paths)
+    _create_zip(zip_path, _FILES)
+    patterns = ["gamedata/mod/*.CFG", "GameData/Mod/Plugins/*.dll"]
+
+    with ArchiveIndex(zip_path) as archive:
+        assert [path for pattern in patterns for path in archive.iglob(pattern)] == [
+            "GameData/Mod/Plugins/b.dll"
+        ]
+        # As on Windows
+        monkeypatch.setattr(os.path, "normcase", str.lower)
+        monkeypatch.setattr(archive_module, "_CASE_INSENSITIVE", True)
+        assert [path for pattern in patterns for path in archive.iglob(pattern)] == [
+            "GameData/Mod/a.cfg",
+            "GameData/Mod/Plugins/b.dll",
+        ]
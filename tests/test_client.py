@@ -0,0 +1,22 @@
+from packman.api import client
+from packman.api.client import HTTPConfig
+
+
+def test_session_should_be_shared_per_host() -> None:
+    client.configure(HTTPConfig())
+    session = client.get_session("https://example.com/a")
+    assert client.get_session("https://example.com/b/c") is session
+    assert client.get_session("https://example.org/a") is not session
+    assert client.get_session("http://example.com/a") is not session
+
+
+def test_configure_should_apply_to_new_sessions() -> None:
+    client.configure(HTTPConfig(pool_maxsize=4, retries=7))
+    try:
+        adapter = client.get_session("https://example.com").get_adapter(
+            "https://example.com"
+        )
+        assert adapter._pool_maxsize == 4
+        assert adapter.max_retries.total == 7
+    finally:
+        client.configure(HTTPConfig())
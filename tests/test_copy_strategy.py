@@ -0,0 +1,88 @@
+import errno
+import os
+from typing import Any, Iterator
+
+import pytest
+from packman.utils import copy_strategy
+from packman.utils.copy_strategy import CopyStrategy, copy_file
+
+
+@pytest.fixture(autouse=True)
+def reset_unsupported(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(copy_strategy, "_unsupported", {})
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+def _refuse(exc: OSError) -> Any:
+    def refuse(src: str, dest: str) -> None:
+        raise exc
+
+    return refuse
+
+
+def test_copy_file_should_fall_back_when_links_are_refused(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    src, dest = next(file_paths), next(file_paths)
+    _write(src, b"data")
+    refuse = _refuse(OSError(errno.EPERM, "links not permitted"))
+    for strategy in (CopyStrategy.REFLINK, CopyStrategy.HARDLINK):
+        monkeypatch.setitem(copy_strategy._STRATEGY_FUNCS, strategy, refuse)
+
+    assert copy_file(src, dest, discard_src=True) not in (
+        CopyStrategy.REFLINK,
+        CopyStrategy.HARDLINK,
+    )
+    with open(dest, "rb") as fp:
+        assert fp.read() == b"data"
+
+
+def test_copy_file_should_raise_permission_errors_from_copies(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    src, dest = next(file_paths), next(file_paths)
+    _write(src, b"data")
+    monkeypatch.setitem(
+        copy_strategy._STRATEGY_FUNCS,
+        CopyStrategy.REFLINK,
+        _refuse(OSError(errno.EOPNOTSUPP, "reflinks not supported")),
+    )
+    monkeypatch.setitem(
+        copy_strategy._STRATEGY_FUNCS,
+        CopyStrategy.COPY_FILE_RANGE,
+        _refuse(OSError(errno.EPERM, "permission denied")),
+    )
+
+    with pytest.raises(PermissionError):
+        copy_file(src, dest)
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "copy_file_range"), reason="copy_file_range not available"
+)
+def test_copy_file_range_should_finish_short_copies(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    src, dest = next(file_paths), next(file_paths)
+    data = bytes(range(256)) * 1000
+    _write(src, data)
+    copy_file_range = os.copy_file_range
+    calls = 0
+
+    def short_copy_file_range(src_fd: int, dest_fd: int, count: int) -> int:
+        # Copies one chunk and then nothing, as some file-systems do
+        nonlocal calls
+        calls += 1
+        return copy_file_range(src_fd, dest_fd, 1000) if calls == 1 else 0
+
+    monkeypatch.setattr(os, "copy_file_range", short_copy_file_range)
+
+    copy_strategy._copy_file_range(src, dest)
+
+    with open(dest, "rb") as fp:
+        assert fp.read() == data
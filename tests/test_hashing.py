@@ -0,0 +1,55 @@
+import hashlib
+import os
+from typing import Iterator
+
+import pytest
+from packman.utils import hashing
+from packman.utils.hashing import (
+    ChecksumAlgorithm,
+    checksum,
+    file_checksums,
+    verify_checksum,
+)
+
+_DATA = bytes(range(256)) * 10000
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+
+@pytest.mark.parametrize("mmap_threshold", [0, len(_DATA) + 1])
+def test_file_checksums_should_match_hashlib(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch, mmap_threshold: int
+) -> None:
+    path = next(file_paths)
+    _write(path, _DATA)
+    monkeypatch.setattr(hashing, "_MMAP_THRESHOLD", mmap_threshold)
+
+    checksums = file_checksums(
+        path, (ChecksumAlgorithm.SHA256, ChecksumAlgorithm.BLAKE2B)
+    )
+
+    assert checksums == {
+        ChecksumAlgorithm.SHA256: f"sha256:{hashlib.sha256(_DATA).hexdigest()}",
+        ChecksumAlgorithm.BLAKE2B: f"blake2b:{hashlib.blake2b(_DATA).hexdigest()}",
+    }
+
+
+def test_verify_checksum_should_verify_and_migrate_other_algorithms(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = next(file_paths)
+    _write(path, _DATA)
+    old_chk = checksum(path)
+    monkeypatch.setattr(hashing, "_default_algorithm", ChecksumAlgorithm.BLAKE2B)
+
+    assert verify_checksum(path, old_chk) == (
+        True,
+        f"blake2b:{hashlib.blake2b(_DATA).hexdigest()}",
+    )
+    _write(path, b"modified")
+    valid, _ = verify_checksum(path, old_chk)
+    assert not valid
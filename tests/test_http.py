@@ -0,0 +1,144 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Event
+from typing import Any, Dict, List, Optional
+
+import pytest
+import requests
+from packman.api import client
+from packman.api.http import HTTPAPI
+from packman.api.metadata_cache import FOREVER, MetadataCache
+
+
+class MockAPI(HTTPAPI):
+    def __init__(self, cache: MetadataCache) -> None:
+        super().__init__(url="https://example.com/", cache=cache)
+
+
+class MockResponse:
+    def __init__(
+        self, status_code: int, body: Any = None, headers: Dict[str, str] = {}
+    ) -> None:
+        self.status_code = status_code
+        self.body = body
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def json(self) -> Any:
+        return self.body
+
+
+class MockServer:
+    def __init__(self, status_code: int = 200) -> None:
+        self.status_code = status_code
+        self.requests: List[Dict[str, str]] = []
+
+    def get(
+        self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs: Any
+    ) -> MockResponse:
+        headers = headers or {}
+        self.requests.append(headers)
+        if self.status_code != 200:
+            return MockResponse(self.status_code)
+        if headers.get("if-none-match") == '"v1"':
+            return MockResponse(304)
+        return MockResponse(200, {"name": "thing"}, {"ETag": '"v1"'})
+
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch) -> MockServer:
+    server = MockServer()
+    monkeypatch.setattr(client, "get", server.get)
+    return server
+
+
+def test_fresh_response_should_be_cached_across_processes(
+    server: MockServer, file_paths: Any
+) -> None:
+    path = next(file_paths)
+    assert MockAPI(MetadataCache(path)).get("thing") == {"name": "thing"}
+    assert MockAPI(MetadataCache(path)).get("thing") == {"name": "thing"}
+    assert len(server.requests) == 1, "second request should be served from disk"
+
+
+def test_responses_should_not_be_shared_between_different_headers(
+    server: MockServer,
+) -> None:
+    cache = MetadataCache()
+    apis = [MockAPI(cache) for _ in range(3)]
+    apis[1].headers["authorization"] = "Basic a"
+    apis[2].headers["authorization"] = "Basic b"
+    for api in apis:
+        assert api.get("thing") == {"name": "thing"}
+    assert len(server.requests) == 3
+
+    other = MockAPI(cache)
+    other.headers["Authorization"] = "Basic a"
+    assert other.get("thing") == {"name": "thing"}
+    assert len(server.requests) == 3, "identical headers should share responses"
+
+
+@pytest.mark.parametrize("refresh", [False, True])
+def test_stale_response_should_be_revalidated(
+    server: MockServer, refresh: bool
+) -> None:
+    cache = MetadataCache(refresh=refresh)
+    api = MockAPI(cache)
+    ttl = timedelta(0) if not refresh else FOREVER
+    assert api.get("thing", ttl=ttl) == {"name": "thing"}
+    assert api.get("thing", ttl=ttl) == {"name": "thing"}
+    assert len(server.requests) == 2
+    assert server.requests[1]["if-none-match"] == '"v1"'
+
+
+def test_not_found_response_should_be_cached(server: MockServer) -> None:
+    server.status_code = 404
+    api = MockAPI(MetadataCache())
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            api.get("missing")
+    assert len(server.requests) == 1, "not found response should be cached"
+
+
+def test_stale_response_should_be_used_when_offline(
+    server: MockServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    api = MockAPI(MetadataCache())
+    api.get("thing", ttl=timedelta(0))
+
+    def offline_get(url: str, **kwargs: Any) -> MockResponse:
+        raise requests.ConnectionError("offline")
+
+    monkeypatch.setattr(client, "get", offline_get)
+    assert api.get("thing", ttl=timedelta(0)) == {"name": "thing"}
+
+
+def test_concurrent_requests_should_be_deduplicated(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    server = MockServer()
+    started = Event()
+    release = Event()
+
+    def slow_get(url: str, **kwargs: Any) -> MockResponse:
+        started.set()
+        release.wait(timeout=5)
+        return server.get(url, **kwargs)
+
+    monkeypatch.setattr(client, "get", slow_get)
+    api = MockAPI(MetadataCache())
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(api.get, "thing")
+        started.wait(timeout=5)
+        rest = [executor.submit(api.get, "thing") for _ in range(3)]
+        # Give the other requests a chance to join the one in flight
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in (first, *rest)]
+
+    assert results == [{"name": "thing"}] * 4
+    assert len(server.requests) == 1, "concurrent requests should share a round trip"
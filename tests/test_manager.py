@@ -0,0 +1,200 @@
+import io
+import os
+import zipfile
+from threading import Lock
+from typing import Any, Dict, Iterator
+
+import pytest
+import requests
+from packman import InstallStep, PackageSource, Packman, sources, steps
+from packman.api import client
+from packman.manager import NoSourcesError
+from packman.models import manifest as manifest_module
+from packman.models.package_source import PackageVersion
+from packman.utils import hashing
+
+
+def _zip(files: Dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+class MockResponse:
+    def __init__(self, status_code: int, body: bytes) -> None:
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(
+            {"Content-Length": str(len(body))}
+        )
+        self.body = body
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        for idx in range(0, len(self.body), chunk_size):
+            yield self.body[idx : idx + chunk_size]
+
+
+def _add_package(packman: Packman, name: str, files: Dict[str, str]) -> None:
+    os.makedirs(packman.definition_dir, exist_ok=True)
+    with open(packman.package_path(name), "w") as fp:
+        fp.write(
+            f"name: {name}\n"
+            "sources:\n"
+            f"  - url: https://example.com/{name}.zip\n"
+            "steps:\n"
+            "  - copy-folder: GameData\n"
+            "    to: GameData\n"
+        )
+    _archives[f"https://example.com/{name}.zip"] = _zip(files)
+
+
+_archives: Dict[str, bytes] = {}
+
+
+def _get(url: str, **kwargs: object) -> MockResponse:
+    if url not in _archives:
+        return MockResponse(404, b"")
+    return MockResponse(200, _archives[url])
+
+
+def _resolve(packman: Packman, *names: str) -> Dict[str, PackageVersion]:
+    return {name: packman.get_latest_version_info(name) for name in names}
+
+
+@pytest.fixture(autouse=True)
+def mock_client(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    sources.register_all(PackageSource)
+    steps.register_all(InstallStep)
+    monkeypatch.setattr(client, "get", _get)
+    yield
+    _archives.clear()
+    PackageSource.unregister_all()
+    InstallStep.unregister_all()
+
+
+def test_install_packages_should_install_conflicting_packages_in_order(
+    packman: Packman,
+) -> None:
+    os.makedirs(packman.root_dir, exist_ok=True)
+    _add_package(packman, "a", {"GameData/a.cfg": "a", "GameData/shared.cfg": "a"})
+    _add_package(packman, "b", {"GameData/b.cfg": "b"})
+    _add_package(packman, "c", {"GameData/shared.cfg": "c"})
+
+    results = packman.install_packages(_resolve(packman, "a", "b", "c").items())
+
+    assert results == {"a": True, "b": True, "c": True}
+    game_data = os.path.join(packman.root_dir, "GameData")
+    for file, content in (("a.cfg", "a"), ("b.cfg", "b"), ("shared.cfg", "c")):
+        with open(os.path.join(game_data, file)) as fp:
+            assert fp.read() == content
+    assert set(packman.manifest.packages) == {"a", "b", "c"}
+
+
+def test_install_packages_should_roll_back_only_failed_packages(
+    packman: Packman,
+) -> None:
+    os.makedirs(packman.root_dir, exist_ok=True)
+    _add_package(packman, "a", {"GameData/a.cfg": "a"})
+    _add_package(packman, "b", {"GameData/b.cfg": "b"})
+    versions = _resolve(packman, "a", "b")
+    del _archives["https://example.com/b.zip"]
+
+    results = packman.install_packages(versions.items())
+
+    assert results["a"] is True
+    assert isinstance(results["b"], NoSourcesError)
+    game_data = os.path.join(packman.root_dir, "GameData")
+    assert os.path.exists(os.path.join(game_data, "a.cfg"))
+    assert not os.path.exists(os.path.join(game_data, "b.cfg"))
+    assert set(packman.manifest.packages) == {"a"}
+
+
+@pytest.mark.parametrize("prefetch_depth", [1, 2])
+def test_install_packages_should_prefetch_at_most_prefetch_depth_packages(
+    packman: Packman, monkeypatch: pytest.MonkeyPatch, prefetch_depth: int
+) -> None:
+    os.makedirs(packman.root_dir, exist_ok=True)
+    names = [f"p{idx}" for idx in range(5)]
+    for name in names:
+        _add_package(packman, name, {f"GameData/{name}.cfg": name})
+    packman.prefetch_depth = prefetch_depth
+
+    lock = Lock()
+    ahead = 0
+    max_ahead = 0
+    fetch_package = packman._fetch_package
+    install_files = packman._install_files
+
+    def _fetch_package(**kwargs: Any) -> Any:
+        nonlocal ahead, max_ahead
+        with lock:
+            ahead += 1
+            max_ahead = max(max_ahead, ahead)
+        return fetch_package(**kwargs)
+
+    def _install_files(**kwargs: Any) -> None:
+        nonlocal ahead
+        with lock:
+            ahead -= 1
+        install_files(**kwargs)
+
+    monkeypatch.setattr(packman, "_fetch_package", _fetch_package)
+    monkeypatch.setattr(packman, "_install_files", _install_files)
+
+    results = packman.install_packages(_resolve(packman, *names).items())
+
+    assert results == {name: True for name in names}
+    assert max_ahead <= prefetch_depth
+
+
+@pytest.mark.parametrize("stream_archives", [True, False])
+def test_install_packages_should_not_rehash_installed_files(
+    packman: Packman, monkeypatch: pytest.MonkeyPatch, stream_archives: bool
+) -> None:
+    os.makedirs(packman.root_dir, exist_ok=True)
+    _add_package(packman, "a", {"GameData/a.cfg": "a"})
+    _add_package(packman, "b", {"GameData/b.cfg": "b", "GameData/c/c.cfg": "c"})
+    packman.stream_archives = stream_archives
+    assert packman.install_packages(_resolve(packman, "a").items()) == {"a": True}
+
+    def checksum(path: str) -> str:
+        raise AssertionError(f"{path} should not be re-hashed")
+
+    monkeypatch.setattr(manifest_module, "checksum", checksum)
+    results = packman.install_packages(_resolve(packman, "b").items())
+
+    assert results == {"b": True}
+    monkeypatch.undo()
+    manifest = packman.manifest
+    for package in manifest.packages.values():
+        assert package.checksums == {
+            file: hashing.checksum(manifest.resolve(file))
+            for file in package.files
+            if os.path.isfile(manifest.resolve(file))
+        }
+
+
+def test_install_packages_should_record_packages_before_installing_over_them(
+    packman: Packman,
+) -> None:
+    os.makedirs(packman.root_dir, exist_ok=True)
+    _add_package(packman, "a", {"GameData/a.cfg": "a", "GameData/moved.cfg": "moved"})
+    assert packman.install_packages(_resolve(packman, "a").items()) == {"a": True}
+    # moved.cfg moves unchanged from a to b in the same batch, so must not be cleaned up as dropped by a
+    _add_package(packman, "a", {"GameData/a.cfg": "a"})
+    _add_package(packman, "b", {"GameData/moved.cfg": "moved"})
+
+    results = packman.install_packages(_resolve(packman, "a", "b").items(), force=True)
+
+    assert results == {"a": True, "b": True}
+    moved = os.path.join(packman.root_dir, "GameData", "moved.cfg")
+    with open(moved) as fp:
+        assert fp.read() == "moved"
+    manifest = packman.manifest
+    assert manifest.file_map[manifest.relativise(moved)] == ["b"]
+    assert not manifest.orphaned_files
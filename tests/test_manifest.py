@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pytest
+from packman import Packman
+from packman.models import manifest as manifest_module
+from packman.models.manifest import FileFingerprint, Manifest
+from packman.utils import hashing
+from packman.utils.hashing import ChecksumAlgorithm
+
+_OLD_NS = 1_000_000_000_000_000_000
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(data)
+    # Old enough to be fingerprinted
+    os.utime(path, ns=(_OLD_NS, _OLD_NS))
+
+
+def _install(packman: Packman, name: str, file: str) -> None:
+    manifest = packman.manifest
+    manifest.add_package(name, version="1.0", options=["package.zip"], files=[file])
+    manifest.update_checksums()
+
+
+def test_compute_checksums_should_not_fingerprint_recently_modified_files(
+    file_paths: Iterator[str],
+) -> None:
+    old = next(file_paths)
+    new = next(file_paths)
+    _write(old, b"old")
+    with open(new, "wb") as fp:
+        fp.write(b"new")
+    manifest = Manifest()
+
+    package = manifest.add_package(
+        "package", version="1.0", options=["package.zip"], files=[old, new]
+    )
+    package.compute_checksums()
+
+    assert set(package.checksums) == {old, new}
+    assert set(package.fingerprints) == {old}
+
+
+def test_validate_should_only_rehash_files_with_changed_fingerprints(
+    packman: Packman, file_paths: Iterator[str]
+) -> None:
+    unchanged = next(file_paths)
+    changed = next(file_paths)
+    _write(unchanged, b"a")
+    _write(changed, b"b")
+    _install(packman, "unchanged", unchanged)
+    _install(packman, "changed", changed)
+    # Modified in place without changing its size or modification time
+    _write(unchanged, b"x")
+    with open(changed, "ab") as fp:
+        fp.write(b"b")
+
+    assert list(packman.validate("unchanged")) == []
+    assert list(packman.validate("changed")) == [changed]
+    assert list(packman.validate("unchanged", deep=True)) == [unchanged]
+
+
+def test_cleanup_files_should_not_rehash_unchanged_files(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    file = os.path.normpath(next(file_paths))
+    _write(file, b"a")
+    manifest = Manifest()
+    manifest.add_package("package", options=["package.zip"], files=[file])
+    manifest.update_checksums()
+    manifest.cleanup_files()
+    del manifest.packages["package"]
+
+    def file_checksums(path: str, algorithms: Iterable[ChecksumAlgorithm]) -> None:
+        raise AssertionError(f"{path} should not be re-hashed")
+
+    monkeypatch.setattr(manifest_module, "file_checksums", file_checksums)
+    manifest.cleanup_files()
+
+    assert not os.path.exists(file)
+    assert not manifest.orphaned_files
+
+
+def test_validate_should_migrate_checksums_to_default_algorithm(
+    packman: Packman, file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = next(file_paths)
+    _write(path, b"a")
+    _install(packman, "package", path)
+    file = packman.manifest.relativise(path)
+    assert packman.manifest.packages["package"].checksums[file].startswith("sha256:")
+    monkeypatch.setattr(hashing, "_default_algorithm", ChecksumAlgorithm.BLAKE2B)
+
+    assert list(packman.validate("package", deep=True)) == []
+
+    chk = packman.manifest.packages["package"].checksums[file]
+    assert chk == f"blake2b:{hashlib.blake2b(b'a').hexdigest()}"
+    written = Manifest.from_json(packman.manifest_path).packages["package"]
+    assert [chk.split(":")[0] for chk in written.checksums.values()] == ["blake2b"]
+
+
+def test_validate_packages_should_save_migrated_checksums_when_not_fully_consumed(
+    packman: Packman, file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # One thread, so files are validated in order
+    packman.max_workers = 1
+    packman.validation_processes = False
+    valid, invalid = next(file_paths), next(file_paths)
+    for name, path in (("valid", valid), ("invalid", invalid)):
+        _write(path, b"a")
+        _install(packman, name, path)
+    _write(invalid, b"b")
+    monkeypatch.setattr(hashing, "_default_algorithm", ChecksumAlgorithm.BLAKE2B)
+
+    with packman.validate_packages(["valid", "invalid"], deep=True) as results:
+        assert next(results) == ("invalid", invalid)
+
+    written = Manifest.from_json(packman.manifest_path).packages["valid"]
+    assert [chk.split(":")[0] for chk in written.checksums.values()] == ["blake2b"]
+
+
+@pytest.mark.parametrize("validation_processes", [True, False])
+def test_validate_packages_should_find_invalid_files_across_packages(
+    packman: Packman, file_paths: Iterator[str], validation_processes: bool
+) -> None:
+    packman.validation_processes = validation_processes
+    invalid = set()
+    for idx in range(4):
+        file = next(file_paths)
+        _write(file, b"a")
+        _install(packman, f"p{idx}", file)
+        if idx % 2:
+            _write(file, b"b")
+            invalid.add((f"p{idx}", file))
+
+    with packman.validate_packages(deep=True) as results:
+        assert set(results) == invalid
+    with packman.validate_packages(deep=True, fail_fast=True) as results:
+        found = list(results)
+    assert len(found) == 1 and found[0] in invalid
+    with packman.validate_packages(["p0"], deep=True) as results:
+        assert list(results) == []
+
+
+def test_cleanup_files_should_only_consider_files_of_changed_packages(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    manifest = Manifest()
+    files = {}
+    for name in ("a", "b", "c"):
+        file = files[name] = os.path.normpath(next(file_paths))
+        _write(file, bytes(name, "utf-8"))
+        manifest.add_package(name, options=["package.zip"], files=[file])
+    manifest.update_checksums()
+    manifest.cleanup_files()
+
+    checked = []
+    is_unmodified = manifest._is_unmodified
+
+    def spy(file: str) -> bool:
+        checked.append(file)
+        return is_unmodified(file)
+
+    def checksum(path: str) -> None:
+        raise AssertionError(f"{path} should not be re-hashed")
+
+    monkeypatch.setattr(manifest, "_is_unmodified", spy)
+    monkeypatch.setattr(manifest_module, "checksum", checksum)
+    manifest.remove_package("a")
+    # Removed directly rather than through remove_package
+    del manifest.packages["b"]
+    manifest.cleanup_files()
+    manifest.update_checksums()
+
+    assert checked == [files["a"], files["b"]]
+    assert manifest.file_map == {files["c"]: ["c"]}
+    assert not os.path.exists(files["a"]) and not os.path.exists(files["b"])
+    assert os.path.exists(files["c"])
+
+
+def test_manifest_should_load_and_save_without_rewriting_paths(
+    packman: Packman, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = os.path.join(packman.root_dir, "GameData", "a.cfg")
+    _write(path, b"a")
+    _install(packman, "package", path)
+    packman.manifest.update_files(packman.manifest_path)
+
+    def replace_root_path(**kwargs: str) -> None:
+        raise AssertionError(f"{kwargs['path']} should not be rewritten")
+
+    def deepcopy(self: Manifest) -> None:
+        raise AssertionError("manifest should not be copied")
+
+    monkeypatch.setattr(manifest_module, "replace_root_path", replace_root_path)
+    monkeypatch.setattr(Manifest, "deepcopy", deepcopy)
+    manifest = Manifest.load(packman.manifest_path)
+    manifest.save(packman.manifest_path)
+
+    file = os.path.join("GameData", "a.cfg")
+    assert manifest.packages["package"].files == {file}
+    assert manifest.resolve(file) == path
+    assert manifest.relativise(path) == file
+    assert Manifest.from_json(packman.manifest_path).file_map == {file: ["package"]}
+
+
+@pytest.mark.parametrize("version", [manifest_module._MANIFEST_VERSION, 1])
+def test_from_json_should_match_validated_manifest(
+    packman: Packman, monkeypatch: pytest.MonkeyPatch, version: int
+) -> None:
+    path = os.path.join(packman.root_dir, "GameData", "a.cfg")
+    _write(path, b"a")
+    packman.manifest.add_package(
+        "package",
+        version="1.0",
+        options=["package.zip"],
+        files=[path],
+    )
+    packman.manifest.original_files[packman.manifest.relativise(path)] = "backup"
+    packman.manifest.update_files(packman.manifest_path)
+    with open(packman.manifest_path) as fp:
+        raw = json.load(fp)
+    raw["version"] = version
+    with open(packman.manifest_path, "w") as fp:
+        json.dump(raw, fp)
+
+    validated = Manifest.from_json(packman.manifest_path, validate=True)
+    trusted = Manifest.from_json(packman.manifest_path)
+
+    assert trusted.dict() == validated.dict()
+    package = trusted.packages["package"]
+    assert package.checksums.keys() == {os.path.join("GameData", "a.cfg")}
+    assert all(isinstance(fp, FileFingerprint) for fp in package.fingerprints.values())
+    assert not os.path.exists(f"{packman.manifest_path}.tmp")
+
+
+def test_from_json_should_validate_manifests_from_earlier_versions(
+    packman: Packman, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = os.path.join(packman.root_dir, "GameData", "a.cfg")
+    _write(path, b"a")
+    _install(packman, "package", path)
+    packman.manifest.update_files(packman.manifest_path)
+    with open(packman.manifest_path) as fp:
+        raw = json.load(fp)
+    assert raw["version"] == manifest_module._MANIFEST_VERSION
+    raw["version"] = 1
+    with open(packman.manifest_path, "w") as fp:
+        json.dump(raw, fp)
+
+    def from_trusted(raw: Dict[str, Any]) -> None:
+        raise AssertionError("earlier manifests should be validated")
+
+    monkeypatch.setattr(Manifest, "from_trusted", from_trusted)
+    manifest = Manifest.from_json(packman.manifest_path)
+    manifest.save(packman.manifest_path)
+
+    with open(packman.manifest_path) as fp:
+        assert json.load(fp)["version"] == manifest_module._MANIFEST_VERSION
+
+
+def test_write_json_should_sync_manifest_before_replacing_it(
+    packman: Packman, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = os.path.join(packman.root_dir, "GameData", "a.cfg")
+    _write(path, b"a")
+    _install(packman, "package", path)
+    events: List[str] = []
+    fsync, replace = os.fsync, os.replace
+
+    def record_fsync(fd: int) -> None:
+        events.append("fsync")
+        fsync(fd)
+
+    def record_replace(src: str, dest: str) -> None:
+        events.append(f"replace {os.path.basename(dest)}")
+        replace(src, dest)
+
+    monkeypatch.setattr(os, "fsync", record_fsync)
+    monkeypatch.setattr(os, "replace", record_replace)
+    packman.manifest.write_json(packman.manifest_path)
+
+    manifest_name = os.path.basename(packman.manifest_path)
+    assert events[:2] == ["fsync", f"replace {manifest_name}"]
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict
+
+from packman.models.manifest import Manifest
+
+_OLD_NS = 1_000_000_000_000_000_000
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp:
+        fp.write(data)
+    os.utime(path, ns=(_OLD_NS, _OLD_NS))
+
+
+def _add_package(manifest: Manifest, root: str, name: str) -> str:
+    file = os.path.join(root, "GameData", f"{name}.cfg")
+    _write(file, bytes(name, "utf-8"))
+    manifest.add_package(
+        name,
+        version="1.0",
+        options=[f"{name}.zip"],
+        files=[file],
+    )
+    return file
+
+
+def _rowids(path: str) -> Dict[str, int]:
+    with closing(sqlite3.connect(path)) as conn:
+        return dict(conn.execute("SELECT name, rowid FROM packages"))
+
+
+def test_database_should_round_trip_manifest(mock_path: str) -> None:
+    root = os.path.join(mock_path, "game")
+    db_path = os.path.join(root, "packman.db")
+    manifest = Manifest.load(db_path)
+    file = _add_package(manifest, root, "a")
+    _add_package(manifest, root, "b")
+    manifest.original_files[file] = "backup"
+    manifest.update_files(db_path)
+
+    loaded = Manifest.load(db_path)
+
+    assert set(loaded.packages) == {"a", "b"}
+    for name, package in manifest.packages.items():
+        assert loaded.packages[name].dict() == package.dict()
+    assert loaded.file_map == manifest.file_map
+    assert loaded.original_files == {file: "backup"}
+    assert loaded.file_map[loaded.relativise(file)] == ["a"]
+    assert not any(package._dirty for package in loaded.packages.values())
+
+
+def test_database_should_only_rewrite_changed_packages(mock_path: str) -> None:
+    root = os.path.join(mock_path, "game")
+    db_path = os.path.join(root, "packman.db")
+    manifest = Manifest.load(db_path)
+    for name in ("a", "b", "c"):
+        _add_package(manifest, root, name)
+    manifest.update_files(db_path)
+    before = _rowids(db_path)
+
+    manifest = Manifest.load(db_path)
+    del manifest.packages["a"]
+    _add_package(manifest, root, "b")
+    manifest.update_files(db_path)
+
+    after = _rowids(db_path)
+    assert set(after) == {"b", "c"}
+    assert after["c"] == before["c"]
+    assert after["b"] != before["b"]
+    assert not os.path.exists(os.path.join(root, "GameData", "a.cfg"))
+
+
+def test_database_should_migrate_json_manifest(mock_path: str) -> None:
+    root = os.path.join(mock_path, "game")
+    json_path = os.path.join(root, "packman.json")
+    manifest = Manifest.load(json_path)
+    _add_package(manifest, root, "a")
+    manifest.update_files(json_path)
+
+    migrated = Manifest.load(os.path.join(root, "packman.db"))
+
+    assert migrated.packages["a"].dict() == manifest.packages["a"].dict()
+    assert not os.path.exists(json_path)
+    assert os.path.exists(f"{json_path}.bak")
+    assert Manifest.load(os.path.join(root, "packman.db")).packages.keys() == {"a"}
@@ -0,0 +1,62 @@
+import hashlib
+import json
+
+import pytest
+from packman.models.manifest import Manifest, ManifestPackage
+from packman.models.manifest_maps import ChecksumMap, FileMap
+from packman.utils.hashing import pack_checksum, unpack_checksum
+
+_SHA256 = f"sha256:{hashlib.sha256(b'a').hexdigest()}"
+_BLAKE2B = f"blake2b:{hashlib.blake2b(b'a').hexdigest()}"
+
+
+@pytest.mark.parametrize("chk", [_SHA256, _BLAKE2B])
+def test_pack_checksum_should_round_trip(chk: str) -> None:
+    packed = pack_checksum(chk)
+
+    assert len(packed) == 1 + len(chk.partition(":")[2]) // 2
+    assert unpack_checksum(packed) == chk
+
+
+def test_checksum_map_should_behave_as_dict() -> None:
+    checksums = ChecksumMap({"a": _SHA256})
+    checksums["b"] = _BLAKE2B
+
+    assert checksums == {"a": _SHA256, "b": _BLAKE2B}
+    assert dict(checksums.packed_items()) == {
+        "a": pack_checksum(_SHA256),
+        "b": pack_checksum(_BLAKE2B),
+    }
+    del checksums["a"]
+    assert "a" not in checksums and checksums.get("b") == _BLAKE2B
+    assert checksums.remap(str.upper) == {"B": _BLAKE2B}
+
+
+def test_file_map_should_track_owners() -> None:
+    file_map = FileMap({"a": ["p1"]})
+
+    assert file_map.add_owner("b", "p1")
+    assert not file_map.add_owner("a", "p2")
+    assert file_map == {"a": ["p1", "p2"], "b": ["p1"]}
+    assert not file_map.remove_owner("a", "p1")
+    assert file_map.remove_owner("b", "p1")
+    assert file_map == {"a": ["p2"]}
+    assert file_map.remap(str.upper) == {"A": ["p2"]}
+
+
+def test_manifest_should_serialise_compact_maps() -> None:
+    manifest = Manifest(
+        packages={
+            "p": ManifestPackage(
+                version="1.0", options=["p.zip"], files=["a"], checksums={"a": _SHA256}
+            )
+        }
+    )
+
+    raw = json.loads(manifest.json())
+
+    assert raw["packages"]["p"]["checksums"] == {"a": _SHA256}
+    assert raw["file_map"] == {"a": ["p"]}
+    assert not [key for key in raw if key.startswith("_")]
+    assert isinstance(manifest.packages["p"].checksums, ChecksumMap)
+    assert Manifest.from_trusted(manifest.to_trusted()).dict() == manifest.dict()
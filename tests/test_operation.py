@@ -1,8 +1,14 @@
 import os
-from typing import Iterator, Union
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 import pytest
-from packman.utils.operation import Operation
+import requests
+from packman.api import client
+from packman.utils.download import DownloadLock, download_path, prune_downloads
+from packman.utils.journal import Durability
+from packman.utils.operation import Operation, OperationState
 
 
 class MockError(Exception):
@@ -277,3 +283,343 @@ def test_state_recovery(
     _assert_trees_equal(
         os.path.join(mock_path, root_path), os.path.join(mock_path, ends_like)
     )
+
+
+@pytest.mark.parametrize("data", [b"the data"])
+@pytest.mark.parametrize("durability", list(Durability))
+def test_state_journal_should_be_replayed_on_recovery(
+    file_paths: Iterator[str], data: bytes, durability: Durability
+) -> None:
+    src_path = next(file_paths)
+    dest_path = next(file_paths)
+    with open(src_path, "wb") as fp:
+        fp.write(data)
+
+    op = Operation(key="journal", durability=durability)
+    op.copy_file(src_path, dest_path)
+    assert op.state_path
+
+    # Simulate a crash part-way through writing the next record
+    with open(op.state_path, "ab") as fp:
+        fp.write(b'{"op": "new", "pa')
+
+    recovered = Operation.recover(key="journal")
+    assert recovered.new_paths == {
+        os.path.abspath(dest_path)
+    }, "recovered state should contain new paths"
+
+    _trigger_restore(recovered, use_context=False)
+    assert not os.path.exists(dest_path), "dest file should be deleted after restore"
+
+
+@pytest.mark.parametrize("count", [10])
+def test_state_journal_should_be_compacted(count: int) -> None:
+    op = Operation(key="compact", compact_threshold=4)
+    assert op.journal
+
+    paths = [op.get_temp_path() for _ in range(count)]
+    for path in paths[1:]:
+        op.remove_file(path)
+    assert op.journal.record_count <= 4, "journal should have been compacted"
+
+    state = OperationState.load(op.journal.path)
+    assert state.temp_paths == {os.path.abspath(paths[0])}
+    op.close()
+
+
+@pytest.mark.parametrize("data", [b"the data"])
+def test_staged_file_copy_should_survive_close(
+    file_paths: Iterator[str], data: bytes
+) -> None:
+    op = Operation()
+    staging_dir = op.get_temp_path()
+    src_path = os.path.join(staging_dir, "file")
+    os.makedirs(staging_dir)
+    with open(src_path, "wb") as fp:
+        fp.write(data)
+    dest_path = next(file_paths)
+    other_dest_path = next(file_paths)
+
+    op.copy_file(src_path, dest_path)
+    op.copy_file(src_path, other_dest_path)
+    assert not os.path.samefile(
+        dest_path, other_dest_path
+    ), "destinations should never share an inode"
+
+    op.close()
+    assert not os.path.exists(src_path), "staged file should be discarded on close"
+    for path in (dest_path, other_dest_path):
+        with open(path, "rb") as fp:
+            assert fp.read() == data, "dest file should have src contents"
+
+
+@pytest.mark.parametrize("count", [40])
+@pytest.mark.parametrize("max_workers", [1, 8])
+def test_restore_should_roll_back_many_files(
+    file_paths: Iterator[str], count: int, max_workers: int
+) -> None:
+    src_path = next(file_paths)
+    with open(src_path, "wb") as fp:
+        fp.write(b"new data")
+    dir = next(file_paths)
+    dest_paths = [os.path.join(dir, str(idx)) for idx in range(count)]
+    # Every other destination already exists and should be restored
+    for path in dest_paths[::2]:
+        os.makedirs(dir, exist_ok=True)
+        with open(path, "wb") as fp:
+            fp.write(b"old data")
+
+    progress: List[float] = []
+    op = Operation(max_workers=max_workers, on_restore_progress=progress.append)
+    for path in dest_paths:
+        op.copy_file(src_path, path)
+    op.abort()
+
+    for path in dest_paths[::2]:
+        with open(path, "rb") as fp:
+            assert fp.read() == b"old data", "file should contain original contents"
+    for path in dest_paths[1::2]:
+        assert not os.path.exists(path), "new file should be deleted after restore"
+    assert progress == sorted(progress), "progress should never go backwards"
+    assert progress[-1] == 1.0
+
+
+class MockResponse:
+    def __init__(
+        self, status_code: int, headers: Dict[str, str], body: bytes, fail_after: int
+    ) -> None:
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.body = body
+        self.fail_after = fail_after
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        for idx in range(0, len(self.body), chunk_size):
+            if idx >= self.fail_after:
+                raise requests.ConnectionError("connection reset")
+            yield self.body[idx : idx + chunk_size]
+
+
+class MockServer:
+    """
+    Serves a single file, optionally supporting range requests and dropping the connection part-way through.
+    """
+
+    def __init__(
+        self, data: bytes, supports_ranges: bool, fail_after: Optional[int] = None
+    ) -> None:
+        self.data = data
+        self.supports_ranges = supports_ranges
+        self.fail_after = fail_after
+        self.requests: List[Dict[str, str]] = []
+
+    def _get_headers(self) -> Dict[str, str]:
+        headers = {"ETag": '"v1"', "Content-Length": str(len(self.data))}
+        if self.supports_ranges:
+            headers["Accept-Ranges"] = "bytes"
+        return headers
+
+    def head(self, url: str, **kwargs: object) -> MockResponse:
+        return MockResponse(200, self._get_headers(), b"", 0)
+
+    def get(
+        self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs: object
+    ) -> MockResponse:
+        headers = headers or {}
+        self.requests.append(headers)
+        fail_after = len(self.data) if self.fail_after is None else self.fail_after
+        # Only the first request is interrupted
+        self.fail_after = None
+        response_headers = self._get_headers()
+        range = headers.get("Range")
+        if self.supports_ranges and range and headers.get("If-Range") == '"v1"':
+            start_str, end_str = range[len("bytes=") :].split("-")
+            start = int(start_str)
+            end = int(end_str) if end_str else len(self.data) - 1
+            body = self.data[start : end + 1]
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{len(self.data)}"
+            response_headers["Content-Length"] = str(len(body))
+            return MockResponse(206, response_headers, body, fail_after)
+        return MockResponse(200, response_headers, self.data, fail_after)
+
+
+@pytest.mark.parametrize("supports_ranges", [True, False])
+def test_download_should_resume_after_interruption(
+    monkeypatch: pytest.MonkeyPatch, supports_ranges: bool
+) -> None:
+    data = bytes(range(256)) * 64
+    server = MockServer(data, supports_ranges=supports_ranges, fail_after=4096)
+    monkeypatch.setattr(client, "get", server.get)
+
+    with Operation(request_chunk_size=1024) as op:
+        path = op.download_file("https://example.com/file.zip")
+        with open(path, "rb") as fp:
+            assert fp.read() == data, "download should be complete"
+
+    assert len(server.requests) == 2, "download should be retried once"
+    if supports_ranges:
+        assert server.requests[1]["Range"] == "bytes=4096-"
+
+
+def test_download_should_resume_in_later_operation(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    data = bytes(range(256)) * 64
+    server = MockServer(data, supports_ranges=True, fail_after=4096)
+    monkeypatch.setattr(client, "get", server.get)
+
+    op = Operation(request_chunk_size=1024, request_retries=0)
+    with pytest.raises(requests.ConnectionError):
+        op.download_file("https://example.com/file.zip")
+    # Simulate a crash by dropping the operation without closing it
+    op.journal.close()
+    op.state_path = None
+    op.journal = None
+    op.downloads = {}
+    del op
+
+    with Operation.recover() as recovered:
+        assert "https://example.com/file.zip" in recovered.downloads
+        recovered.abort()
+
+    with Operation(request_chunk_size=1024) as op:
+        path = op.download_file("https://example.com/file.zip")
+        with open(path, "rb") as fp:
+            assert fp.read() == data, "download should be complete"
+
+    assert server.requests[-1]["Range"] == "bytes=4096-"
+
+
+@pytest.mark.parametrize("supports_ranges", [True, False])
+def test_download_should_be_segmented_where_supported(
+    monkeypatch: pytest.MonkeyPatch, supports_ranges: bool
+) -> None:
+    data = bytes(range(256)) * 64
+    server = MockServer(data, supports_ranges=supports_ranges)
+    monkeypatch.setattr(client, "get", server.get)
+    monkeypatch.setattr(client, "head", server.head)
+
+    with Operation(
+        request_chunk_size=1000, download_segments=4, min_segment_size=1024
+    ) as op:
+        path = op.download_file("https://example.com/file.zip")
+        with open(path, "rb") as fp:
+            assert fp.read() == data, "download should be complete"
+
+    ranges = sorted(headers["Range"] for headers in server.requests if headers)
+    if supports_ranges:
+        assert ranges == [
+            "bytes=0-4095",
+            "bytes=12288-16383",
+            "bytes=4096-8191",
+            "bytes=8192-12287",
+        ]
+    else:
+        assert not ranges, "should fall back to a single stream"
+
+
+def test_segmented_download_should_resume_after_interruption(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    data = bytes(range(256)) * 64
+    server = MockServer(data, supports_ranges=True, fail_after=2000)
+    monkeypatch.setattr(client, "get", server.get)
+    monkeypatch.setattr(client, "head", server.head)
+    progress: List[float] = []
+
+    with Operation(
+        request_chunk_size=1000, download_segments=4, min_segment_size=1024
+    ) as op:
+        path = op.download_file(
+            "https://example.com/file.zip", on_progress=progress.append
+        )
+        with open(path, "rb") as fp:
+            assert fp.read() == data, "download should be complete"
+
+    assert len(server.requests) == 5, "only the interrupted segment should be retried"
+    assert progress[-1] == 1.0
+
+
+def test_download_should_not_share_partial_download_in_use(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    data = bytes(range(256)) * 64
+    server = MockServer(data, supports_ranges=True)
+    monkeypatch.setattr(client, "get", server.get)
+    url = "https://example.com/file.zip"
+    stable_path = download_path(url, ext=".zip")
+    # As if another operation were downloading the same URL
+    lock = DownloadLock.acquire(stable_path)
+    assert lock is not None
+
+    try:
+        with Operation(request_chunk_size=1024) as op:
+            path = op.download_file(url, ext=".zip")
+            with open(path, "rb") as fp:
+                assert fp.read() == data, "download should be complete"
+    finally:
+        lock.release()
+
+    assert not os.path.exists(stable_path)
+    assert not os.path.exists(f"{stable_path}.json")
+
+
+def test_download_should_close_unsatisfiable_range_response(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    data = bytes(range(256)) * 64
+    server = MockServer(data, supports_ranges=True, fail_after=4096)
+    responses: List[MockResponse] = []
+
+    def get(url: str, **kwargs: Any) -> MockResponse:
+        res = server.get(url, **kwargs)
+        if res.status_code == 206:
+            res = MockResponse(416, {}, b"", 0)
+        responses.append(res)
+        return res
+
+    monkeypatch.setattr(client, "get", get)
+
+    with Operation(request_chunk_size=1024) as op:
+        path = op.download_file("https://example.com/file.zip")
+        with open(path, "rb") as fp:
+            assert fp.read() == data, "download should be complete"
+
+    assert [res.status_code for res in responses] == [200, 416, 200]
+    assert responses[1].closed
+
+
+def test_prune_downloads_should_remove_only_abandoned_downloads() -> None:
+    old = time.time() - timedelta(days=30).total_seconds()
+    paths = {
+        name: download_path(f"https://example.com/{name}.zip", ext=".zip")
+        for name in ("abandoned", "recent", "locked")
+    }
+    for name, path in paths.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for file in (path, f"{path}.json"):
+            with open(file, "wb") as fp:
+                fp.write(b"partial")
+            if name != "recent":
+                os.utime(file, (old, old))
+    lock = DownloadLock.acquire(paths["locked"])
+    assert lock is not None
+    os.utime(f"{paths['locked']}.lock", (old, old))
+
+    try:
+        assert prune_downloads() == 1
+    finally:
+        lock.release()
+
+    assert not os.path.exists(paths["abandoned"])
+    assert not os.path.exists(f"{paths['abandoned']}.json")
+    assert os.path.exists(paths["recent"])
+    assert os.path.exists(paths["locked"])
@@ -0,0 +1,322 @@
+import hashlib
+import os
+import zipfile
+from typing import Dict, Iterator
+
+import pytest
+import requests
+from packman.api import client
+from packman.models.package_source import PackageVersion
+from packman.utils.archive import ArchiveIndex
+from packman.utils import cache as cache_module
+from packman.utils.cache import Cache, get_stats, prune
+from packman.utils.copy_strategy import CopyStrategy
+from packman.utils.operation import Operation
+from packman.utils.store import Store
+
+_SHARED = b"shared" * 1000
+
+
+def _create_dir(path: str, files: Dict[str, bytes]) -> None:
+    for name, data in files.items():
+        file = os.path.join(path, name)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, "wb") as fp:
+            fp.write(data)
+
+
+def _assert_files(path: str, files: Dict[str, bytes]) -> None:
+    for name, data in files.items():
+        with open(os.path.join(path, name), "rb") as fp:
+            assert fp.read() == data, f"{name} should be materialised"
+
+
+def _count_blobs(store: Store) -> int:
+    return sum(
+        len(files) for _, _, files in os.walk(os.path.join(store.path, "objects"))
+    )
+
+
+def test_store_should_keep_shared_files_once(file_paths: Iterator[str]) -> None:
+    store = Store(next(file_paths))
+    v1 = {"GameData/shared.dll": _SHARED, "GameData/v1.cfg": b"1"}
+    v2 = {"GameData/shared.dll": _SHARED, "GameData/v2.cfg": b"2"}
+    v1_path = next(file_paths)
+    v2_path = next(file_paths)
+    _create_dir(v1_path, v1)
+    _create_dir(v2_path, v2)
+
+    store.put_tree("v1", store.add_dir(v1_path))
+    store.put_tree("v2", store.add_dir(v2_path))
+
+    assert _count_blobs(store) == 3
+    for key, files in (("v1", v1), ("v2", v2)):
+        tree = store.get_tree(key)
+        assert tree is not None
+        dest = next(file_paths)
+        store.materialise(tree, dest)
+        _assert_files(dest, files)
+
+
+def test_store_should_collect_only_unreferenced_blobs(
+    file_paths: Iterator[str],
+) -> None:
+    store = Store(next(file_paths))
+    v1_path = next(file_paths)
+    v2_path = next(file_paths)
+    _create_dir(v1_path, {"shared.dll": _SHARED, "v1.cfg": b"1"})
+    _create_dir(v2_path, {"shared.dll": _SHARED, "v2.cfg": b"2"})
+    store.put_tree("v1", store.add_dir(v1_path))
+    store.put_tree("v2", store.add_dir(v2_path))
+
+    assert store.remove_tree("v1")
+    count, size = store.collect_garbage()
+
+    assert (count, size) == (1, 1)
+    assert _count_blobs(store) == 2
+    tree = store.get_tree("v2")
+    assert tree is not None
+    dest = next(file_paths)
+    store.materialise(tree, dest)
+    _assert_files(dest, {"shared.dll": _SHARED, "v2.cfg": b"2"})
+
+
+def test_store_should_track_its_size_without_walking_blobs(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    store = Store(next(file_paths))
+    v1_path = next(file_paths)
+    v2_path = next(file_paths)
+    _create_dir(v1_path, {"shared.dll": _SHARED, "v1.cfg": b"1"})
+    _create_dir(v2_path, {"shared.dll": _SHARED, "v2.cfg": b"2"})
+    store.put_tree("v1", store.add_dir(v1_path))
+    store.put_tree("v2", store.add_dir(v2_path))
+
+    def walk_blobs() -> None:
+        raise AssertionError("store was walked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "_iter_blobs", walk_blobs)
+        assert store.size() == len(_SHARED) + 2
+        store.remove_tree("v1")
+        assert store.size() == len(_SHARED) + 1
+
+    # Remeasured from scratch if lost
+    os.remove(os.path.join(store.path, "size.json"))
+    assert store.size() == len(_SHARED) + 1
+
+
+def test_store_should_address_archive_members_by_content(
+    file_paths: Iterator[str],
+) -> None:
+    store = Store(next(file_paths))
+    files = {"GameData/a.cfg": b"a", "GameData/Plugins/b.dll": _SHARED}
+    dir_path = next(file_paths)
+    _create_dir(dir_path, files)
+    zip_path = next(file_paths)
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+
+    with ArchiveIndex(zip_path) as archive:
+        archive_tree = store.add_archive(archive)
+    dir_tree = store.add_dir(dir_path)
+
+    assert archive_tree.files == dir_tree.files
+    assert _count_blobs(store) == 2
+
+
+def test_cache_hit_should_not_link_store_files_onwards(
+    file_paths: Iterator[str],
+) -> None:
+    package_path = next(file_paths)
+    _create_dir(package_path, {"GameData/a.cfg": b"a"})
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    version_info = PackageVersion(
+        name="package", version="1.0", options=["package.zip"]
+    )
+    cache.add_package(version_info=version_info, package_path=package_path)
+
+    dest = os.path.join(next(file_paths), "a.cfg")
+    os.makedirs(os.path.dirname(dest))
+    with Operation() as op:
+        cache.fetch_version(version="1.0", option="package.zip", operation=op)
+        assert op.last_path is not None
+        src = os.path.join(op.last_path, "GameData", "a.cfg")
+        strategy = op.copy_file(src, dest)
+
+    assert strategy != CopyStrategy.HARDLINK
+    with open(dest, "rb") as fp:
+        assert fp.read() == b"a"
+
+
+class MockResponse:
+    def __init__(self, body: bytes) -> None:
+        self.status_code = 200
+        self.headers = requests.structures.CaseInsensitiveDict(
+            {"Content-Length": str(len(body)), "ETag": '"v1"'}
+        )
+        self.body = body
+
+    def raise_for_status(self) -> None:
+        return
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        for idx in range(0, len(self.body), chunk_size):
+            yield self.body[idx : idx + chunk_size]
+
+
+@pytest.mark.parametrize("stream_archives", [True, False])
+def test_cache_should_keep_downloaded_archive_whole(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch, stream_archives: bool
+) -> None:
+    files = {"GameData/a.cfg": b"a", "GameData/Plugins/b.dll": _SHARED}
+    zip_path = next(file_paths)
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    with open(zip_path, "rb") as fp:
+        data = fp.read()
+    monkeypatch.setattr(client, "get", lambda url, **kwargs: MockResponse(data))
+
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    version_info = PackageVersion(
+        name="package", version="1.0", options=["package.zip"]
+    )
+    with Operation(stream_archives=stream_archives) as op:
+        archive_path = op.download_file("https://example.com/package.zip")
+        package_path = op.unpack_archive(archive_path)
+        cache.add_package(
+            version_info=version_info, package_path=package_path, operation=op
+        )
+
+    tree = cache.store.get_tree(Store.tree_key("package", "1.0", "package.zip"))
+    assert tree is not None
+    assert tree.archive == hashlib.sha256(data).hexdigest()
+    assert tree.source is not None
+    assert tree.source.url == "https://example.com/package.zip"
+    assert tree.source.etag == '"v1"'
+    assert not tree.files
+
+    with Operation() as op:
+        cache.fetch_version(version="1.0", option="package.zip", operation=op)
+        assert op.last_path is not None
+        _assert_files(op.last_path, files)
+
+
+def test_cache_should_discard_corrupt_archive(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    zip_path = next(file_paths)
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("a.cfg", b"a")
+    with open(zip_path, "rb") as fp:
+        data = fp.read()
+    monkeypatch.setattr(client, "get", lambda url, **kwargs: MockResponse(data))
+
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    version_info = PackageVersion(
+        name="package", version="1.0", options=["package.zip"]
+    )
+    with Operation() as op:
+        archive_path = op.download_file("https://example.com/package.zip")
+        package_path = op.unpack_archive(archive_path)
+        cache.add_package(
+            version_info=version_info, package_path=package_path, operation=op
+        )
+    key = Store.tree_key("package", "1.0", "package.zip")
+    tree = cache.store.get_tree(key)
+    assert tree is not None and tree.archive is not None
+    with open(cache.store.blob_path(tree.archive), "ab") as fp:
+        fp.write(b"corrupt")
+
+    with Operation() as op:
+        with pytest.raises(Exception):
+            cache.fetch_version(version="1.0", option="package.zip", operation=op)
+
+    assert cache.store.get_tree(key) is None
+
+
+def _add_versions(cache: Cache, file_paths: Iterator[str], *versions: str) -> None:
+    for idx, version in enumerate(versions):
+        package_path = next(file_paths)
+        _create_dir(package_path, {"a.cfg": bytes([idx]) * 1000})
+        version_info = PackageVersion(
+            name=cache.name, version=version, options=["package.zip"]
+        )
+        cache.add_package(version_info=version_info, package_path=package_path)
+
+
+def test_prune_should_evict_least_recently_used_packages(
+    file_paths: Iterator[str],
+) -> None:
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    _add_versions(cache, file_paths, "1.0", "2.0", "3.0")
+    with Operation() as op:
+        cache.fetch_version(version="1.0", option="package.zip", operation=op)
+
+    count, freed = prune(cache.store, max_size=2000)
+
+    assert (count, freed) == (1, 1000)
+    assert cache.store.size() == 2000
+    for version, cached in (("1.0", True), ("2.0", False), ("3.0", True)):
+        key = Store.tree_key("package", version, "package.zip")
+        assert (cache.store.get_tree(key) is not None) == cached
+
+
+def test_prune_should_not_evict_packages_in_use(file_paths: Iterator[str]) -> None:
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    _add_versions(cache, file_paths, "1.0", "2.0")
+
+    with Operation() as op:
+        for version in ("1.0", "2.0"):
+            cache.fetch_version(version=version, option="package.zip", operation=op)
+        assert prune(cache.store, max_size=0) == (0, 0)
+        assert len(cache.store.keys()) == 2
+
+    # Released once the operation using them is closed
+    assert prune(cache.store, max_size=0) == (2, 2000)
+    assert cache.store.keys() == []
+
+
+def test_cache_should_count_hits_and_misses(file_paths: Iterator[str]) -> None:
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    _add_versions(cache, file_paths, "1.0")
+
+    with Operation() as op:
+        with pytest.raises(Exception):
+            cache.fetch_version(version="2.0", option="package.zip", operation=op)
+    for _ in range(2):
+        with Operation() as op:
+            cache.fetch_version(version="1.0", option="package.zip", operation=op)
+
+    stats = get_stats(cache.store)
+    assert (stats.entry_count, stats.size) == (1, 1000)
+    assert (stats.hits, stats.misses) == (2, 1)
+    index = cache_module.load_index(cache.store)
+    assert index.entries[Store.tree_key("package", "1.0", "package.zip")].hits == 2
+
+
+def test_cache_should_write_index_once_operation_is_closed(
+    file_paths: Iterator[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = Cache(name="package", store=Store(next(file_paths)))
+    _add_versions(cache, file_paths, "1.0")
+    saves = 0
+    save_index = cache_module._save_index
+
+    def counting_save_index(store: Store, index: cache_module.CacheIndex) -> None:
+        nonlocal saves
+        saves += 1
+        save_index(store, index)
+
+    monkeypatch.setattr(cache_module, "_save_index", counting_save_index)
+
+    with Operation() as op:
+        for _ in range(3):
+            cache.fetch_version(version="1.0", option="package.zip", operation=op)
+        assert saves == 0
+        assert cache_module.load_index(cache.store).hits == 0
+
+    assert saves == 1
+    assert cache_module.load_index(cache.store).hits == 3